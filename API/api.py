@@ -1,21 +1,67 @@
-from quart import Quart, request, jsonify
+from quart import Quart, Response, request, jsonify
 import pickle
 import base64
 import websockets
 import asyncio
 import time
 import json
+import uuid
+import random
+import copy
+import collections
+import hashlib
+from pyarc import CBA
+from pyarc.algorithms import (RuleCountAggregate, scale_rule_counts, apply_model_delta, delta_digests,
+                              compress_payload, decompress_payload, negotiate_codec, iter_chunks,
+                              COMPRESSION_CODECS, ModelStore)
 
 app = Quart(__name__)
 
 # ------------------ #
 # GLOBAL DEĞİŞKENLER #
 # ------------------ #
-models = []             # İstemcilerden gelen modeller
 global_model = None     # Birleştirilmiş, güncel model
 version = 0             # Modelin mevcut versiyonu
 models_count = 2        # Kaç model geldikten sonra sunucuya göndereceğini belirler
 
+# Tur zamanlayıcı: tur ilk model geldikten round_deadline saniye sonra, models_count'a ulaşılmasa da
+# yeter sayı (quorum) sağlandıysa o ana kadar gelen modellerle kapanır; yavaş/çökmüş istemci turu bekletmez
+round_deadline = None   # sn, None: tur sadece models_count modelle kapanır (zamanlayıcı kapalı)
+quorum_clients = None   # Süre dolunca turun kapanması için gereken en az model sayısı (None: en az bir model)
+quorum_fraction = 0.0   # ... ve gelen veri boyutunun (size) bilinen istemcilerin toplam verisine oranı
+# Geç gelen (önceki turun versiyonuyla eğitilmiş) modeller:
+#   "drop": atılır, "fold": bu tura staleness_decay ** (kaç tur geç) ile küçültülmüş veri boyutu ve kural
+#           sayımlarıyla eklenir
+late_policy = "fold"
+staleness_decay = 0.5
+client_stats = {}       # İstemci id'si -> {'size': veri boyutu, 'time': eğitim süresi geçmişinin üstel ortalaması}
+
+# İstemci seçimi: her turda clients_per_round istemci selection_policy ile seçilir, diğerleri turu atlar
+selection_policy = None   # None: herkes katılır, "random", "size" (veri boyutuyla ağırlıklı) veya "fastest"
+clients_per_round = None  # K; None ise veya bilinen istemci sayısından büyükse herkes seçilir
+time_smoothing = 0.5      # Yeni eğitim süresinin geçmiş ortalamadaki ağırlığı
+
+# Federasyon modu:
+#   "sync": Modeller turlar halinde toplanır (models_count, round_deadline, yeter sayı, istemci seçimi)
+#   "async": Tur yoktur; her model geldiği anda tek başına sunucuya gönderilir ve hemen yeni versiyon yayımlanır.
+#            Sunucu modelin veri boyutunu, birleştirme anında kaç versiyon eski bir modelle eğitildiyse
+#            staleness_decay ** (versiyon farkı) ile küçültür; hızlı istemciler yavaşları beklemez
+federation_mode = "sync"
+
+# Birleştirme modu:
+#   "buffer": Modeller tur sonuna kadar saklanır ve hepsi birden gönderilir
+#   "stream": Her model geldiği anda kısmi istatistiğe eklenip atılır, tur sonunda sadece bu istatistik gönderilir
+#   "passthrough": Modeller çözülmeden, istemciden geldiği (sıkıştırılmış ikili) haliyle saklanır ve tur sonunda
+#                  her biri ayrı bir mesajla sunucuya iletilir; modeller sadece birleştirmenin yapıldığı sunucuda çözülür
+aggregation_mode = "buffer"
+
+# Sunucuya WebSocket ile gönderilen modellerin sıkıştırılması ("zlib", "lzma", "zstd" veya "none")
+compression = "zlib"
+compression_level = None  # None: codec'in varsayılan seviyesi
+
+server_url = "ws://localhost:7896"  # Ana sunucu ile kalıcı WebSocket kanalı
+send_attempts = 3                   # Kanal koparsa tur modellerinin kaç kez gönderilmeye çalışılacağı
+
 # Model eğitimi/feature seçimi ayarları
 sup = 0.2
 conf = 0.5
@@ -29,36 +75,611 @@ feature_selection = {
 }
 dataset = "_heart_part_"
 target_col = "HeartDisease"
-lock = asyncio.Lock()   # Eşzamanlı erişim için kilit
+# Yeni global model kaydedildiğinde set edilip yenisiyle değiştirilir; /get_model?wait=... bekleyenleri uyandırır
+model_event = asyncio.Event()
+long_poll_max = 50      # Bir long-poll isteğinin en fazla bekleme süresi (sn), Quart'ın cevap zaman aşımının altında
+# İstemcilere gönderilen model gövdeleri: (versiyon, codec, seviye, json) -> (gövde, ETag) üreten Future.
+# ETag modelin içeriğinden (ikili formatın hash'i) ve codec/seviye/biçimden üretilir, versiyondan değil
+model_cache = collections.OrderedDict()
+model_cache_size = 8    # Önbellekte tutulacak en fazla gövde sayısı (en eski kullanılan atılır)
+# Devam ettirilebilir model yüklemeleri: upload_id -> başlatma header'ları, toplam boyut, gelen veri, hash
+uploads = {}
+upload_chunk_size = 256 * 1024  # İstemciye önerilen parça boyutu (bayt)
+upload_ttl = 3600               # Bu kadar saniye güncellenmeyen yüklemeler silinir
 tours = []              # Tur kayıtları
+# Delta yüklemelerini açan istemcilerin (X-Model-Digest gönderenlerin) id'si -> son gönderdiği model ve hash'i;
+# istemcinin delta'ları buna göre uygulanır. Tam modeller çözülmeden (sıkıştırılmış gövdesiyle) saklanır,
+# delta gelirse çözülür. İstemci /leave ile ayrılınca veya client_model_ttl boyunca model göndermezse silinir
+client_models = {}
+client_model_ttl = 3600
+# Global model versiyonları diske yazılır (API yeniden başlatılınca geçmiş versiyonlar kaybolmaz)
+model_store = ModelStore("model_store", CBA)
+store_lock = asyncio.Lock()  # Depoya yazmalar sırayla yapılır
+
+# ----------------------------------------- #
+# Sunucu ile kalıcı WebSocket kanalı
+# ----------------------------------------- #
+class ServerChannel:
+    """
+    Ana sunucu ile tek, kalıcı ve çift yönlü WebSocket oturumu.
+    Her isteğe bir mesaj id'si verilir, sunucunun cevabı reply_to alanıyla eşleştirilir;
+    böylece aynı bağlantı üzerinden birden çok istek aynı anda bekleyebilir.
+    Sunucunun kendiliğinden gönderdiği mesajlar (birleştirilen model) handlers ile işlenir.
+    Bağlantı koparsa bekleyen istekler hata alır ve artan aralıklarla yeniden bağlanılır.
+    """
+    def __init__(self, url, handlers, on_connect=None, max_backoff=30):
+        self.url = url
+        self.handlers = handlers        # Mesaj tipi -> async fonksiyon(mesaj), dönen değer cevap olarak gönderilir
+        self.on_connect = on_connect    # Her (yeniden) bağlanmada çağrılır
+        self.max_backoff = max_backoff
+        self.websocket = None
+        self.connected = asyncio.Event()
+        self.pending = {}               # Mesaj id'si -> cevabı bekleyen Future
+        self.next_id = 1
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        """Bağlantıyı açık tutar, koparsa yeniden bağlanır."""
+        backoff = 1
+        while True:
+            try:
+                async with websockets.connect(self.url, max_size=None) as websocket:
+                    self.websocket = websocket
+                    self.connected.set()
+                    backoff = 1
+                    print("Sunucu ile WebSocket kanalı açıldı.")
+                    if self.on_connect is not None:
+                        asyncio.create_task(self.on_connect())
+                    async for message in websocket:
+                        self.dispatch(pickle.loads(message))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Sunucu kanalı koptu: {e}. {backoff} sn sonra yeniden bağlanılacak.")
+            finally:
+                self.connected.clear()
+                self.websocket = None
+                for future in self.pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("Sunucu bağlantısı koptu"))
+                self.pending.clear()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def dispatch(self, message):
+        """Cevapları bekleyen isteğe iletir, diğer mesajlar için handler çalıştırır."""
+        if 'reply_to' in message:
+            future = self.pending.pop(message['reply_to'], None)
+            if future is not None and not future.done():
+                future.set_result(message)
+        elif message.get('type') in self.handlers:
+            asyncio.create_task(self.handle(message))
+
+    async def handle(self, message):
+        try:
+            reply = await self.handlers[message['type']](message)
+            reply = {'status': 'ok', **(reply or {})}
+        except Exception as e:
+            print(f"Sunucu mesajı işlenirken hata oluştu: {e}")
+            reply = {'status': 'error', 'error': str(e)}
+        if message.get('id') is not None and self.websocket is not None:
+            await self.websocket.send(pickle.dumps({**reply, 'reply_to': message['id']}))
+
+    async def send(self, message):
+        """Cevap beklenmeyen mesajı gönderir."""
+        await self.connected.wait()
+        try:
+            await self.websocket.send(pickle.dumps(message))
+        except websockets.exceptions.ConnectionClosed as e:
+            raise ConnectionError(f"Sunucu bağlantısı koptu: {e}")
+
+    async def request(self, message, timeout=None):
+        """Mesajı gönderir ve cevabını bekler."""
+        await self.connected.wait()
+        message_id = self.next_id
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message_id] = future
+        try:
+            await self.websocket.send(pickle.dumps({**message, 'id': message_id}))
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(message_id, None)
+
+# ----------------------------------------- #
+# Açık turun durumu
+# ----------------------------------------- #
+class RoundState:
+    """
+    Bir turun gelen modelleri, stream modundaki kısmi istatistiği, süresi ve katılımcıları.
+    Modeller istemci id'sine göre bir sözlükte tutulur, tekrar kontrolü O(1)'dir; kabul edilen her modele
+    turda artan bir sıra numarası (seq) verilir. submit ve close await içermez: event loop'ta bölünmeden
+    çalıştıkları için yeter sayı sınırında aynı anda gelen modeller kaybolmaz, iki kez sayılmaz
+    ve kapanmış bir tura eklenmez (kilit gerekmez).
+    """
+    def __init__(self, number=1, base_version=0, participants=None):
+        self.number = number                # Turun sıra numarası
+        self.base_version = base_version    # Modellerin eğitilmiş olması beklenen global versiyon
+        self.participants = participants    # Seçilen istemci id'leri (None: herkes)
+        self.models = {}                    # İstemci id'si -> model ve bilgileri, geliş sırasıyla
+        self.aggregate = None               # Stream modunda kısmi kural istatistiği (RuleCountAggregate)
+        self.template = None                # Stream modunda kuralları boşaltılmış ilk model (global model kabuğu)
+        self.opened = None                  # İlk modelin geldiği an (time.monotonic), tur boşsa None
+        self.timer = None                   # Süre görevi
+        self.expired = False                # Süresi doldu mu (yeter sayı sağlanınca hemen kapanır)
+        self.closed = False
+        self.next_seq = 1
+
+    def __len__(self):
+        return len(self.models)
+
+    def __contains__(self, client_id):
+        return client_id in self.models
+
+    def entries(self):
+        """Modeller, sıra numarasına (geliş sırasına) göre."""
+        return list(self.models.values())
+
+    def submit(self, entry, aggregate=None, template=None):
+        """
+        Modeli (stream modunda istatistiğini) tura ekler ve sıra numarasını döndürür.
+        Tur kapanmışsa veya istemcinin bu turda modeli varsa None döner, tur değişmez.
+        """
+        if self.closed or entry['id'] in self.models:
+            return None
+        if aggregate is not None:
+            if self.aggregate is None:
+                self.aggregate = aggregate
+                template.clf.rules = []
+                self.template = template
+            else:
+                self.aggregate.update(aggregate)
+
+        entry['seq'] = self.next_seq
+        self.next_seq += 1
+        self.models[entry['id']] = entry
+        if self.opened is None:
+            self.opened = time.monotonic()
+        return entry['seq']
+
+    def close(self):
+        """Turu kapatır (sonraki submit'ler reddedilir), süre görevini iptal eder ve süresini döndürür."""
+        self.closed = True
+        if self.timer is not None:
+            self.timer.cancel()
+        return time.monotonic() - self.opened
+
+current_round = RoundState()  # Açık tur, kapanınca yenisiyle değiştirilir
 
 # ----------------------------------------- #
 # Sunucuya WebSocket ile model gönderme fonksiyonu
 # ----------------------------------------- #
-async def send_models_via_websocket():
+async def send_models_via_websocket(closed_round):
     """
-    models listesini sunucuya WebSocket üzerinden gönderir.
-    Gönderimden sonra models listesi sıfırlanır.
+    Kapanan turun (RoundState) modellerini kalıcı kanal üzerinden sunucuya gönderir.
+    Açık tur close_round'da yenisiyle değiştirilir. Kanal koparsa yeniden bağlanınca tekrar denenir.
+    stream modunda turun kısmi istatistiği ve model kabuğu gönderilir.
+    passthrough modunda istemcilerin gövdeleri olduğu gibi, her model ayrı bir "model_part" mesajıyla
+    gönderilir; ardından gelen "models" mesajı sunucunun parçaları birleştirmesini ister.
     """
+    round_models = closed_round.entries()
     try:
-        global models, version
-
+        # round_id ile sunucu, bağlantı kopup tekrar gönderilen turu iki kez birleştirmez
+        round_id = uuid.uuid4().hex
         data = {
-            'first': False,
-            'models': models
+            'models': round_models,
+            'format': 'binary'
         }
-        send_data = pickle.dumps(data)
-        models = []  # Model listesi sıfırlanıyor
+        if federation_mode == "async":
+            # Sunucu eski modelleri birleştirme anındaki versiyona göre küçültür
+            data['staleness_decay'] = staleness_decay
+        if aggregation_mode == "passthrough":
+            parts = await asyncio.to_thread(model_parts, round_models)
+            messages = [{'type': 'model_part', 'round_id': round_id, 'index': index, **part}
+                        for index, part in enumerate(parts)]
+            messages.append({'type': 'models', 'round_id': round_id, 'format': 'parts', 'parts': len(parts)})
+            if federation_mode == "async":
+                messages[-1]['staleness_decay'] = staleness_decay
+            print(f"Sunucuya {len(parts)} model çözülmeden iletiliyor "
+                  f"({sum(len(part['payload']) for part in parts)} bayt).")
+        elif aggregation_mode == "stream" and closed_round.aggregate is not None:
+            # models sadece istemci bilgilerini içerir, kurallar kısmi istatistikte
+            data['aggregate'] = closed_round.aggregate
+            data['template'] = closed_round.template
+        else:
+            # Modeller sütunlu ikili formatta gönderilir, çevirme event loop dışında yapılır
+            data['models'] = await asyncio.to_thread(
+                lambda: [{**m, 'model': m['model'].to_bytes()} for m in round_models])
 
-        # Modeli WebSocket ile ana sunucuya gönder
-        async with websockets.connect("ws://localhost:7896") as ws:
-            await ws.send(send_data)
-            print("Modeller gönderildi.")
-            await ws.close()
+        if aggregation_mode != "passthrough":
+            # Mesaj sıkıştırılıp codec bilgisiyle birlikte gönderilir
+            payload, stats = await asyncio.to_thread(
+                lambda: compress_payload(pickle.dumps(data), compression, compression_level))
+            print_transfer("Sunucuya gönderilen modeller", stats)
+            messages = [{'type': 'models', 'round_id': round_id, 'compression': compression, 'payload': payload}]
+
+        for attempt in range(1, send_attempts + 1):
+            try:
+                for message in messages[:-1]:
+                    await server_channel.send(message)
+                reply = await server_channel.request(messages[-1])
+                break
+            except ConnectionError as e:
+                print(f"Modeller gönderilemedi ({attempt}/{send_attempts}): {e}")
+        else:
+            return
+
+        if reply.get('status') == 'queued':
+            # Sunucu birleştirmeyi arka planda yapar, yeni model bitince kanaldan gelir
+            print(f"Modeller gönderildi, sunucuda birleştirme işi {reply['id']} durumu: {reply['state']}")
+        elif reply.get('status') == 'ok':
+            print(f"Modeller gönderildi, sunucudaki yeni versiyon: {reply['version']}")
+        else:
+            print(f"Sunucu modelleri birleştiremedi: {reply.get('error')}")
 
     except Exception as e:
         print(f"WebSocket gönderimi sırasında hata oluştu: {e}")
 
+def quorum_met():
+    """Açık turda yeter sayıda model (ve veri) olup olmadığını döndürür."""
+    if not current_round or (quorum_clients is not None and len(current_round) < quorum_clients):
+        return False
+    if quorum_fraction:
+        pool = client_stats if current_round.participants is None else current_round.participants
+        known = sum(client_stats[client_id]['size'] or 0 for client_id in pool)
+        arrived = sum(client_stats[client_id]['size'] for client_id in current_round.models)
+        return known > 0 and arrived >= quorum_fraction * known
+    return True
+
+def round_target():
+    """Turun beklemeden kapanması için gereken model sayısı (seçim varsa seçilen istemci sayısı)."""
+    return models_count if current_round.participants is None else len(current_round.participants)
+
+def record_client(client_id, size, train_time):
+    """İstemcinin veri boyutunu ve eğitim süresi ortalamasını günceller."""
+    stats = client_stats.setdefault(client_id, {'size': None, 'time': None})
+    stats['size'] = size
+    if stats['time'] is None:
+        stats['time'] = train_time
+    else:
+        stats['time'] = time_smoothing * train_time + (1 - time_smoothing) * stats['time']
+
+def select_random(candidates, k):
+    """k istemciyi eşit olasılıkla seçer."""
+    return random.sample(candidates, k)
+
+def select_by_size(candidates, k):
+    """k istemciyi veri boyutuyla orantılı olasılıkla (tekrarsız) seçer; boyutu bilinmeyenlerin ağırlığı 1'dir."""
+    pool = list(candidates)
+    selected = []
+    while len(selected) < k:
+        client_id = random.choices(pool, weights=[client_stats[c]['size'] or 1 for c in pool])[0]
+        pool.remove(client_id)
+        selected.append(client_id)
+    return selected
+
+def select_fastest(candidates, k):
+    """Eğitim süresi ortalaması en kısa k istemciyi seçer; süresi bilinmeyenler (yeni istemciler) önce denenir."""
+    return sorted(candidates, key=lambda c: client_stats[c]['time'] or 0)[:k]
+
+# Seçim politikası adı -> fonksiyon(aday id'leri, k), yeni politika buraya eklenir
+SELECTION_POLICIES = {
+    "random": select_random,
+    "size": select_by_size,
+    "fastest": select_fastest
+}
+
+def select_participants():
+    """
+    Sonraki turun katılımcılarını selection_policy ile seçer. Seçim kapalıysa veya bilinen
+    istemci sayısı clients_per_round'u geçmiyorsa (veya asenkron modda) herkes katılır (None).
+    """
+    candidates = list(client_stats)
+    if federation_mode == "async" or selection_policy is None or clients_per_round is None or len(candidates) <= clients_per_round:
+        return None
+    selected = set(SELECTION_POLICIES[selection_policy](candidates, clients_per_round))
+    print(f"Sonraki tur için seçilen istemciler ({selection_policy}): {sorted(selected)}")
+    return selected
+
+async def expire_round(state):
+    """
+    round_deadline dolunca tur (state) hâlâ açıksa, yeter sayı sağlandıysa gelen modellerle kapatır.
+    Sağlanmadıysa tur, yeter sayıya ulaşan ilk modelde kapanır.
+    """
+    await asyncio.sleep(round_deadline)
+    if state is not current_round or state.closed:
+        return
+    state.expired = True
+    if quorum_met():
+        close_round(f"süre doldu ({round_deadline} sn), {len(state)}/{round_target()} model")
+    else:
+        print(f"Tur süresi doldu, yeter sayı bekleniyor ({len(state)}/{quorum_clients or 1} model).")
+
+def close_round(reason):
+    """
+    Açık turu kapatıp yerine yeni bir tur açar, kapanan turun sunucuya gönderimini başlatır ve
+    tur bilgilerini kaydeder. Yeni turun beklenen versiyonu kurulu global modelin versiyonudur;
+    sunucunun birleştirdiği model kurulunca (install_global_model) ilerler, birleştirme başarısız olursa
+    gelen modeller geç sayılmaz.
+    Kapatma ve yeni turun açılması arasında await olmadığından gelen her model ya kapanan turda
+    ya da yeni turdadır.
+    """
+    global current_round
+
+    closed_round = current_round
+    latency = closed_round.close()
+    current_round = RoundState(closed_round.number + 1, max(closed_round.base_version, version))
+    current_round.participants = select_participants()
+
+    print(f"Tur {closed_round.number} kapandı: {reason}. {latency:.1f} sn sürdü, sunucuya gönderiliyor.")
+    asyncio.create_task(send_models_via_websocket(closed_round))
+
+    # Tur bilgilerini kaydet
+    regular_data = [{'seq': i['seq'], 'size': i['size'], 'time': i['time'], 'staleness': i['staleness']}
+                    for i in closed_round.entries()]
+    tours.append({
+        "tour": closed_round.base_version,
+        'round': closed_round.number,
+        'latency': latency,
+        'info': regular_data
+    })
+    json_data = {
+        'sup': sup,
+        'conf': conf,
+        'tour': tour,
+        'count': models_count,
+        'tours': tours
+    }
+    # JSON'a yaz
+    with open("models.json", "w", encoding="utf-8") as json_file:
+        json.dump(json_data, json_file, ensure_ascii=False, indent=4)
+
+def model_parts(round_models):
+    """
+    passthrough modunda turun modellerini sunucuya gönderilecek parçalara çevirir.
+    İstemciden gelen gövde olduğu gibi kullanılır; sadece API'de çözülmek zorunda olan
+    (delta'dan oluşturulan) modeller ikili formata çevrilip sıkıştırılır.
+    """
+    parts = []
+    for entry in round_models:
+        info = {key: entry[key] for key in ('version', 'size', 'time', 'id')}
+        if 'weight' in entry:
+            info['weight'] = entry['weight']
+        if 'payload' in entry:
+            parts.append({'info': info, 'compression': entry['compression'], 'payload': entry['payload']})
+        else:
+            payload, _ = compress_payload(entry['model'].to_bytes(), compression, compression_level)
+            parts.append({'info': info, 'compression': compression, 'payload': payload})
+    return parts
+
+async def receive_federated_model(message):
+    """
+    Sunucunun kanal üzerinden gönderdiği birleştirilmiş modeli alır ve kaydeder.
+    """
+    def decode():
+        model_data, stats = decompress_payload(message['payload'], message['compression'])
+        return CBA.from_bytes(model_data), stats
+
+    if message['version'] <= version:
+        return {'version': version}
+    model, stats = await asyncio.to_thread(decode)
+    print_transfer("Sunucudan gelen model", stats)
+    await install_global_model(model, message['version'])
+    return {'version': version}
+
+async def request_initial_model():
+    """
+    Kanal her açıldığında sunucudaki güncel modeli ister (API sonradan başlatıldıysa veya bağlantı koptuysa).
+    """
+    try:
+        reply = await server_channel.request({'type': 'hello'})
+        if reply['version'] > 0:
+            await receive_federated_model(reply)
+        print(f"Sunucudaki model versiyonu: {reply['version']}")
+    except Exception as e:
+        print(f"WebSocket ile ilk model çekilirken hata: {e}")
+
+async def install_global_model(model, model_version):
+    """
+    Yeni global modeli bellekte günceller ve model deposuna kaydeder
+    (önceki versiyona göre değişen kurallar delta kaydı olarak, belirli aralıklarla snapshot).
+    Bellekteki model await olmadan değişir ve bekleyen istemciler hemen uyandırılır;
+    depoya yazma event loop dışında, store_lock ile sırayla yapılır.
+    """
+    global global_model, version, model_event
+
+    global_model = model
+    version = model_version
+    # Açık turun beklenen versiyonu kurulan modelle ilerler (başka API'lerin turlarıyla da ilerlemiş olabilir)
+    current_round.base_version = max(current_round.base_version, version)
+
+    # Eski versiyonların gövdeleri artık istenmez; yeni versiyon varsayılan codec ile önceden kodlanır
+    for key in [key for key in model_cache if key[0] < version]:
+        del model_cache[key]
+    asyncio.ensure_future(model_body(model, version, compression))
+
+    # Long-poll ile bekleyen istemcileri uyandır, sonraki bekleyenler yeni Event'i bekler
+    model_event.set()
+    model_event = asyncio.Event()
+
+    print(f"Yeni global model kaydedildi. Versiyon: {version}")
+
+    async with store_lock:
+        # Bu arada daha yeni bir versiyon yazılmış olabilir
+        if model_version > model_store.version:
+            stats = await asyncio.to_thread(model_store.save, model, model_version)
+            print(f"Model depoya yazıldı: {stats['kind']}, {stats['bytes']} bayt, {stats['time']:.4f} sn")
+
+server_channel = ServerChannel(server_url, {'model': receive_federated_model}, on_connect=request_initial_model)
+
+async def model_body(model, model_version, codec=None, level=None, as_json=False):
+    """
+    Global modelin istemciye gönderilecek gövdesini (ham/sıkıştırılmış ikili veya base64'lü JSON) ve
+    ETag'ini döndürür. İçeriği aynı olan versiyonların ETag'i de aynıdır. Her versiyon, codec, seviye ve biçim için bir kere kodlanıp model_cache'te tutulur;
+    aynı versiyonun tekrar indirilmesi soket yazması dışında işlem gerektirmez.
+    Aynı anda gelen istekler aynı kodlamayı bekler, iş iki kere yapılmaz.
+    """
+    key = (model_version, codec, level, as_json)
+    if key not in model_cache:
+        model_cache[key] = asyncio.ensure_future(encode_model_body(model, model_version, codec, level, as_json))
+        while len(model_cache) > model_cache_size:
+            model_cache.popitem(last=False)
+    model_cache.move_to_end(key)
+
+    future = model_cache[key]
+    try:
+        # İstemci bağlantıyı kapatırsa diğer bekleyenler için kodlama iptal edilmez
+        return await asyncio.shield(future)
+    except Exception:
+        if model_cache.get(key) is future and future.done():
+            del model_cache[key]
+        raise
+
+async def encode_model_body(model, model_version, codec, level, as_json):
+    """
+    model_body önbellekte bulamadığında gövdeyi üretir. Sıkıştırılmış ve JSON gövdeler önbellekteki
+    ham gövdeden üretilir, model bir versiyon için bir kere ikili formata çevrilir.
+    """
+    if as_json:
+        data, etag = await model_body(model, model_version, codec, level)
+        body = await asyncio.to_thread(lambda: json.dumps({
+            'model': base64.b64encode(data).decode('utf-8'),
+            'format': 'binary',
+            'version': model_version
+        }).encode('utf-8'))
+        return body, etag + '-json'
+
+    if codec is None:
+        data = await asyncio.to_thread(model.to_bytes)
+        digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        return data, f"{digest}-raw"
+
+    raw, raw_etag = await model_body(model, model_version)
+    data, stats = await asyncio.to_thread(compress_payload, raw, codec, level)
+    print_transfer(f"Model {model_version} önbelleğe alındı", stats)
+    digest = raw_etag.partition('-')[0]
+    return data, f"{digest}-{codec}-{level or 'default'}"
+
+def remember_client_model(client_id, digest, model=None, payload=None, compression=None):
+    """
+    Delta yüklemelerini açan istemcinin gönderdiği modeli sonraki delta'sının temeli olarak saklar:
+    tam modelin istemciden geldiği sıkıştırılmış gövde ya da delta'dan oluşturulan modelin kopyası
+    (snapshot_model). Hash'i olmayan modeller (delta kapalı veya eski istemci) saklanmaz.
+    Süresi dolmuş (ayrıldığını bildirmemiş istemcilerin) modelleri burada silinir.
+    """
+    now = time.monotonic()
+    for key in [key for key, entry in client_models.items() if now - entry['updated'] > client_model_ttl]:
+        del client_models[key]
+    if digest is None:
+        return
+    if model is not None:
+        client_models[client_id] = {'digest': digest, 'model': model, 'updated': now}
+    else:
+        client_models[client_id] = {'digest': digest, 'payload': payload, 'compression': compression, 'updated': now}
+
+def snapshot_model(model):
+    """Modelin kurallarıyla birlikte kopyası; birleştirme turdaki modeli değiştirir. Event loop dışında çalıştırılır."""
+    copied = copy.copy(model)
+    copied.clf = copy.copy(model.clf)
+    copied.clf.rules = [copy.copy(rule) for rule in model.clf.rules]
+    return copied
+
+def client_base_model(client_id, digest):
+    """
+    İstemcinin delta'sının dayandığı modeli döndürür, saklanan model bu hash'e sahip değilse None.
+    Çözülmemiş gövde ilk delta'da çözülür. Event loop dışında çalıştırılır.
+    """
+    entry = client_models.get(client_id)
+    if entry is None or entry['digest'] != digest:
+        return None
+    if 'model' not in entry:
+        raw, _ = decompress_payload(entry['payload'], entry['compression'])
+        entry['model'] = CBA.from_bytes(raw)
+    return entry['model']
+
+def decode_model_payload(data, codec=None, field='model'):
+    """
+    İstekteki modeli çözer, (model, sıkıştırma istatistiği) döndürür. field='delta' ise
+    açılmış ikili delta verisi (model_delta çıktısı) döner, delta modele add_client_model'de uygulanır.
+    octet-stream isteklerinde alan ham gövdedir (bytearray). JSON isteklerinde codec verilirse
+    alan base64 ile kodlanmış sıkıştırılmış veridir (X-Model-Compression header'ı).
+    format "binary" ise model sütunlu ikili formattadır (CBA.to_bytes),
+    format alanı yoksa eski istemcilerin pickle+hex formatındadır.
+    Event loop'u bloklamaması için asyncio.to_thread ile çağrılır.
+    """
+    stats = None
+    model_data = data[field]
+    if isinstance(model_data, str):
+        if codec is not None or data.get('format') == 'binary':
+            model_data = base64.b64decode(model_data)
+        else:
+            model_data = bytes.fromhex(model_data)
+    if codec is not None:
+        model_data, stats = decompress_payload(model_data, codec)
+
+    if field == 'delta':
+        return model_data, stats
+    if data.get('format') == 'binary':
+        return CBA.from_bytes(model_data), stats
+    return pickle.loads(model_data), stats
+
+async def read_request():
+    """
+    İsteğin verisini okur.
+    application/octet-stream isteklerinde gövde parça parça tek bir bytearray'e okunur ve
+    üst bilgiler (X-Client-Id, X-Model-Version, X-Data-Size, X-Train-Time) header'lardan alınır;
+    gövde X-Model-Payload header'ındaki alana ("model" veya "delta") konur.
+    Diğer istekler eskisi gibi JSON olarak okunur.
+    """
+    if request.mimetype != 'application/octet-stream':
+        return await request.get_json()
+
+    body = bytearray()
+    async for chunk in request.body:
+        body += chunk
+
+    return request_data(request.headers, body)
+
+def request_data(headers, body):
+    """
+    octet-stream gövdesini ve üst bilgi header'larını read_request'in döndürdüğü sözlüğe çevirir.
+    """
+    data = {'version': int(headers['X-Model-Version']), 'format': 'binary'}
+    if 'X-Client-Id' in headers:
+        data['id'] = int(headers['X-Client-Id'])
+        data['size'] = int(headers['X-Data-Size'])
+        data['time'] = float(headers['X-Train-Time'])
+        data['digest'] = headers.get('X-Model-Digest')
+    data[headers.get('X-Model-Payload', 'model')] = body
+    return data
+
+def request_codec(headers=None):
+    """
+    İstekteki (veya verilen headers'daki) X-Model-Compression header'ını okur.
+    (codec, hata cevabı) döndürür; codec desteklenmiyorsa desteklenen codec'ler 415 cevabıyla bildirilir.
+    """
+    codec = (headers or request.headers).get('X-Model-Compression')
+    if codec is not None and codec not in COMPRESSION_CODECS:
+        return None, ("Unsupported compression", 415, {'X-Accept-Model-Compression': ", ".join(COMPRESSION_CODECS)})
+    return codec, None
+
+def print_transfer(name, stats):
+    """Bir model transferinin ham/sıkıştırılmış boyutunu ve codec süresini yazdırır."""
+    if stats is not None:
+        print(f"{name}: {stats['raw_size']} -> {stats['compressed_size']} bayt "
+              f"({stats['codec']}, {stats['time']:.4f} sn)")
+
 # ---------------------- #
 # İlk bağlantıda veri gönderme
 # ---------------------- #
@@ -71,6 +692,7 @@ async def first_conn():
     global sup, conf, tour, id, dataset, target_col, models_count, select_feature, feature_selection
 
     id += 1
+    client_stats.setdefault(id, {'size': None, 'time': None})
     dataset_name = f"{models_count}{dataset}{id}.csv"
     try:
         return jsonify({
@@ -85,62 +707,251 @@ async def first_conn():
     except Exception as e:
         print(e)
 
+# ----------------------------------------- #
+# İstemcinin Turda Seçilip Seçilmediği (GET)
+# ----------------------------------------- #
+@app.route('/round', methods=['GET'])
+async def round_info():
+    """
+    İstemcinin açık turda seçilip seçilmediğini bildirir.
+    Seçilmeyen istemci eğitim yapmadan ve model göndermeden yeni global modeli bekler.
+    """
+    client_id = int(request.args.get('id'))
+    selected = current_round.participants is None or client_id in current_round.participants
+    return jsonify({'version': current_round.base_version, 'round': current_round.number, 'selected': selected})
+
 # ----------------------------------------- #
 # İstemciden Model Alma (POST)
 # ----------------------------------------- #
+@app.route('/leave', methods=['POST'])
+async def leave():
+    """
+    Eğitimini bitiren istemcinin delta temeli olarak saklanan modelini siler.
+    """
+    client_models.pop(int(request.args.get('id')), None)
+    return "Left", 200
+
 @app.route('/send_model', methods=['POST'])
 async def get_model_client():
     """
-    İstemciden gelen modeli alır ve models listesine ekler.
+    İstemciden gelen modeli alır ve açık tura ekler.
+    Model application/octet-stream gövdesi (üst bilgiler header'larda) veya JSON olarak gelebilir.
     Eğer yeterli sayıda model geldiyse ana sunucuya gönderir.
     """
-    global models, sup, conf, models_count, tour, tours
+    data = await read_request()
+    codec, error = request_codec()
+    if error:
+        return error
+    return await add_client_model(data, codec)
 
-    data = await request.get_json()
+async def add_client_model(data, codec):
+    """
+    Okunmuş istemci modelini (veya delta'yı) çözüp açık tura ekler.
+    /send_model ve parça parça yüklemelerin commit'i tarafından kullanılır, HTTP cevabını döndürür.
+    Tur models_count modele ulaşınca veya süresi dolmuşsa yeter sayı sağlanınca kapanır.
+    Önceki turların versiyonuyla eğitilmiş geç modeller late_policy'e göre atılır ya da
+    veri boyutu staleness_decay ile küçültülerek bu tura eklenir.
+    Asenkron modda her model tek modellik bir tur olarak hemen gönderilir, küçültmeyi sunucu yapar.
+    Model çözülürken tur kapanmış olabilir; kabul, ağırlık ve tura ekleme çözmeden sonra
+    await olmadan, o an açık olan tura göre yapılır.
+    """
     incoming_version = data['version']
+    asynchronous = federation_mode == "async"
 
-    # Aynı id'ye sahip model iki kez eklenmesin
-    if not any(model['id'] == data["id"] for model in models):
-        # Model verisini pickle ile deserialize et
-        model_data = bytes.fromhex(data['model'])
-        model = pickle.loads(model_data)
-        print("Model türü:", type(model))
+    # Aynı id'ye sahip model iki kez eklenmesin, reddedilecek model boşuna çözülmesin
+    if data['id'] in current_round:
+        return "Model not send (duplicate id)", 204
+    record_client(data['id'], data['size'], data['time'])
+    _, rejection = admit_model(data)
+    if rejection:
+        return rejection
+
+    if isinstance(data.get('model'), bytearray):
+        remember_client_model(data['id'], data.get('digest'), payload=data['model'], compression=codec or "none")
 
-        # models listesine ekle
-        async with lock:
-            models.append({
-                "model": model,
-                'version': data["version"],
-                "size": data['size'],
-                "time": data['time'],
-                'id': data["id"]
-            })
-
-        # Yeterli model geldiyse, sunucuya gönderimi başlat
-        if len(models) >= models_count:
-            print("Yeterli model geldi, sunucuya gönderiliyor.")
-            asyncio.create_task(send_models_via_websocket())
-
-            # Tur bilgilerini kaydet
-            regular_data = [{'size': i['size'], 'time': i['time']} for i in models]
-            tours.append({
-                "tour": incoming_version,
-                'info': regular_data
-            })
-            json_data = {
-                'sup': sup,
-                'conf': conf,
-                'tour': tour,
-                'count': models_count,
-                'tours': tours
-            }
-            # JSON'a yaz
-            with open("models.json", "w", encoding="utf-8") as json_file:
-                json.dump(json_data, json_file, ensure_ascii=False, indent=4)
-
-        return f"Model send: {incoming_version}", 200
+    aggregate = template = None
+    if aggregation_mode == "passthrough" and isinstance(data.get('model'), bytearray):
+        # Model çözülmeden, istemciden geldiği gövdeyle (ve codec'iyle) saklanır; sunucuda çözülür
+        entry = {'payload': data['model'], 'compression': codec or "none"}
+        print(f"Model çözülmeden saklanıyor: {len(data['model'])} bayt")
     else:
+        if 'delta' in data:
+            # İstemci sadece bir önceki gönderdiği modele göre değişen kuralları gönderdi
+            delta, stats = await asyncio.to_thread(decode_model_payload, data, codec, 'delta')
+            print_transfer("Gelen delta", stats)
+            base_digest, digest = delta_digests(delta)
+            base_model = await asyncio.to_thread(client_base_model, data['id'], base_digest)
+            if base_model is None:
+                return "Delta base model not found", 409
+            model = await asyncio.to_thread(apply_model_delta, base_model, delta, CBA())
+            print(f"Delta uygulandı: {len(model.clf.rules)} kural")
+            remember_client_model(data['id'], digest, model=await asyncio.to_thread(snapshot_model, model))
+        else:
+            model, stats = await asyncio.to_thread(decode_model_payload, data, codec)
+            print_transfer("Gelen model", stats)
+        print("Model türü:", type(model))
+
+        if aggregation_mode == "stream" and not asynchronous:
+            # Model kural istatistiğine event loop dışında çevrilir, model saklanmaz.
+            # Geç modelin sayımları kabulden sonra, ağırlığı belli olunca küçültülür
+            aggregate = await asyncio.to_thread(RuleCountAggregate.from_model, model, data['size'])
+            template = model
+            entry = {}
+        else:
+            entry = {"model": model}
+
+    # Buradan sonra await yok: tur bu arada kapanmadan kabul edilir ya da reddedilir
+    state = current_round
+    staleness, rejection = admit_model(data)
+    if rejection:
+        return rejection
+
+    weight = staleness_decay ** staleness if staleness and not asynchronous else 1
+    if weight != 1:
+        # Sayım tabanlı birleştirme kural sayımlarını okur, sayımlar da boyutla birlikte küçültülür.
+        # Çözülmemiş (passthrough) gövdelerin sayımlarını sunucu info'daki weight ile küçültür
+        if aggregate is not None:
+            aggregate.scale(weight)
+        elif 'model' in entry:
+            scale_rule_counts(entry['model'].clf.rules, weight)
+        else:
+            entry['weight'] = weight
+    entry.update({
+        'version': data["version"],
+        # Geç modelin birleştirmedeki ağırlığı veri boyutuyla (stream modunda sayımlarıyla) küçültülür
+        "size": max(1, round(data['size'] * weight)) if weight != 1 else data['size'],
+        "time": data['time'],
+        'id': data["id"],
+        'staleness': staleness
+    })
+    seq = state.submit(entry, aggregate, template)
+    if seq is None:
         return "Model not send (duplicate id)", 204
+    if staleness and not asynchronous:
+        print(f"İstemci {data['id']} modeli {staleness} tur geç geldi, ağırlığı {entry['size']}/{data['size']}.")
+    print(f"İstemci {data['id']} modeli tur {state.number} içinde {seq}. sırada.")
+
+    # Turun ilk modeli geldiyse süre başlar
+    if len(state) == 1 and round_deadline is not None and not asynchronous:
+        state.timer = asyncio.create_task(expire_round(state))
+
+    # Yeterli model geldiyse (veya süre dolmuşken yeter sayı sağlandıysa) turu kapat
+    if asynchronous:
+        close_round(f"asenkron mod, istemci {data['id']} modeli ({staleness} versiyon eski)")
+    elif len(state) >= round_target():
+        close_round(f"{len(state)} model geldi")
+    elif state.expired and quorum_met():
+        close_round(f"süre dolmuştu, yeter sayı sağlandı ({len(state)}/{round_target()} model)")
+
+    return f"Model send: {incoming_version}", 200
+
+def admit_model(data):
+    """
+    Modelin açık tura alınıp alınmayacağını belirler, (eskilik, ret cevabı) döndürür; kabul edilirse ret None'dır.
+    Geç modeller late_policy "drop" ise, seçilmeyen istemcilerin güncel modelleri her zaman reddedilir.
+    """
+    # Asenkron modda turlar yoktur, eskilik yayımlanmış son versiyona göre (bilgi amaçlı) hesaplanır
+    asynchronous = federation_mode == "async"
+    staleness = max(0, (version if asynchronous else current_round.base_version) - data['version'])
+    if staleness and late_policy == "drop" and not asynchronous:
+        print(f"İstemci {data['id']} modeli {staleness} tur geç geldi, atıldı.")
+        return staleness, (f"Model dropped (late by {staleness} round)", 200)
+    if not staleness and current_round.participants is not None and data['id'] not in current_round.participants:
+        # Seçilmeyen istemci turu atlamalıydı (eski istemciler /round'u sormaz)
+        print(f"İstemci {data['id']} bu tur için seçilmedi, modeli alınmadı.")
+        return staleness, ("Model not selected for this round", 200)
+    return staleness, None
+
+# ----------------------------------------- #
+# Devam Ettirilebilir Model Yükleme
+# ----------------------------------------- #
+@app.route('/uploads', methods=['POST'])
+async def initiate_upload():
+    """
+    Parça parça model yüklemesi başlatır.
+    Header'lar /send_model'in octet-stream header'larıdır, ek olarak X-Upload-Length (toplam bayt)
+    ve X-Upload-Sha256 (tüm gövdenin hash'i) gönderilir. upload_id ve önerilen parça boyutunu döndürür.
+    """
+    codec, error = request_codec()
+    if error:
+        return error
+
+    # Süresi dolmuş (yarım kalmış) yüklemeleri sil
+    now = time.monotonic()
+    for upload_id in [key for key, upload in uploads.items() if now - upload['updated'] > upload_ttl]:
+        del uploads[upload_id]
+
+    upload_id = uuid.uuid4().hex
+    uploads[upload_id] = {
+        'headers': request.headers.copy(),
+        'length': int(request.headers['X-Upload-Length']),
+        'sha256': request.headers['X-Upload-Sha256'],
+        'data': bytearray(),
+        'hash': hashlib.sha256(),
+        'updated': now,
+        'result': None
+    }
+    return jsonify({'upload_id': upload_id, 'offset': 0, 'chunk_size': upload_chunk_size}), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+async def upload_status(upload_id):
+    """
+    Yüklemenin API'ye ulaşmış ve doğrulanmış kısmını döndürür, istemci bu offset'ten devam eder.
+    """
+    upload = uploads.get(upload_id)
+    if upload is None:
+        return "Upload not found", 404
+    return jsonify({'offset': len(upload['data']), 'length': upload['length']})
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+async def upload_chunk(upload_id):
+    """
+    offset parametresindeki parçayı yüklemeye ekler. Parça X-Chunk-Sha256 header'ı ile doğrulanır.
+    offset API'deki boyutla uyuşmazsa 409, hash tutmazsa 422 döner; ikisinde de cevaptaki offset'ten devam edilir.
+    """
+    upload = uploads.get(upload_id)
+    if upload is None:
+        return "Upload not found", 404
+
+    chunk = await request.get_data()
+    offset = int(request.args.get('offset'))
+    received = len(upload['data'])
+    if offset != received:
+        return jsonify({'offset': received}), 409
+    if hashlib.sha256(chunk).hexdigest() != request.headers.get('X-Chunk-Sha256'):
+        return jsonify({'offset': received}), 422
+    if received + len(chunk) > upload['length']:
+        return "Chunk exceeds upload length", 400
+
+    upload['data'] += chunk
+    upload['hash'].update(chunk)
+    upload['updated'] = time.monotonic()
+    return jsonify({'offset': len(upload['data'])})
+
+@app.route('/uploads/<upload_id>/commit', methods=['POST'])
+async def commit_upload(upload_id):
+    """
+    Yükleme tamamlandıysa tüm gövdenin hash'ini kontrol eder, modeli çözer ve tura ekler.
+    Model sadece burada çözülür. Commit cevabı kaybolup tekrar istenirse aynı cevap döner.
+    """
+    upload = uploads.get(upload_id)
+    if upload is None:
+        return "Upload not found", 404
+    if upload['result'] is not None:
+        return upload['result']
+    if len(upload['data']) != upload['length']:
+        return jsonify({'offset': len(upload['data'])}), 400
+    if upload['hash'].hexdigest() != upload['sha256']:
+        # Gövde bozuk, yükleme baştan yapılmalı
+        del uploads[upload_id]
+        return "Upload hash mismatch", 422
+
+    headers = upload['headers']
+    codec, _ = request_codec(headers)
+    upload['result'] = await add_client_model(request_data(headers, upload['data']), codec)
+    upload['data'] = bytearray()
+    upload['updated'] = time.monotonic()
+    return upload['result']
 
 # ----------------------------------------- #
 # İstemciye Model Gönderme (GET)
@@ -149,47 +960,105 @@ async def get_model_client():
 async def send_model_client():
     """
     İstemciden gelen version parametresiyle karşılaştırıp, gerekiyorsa güncel modeli gönderir.
+    Accept: application/octet-stream ile istenirse model ham ikili gövde olarak (versiyon ve codec
+    header'larda) parça parça gönderilir, aksi halde base64 ile JSON içinde gönderilir.
+    wait parametresi verilirse (long-poll) istemcinin versiyonu güncelken hemen 204 dönülmez;
+    yeni versiyon kaydedilene veya wait saniye (en fazla long_poll_max) dolana kadar beklenir.
+    Bekleyen istekler sadece bir asyncio.Event bekler, istemci başına thread açılmaz.
+    Gövdeler model_body ile versiyon başına bir kere kodlanır. ETag modelin içeriğine göredir:
+    istemcinin versiyonu eski ama If-None-Match'teki gövde yeni versiyonla aynıysa (ör. birleştirme
+    kuralları değiştirmediyse) gövde gönderilmez, 304 ile sadece yeni versiyon bildirilir.
     """
     client_model_version = int(request.args.get('version'))
+    wait = min(float(request.args.get('wait', 0)), long_poll_max)
     global version, global_model
 
+    deadline = time.monotonic() + wait
+    while version <= client_model_version:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            await asyncio.wait_for(model_event.wait(), remaining)
+        except asyncio.TimeoutError:
+            break
+
     # Eğer sunucudaki model daha yeni ise modeli gönder
     if version > client_model_version:
-        model_data = pickle.dumps(global_model)
-        model_base64 = base64.b64encode(model_data).decode('utf-8')
-        try:
-            return jsonify({
-                'model': model_base64,
-                'version': version
-            }), 200
-        except Exception as e:
-            print(e)
+        # Sıkıştırma sırasında yeni model gelebilir, gönderilecek model ve versiyon sabitlenir
+        model, model_version = global_model, version
+        headers = {}
+        codec = level = None
+        accepted = request.headers.get('X-Accept-Model-Compression')
+        if accepted is not None:
+            # İstemcinin tercih listesinden desteklenen ilk codec ile sıkıştır
+            codec = negotiate_codec(accepted) or "none"
+            level = request.headers.get('X-Model-Compression-Level')
+            level = int(level) if level else None
+            headers['X-Model-Compression'] = codec
+
+        as_json = request.accept_mimetypes.best_match(['application/json', 'application/octet-stream']) != \
+            'application/octet-stream'
+        model_data, etag = await model_body(model, model_version, codec, level, as_json)
+        headers['ETag'] = f'"{etag}"'
+
+        if request.if_none_match.contains(etag):
+            # İstemcideki model bu versiyonla aynı, sadece versiyonu ilerletir
+            headers['X-Model-Version'] = str(model_version)
+            return "", 304, headers
+
+        if as_json:
+            return Response(model_data, mimetype='application/json', headers=headers)
+
+        # Model ham gövde olarak parça parça yazılır, versiyon header'da
+        headers['X-Model-Version'] = str(model_version)
+        headers['X-Model-Format'] = 'binary'
+
+        async def chunks():
+            for chunk in iter_chunks(model_data):
+                yield bytes(chunk)
+
+        return Response(chunks(), mimetype='application/octet-stream', headers=headers)
     else:
         # Güncel ise model göndermeye gerek yok
         return "", 204
 
+# ----------------------------------------- #
+# Sunucudaki Birleştirme İşlerinin Durumu (GET)
+# ----------------------------------------- #
+@app.route('/merge_jobs', methods=['GET'])
+async def merge_jobs():
+    """
+    Sunucudaki birleştirme işlerinin durumunu (kuyrukta, çalışıyor, bitti, başarısız) ve sürelerini döndürür.
+    job_id parametresi verilirse sadece o iş sorgulanır.
+    """
+    job_id = request.args.get('job_id')
+    message = {'type': 'job', 'job_id': job_id} if job_id else {'type': 'jobs'}
+    try:
+        reply = await server_channel.request(message, timeout=10)
+    except (ConnectionError, asyncio.TimeoutError) as e:
+        return f"Server unavailable: {e}", 503
+    reply.pop('reply_to', None)
+    return jsonify(reply)
+
 # ----------------------------------------- #
 # Ana Sunucudan Federated Model Alma (POST)
 # ----------------------------------------- #
 @app.route('/send_federated_model', methods=['POST'])
 async def get_federated_model():
     """
-    Ana sunucudan gelen federated modeli alır ve kaydeder.
+    Ana sunucudan HTTP ile gelen federated modeli alır ve kaydeder.
+    Güncel sunucu modeli kalıcı WebSocket kanalından gönderir, bu uç nokta eski sunucular içindir.
     """
-    global global_model, version
-
-    data = await request.get_json()
-    version = data['version']
-
-    # Modeli yükle ve kaydet
-    model_data = bytes.fromhex(data['model'])
-    model = pickle.loads(model_data)
-    global_model = model
-    model_path = f"model_{version}.pkl"
-    with open(model_path, 'wb') as file:
-        pickle.dump(model, file)
+    data = await read_request()
+    codec, error = request_codec()
+    if error:
+        return error
 
-    print(f"Yeni global model kaydedildi. Versiyon: {version}")
+    # Modeli yükle ve kaydet (versiyon, model çözüldükten sonra güncellenir)
+    model, stats = await asyncio.to_thread(decode_model_payload, data, codec)
+    print_transfer("Sunucudan gelen model", stats)
+    await install_global_model(model, data['version'])
     return "Model Gönderildi", 200
 
 # ----------------------------------------- #
@@ -198,20 +1067,14 @@ async def get_federated_model():
 @app.before_serving
 async def before_serving():
     """
-    Sunucu ilk başlatıldığında ana sunucuya bağlanıp modeli çeker.
+    Sunucu başlatıldığında ana sunucu ile kalıcı kanalı açar.
+    Kanal açılınca güncel model çekilir (request_initial_model).
     """
-    try:
-        data = {'first': True}
-        send_data = pickle.dumps(data)
-
-        async with websockets.connect("ws://localhost:7896") as ws:
-            await ws.send(send_data)
-            response_data = await ws.recv()
-            response = pickle.loads(response_data)
-            print("Başlangıç modeli çekildi:", response)
+    server_channel.start()
 
-    except Exception as e:
-        print(f"WebSocket ile ilk model çekilirken hata: {e}")
+@app.after_serving
+async def after_serving():
+    await server_channel.stop()
 
 # ----------------------------------------- #
 # Sunucuyu başlat
@@ -0,0 +1,377 @@
+import json
+import time
+import zlib
+import lzma
+import struct
+import collections
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from ..data_structures import ClassAssocationRule, Antecedent, Consequent
+from .classifier import Classifier
+
+
+MAGIC = b"PCBA"
+FORMAT_VERSION = 1
+
+# magic, format version, reserved, length of the metadata block
+HEADER = struct.Struct("<4sHHI")
+
+# columnar arrays in the order they follow the metadata block,
+# their lengths are derived from the counts stored in metadata
+ARRAYS = (
+    ("string_offsets", "<i4", lambda meta: meta["strings"] + 1),
+    ("string_data", "u1", lambda meta: meta["string_bytes"]),
+    ("items", "<i4", lambda meta: 2 * meta["items"]),
+    ("indptr", "<i4", lambda meta: meta["rules"] + 1),
+    ("indices", "<i4", lambda meta: meta["nnz"]),
+    ("consequent", "<i4", lambda meta: meta["rules"]),
+    ("support", "<f8", lambda meta: meta["rules"]),
+    ("confidence", "<f8", lambda meta: meta["rules"]),
+    ("support_count", "<i8", lambda meta: meta["rules"]),
+    ("antecedent_count", "<i8", lambda meta: meta["rules"]),
+    ("rulelen", "<i4", lambda meta: meta["rules"]),
+    ("rid", "<i8", lambda meta: meta["rules"]),
+)
+
+MODEL_FIELDS = ("support", "confidence", "maxlen", "algorithm", "size", "target_class")
+DEFAULT_CLASS_FIELDS = (
+    "default_class",
+    "default_class_attribute",
+    "default_class_confidence",
+    "default_class_support"
+)
+
+# size of chunks in which encoded models are streamed over HTTP
+CHUNK_SIZE = 64 * 1024
+
+# codec name: (compress(data, level), decompress(data), default level),
+# zstd is available only if the zstandard package is installed
+COMPRESSION_CODECS = {
+    "none": (lambda data, level: data, lambda data: data, None),
+    "zlib": (lambda data, level: zlib.compress(data, level), zlib.decompress, 6),
+    "lzma": (lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 6),
+}
+
+if zstandard is not None:
+    COMPRESSION_CODECS["zstd"] = (
+        lambda data, level: zstandard.ZstdCompressor(level=level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+        3
+    )
+
+
+def encode_model(model):
+    """Encodes a trained CBA model into the columnar
+    binary format.
+
+    Every distinct attribute and value string is stored
+    once in a string table and every distinct (attribute, value)
+    pair once in an item dictionary. Antecedents are stored
+    as CSR arrays (indptr, indices) of item ids, consequents
+    as item ids and rule statistics as numeric arrays.
+    Transient state of M1/M2 (marked, class_cases_covered,
+    replace) is not stored.
+
+    Parameters
+    ----------
+    model: CBA
+
+    Returns
+    -------
+    bytes
+    """
+    strings = {}
+    items = {}
+
+    def string_id(string):
+        return strings.setdefault(string, len(strings))
+
+    def item_id(attribute, value):
+        key = (attribute, value)
+        idx = items.get(key)
+        if idx is None:
+            idx = items[key] = len(items)
+            string_id(attribute)
+            string_id(value)
+        return idx
+
+    clf = model.clf
+    rules = clf.rules if clf is not None else []
+
+    indptr = [0]
+    indices = []
+    consequent = []
+
+    for rule in rules:
+        for attribute, value in rule.antecedent.itemset.items():
+            indices.append(item_id(attribute, value))
+        indptr.append(len(indices))
+        consequent.append(item_id(rule.consequent.attribute, rule.consequent.value))
+
+    encoded_strings = [string.encode("utf-8") for string in strings]
+    string_offsets = np.zeros(len(encoded_strings) + 1, dtype="<i4")
+    np.cumsum([len(string) for string in encoded_strings], out=string_offsets[1:])
+
+    arrays = {
+        "string_offsets": string_offsets,
+        "string_data": np.frombuffer(b"".join(encoded_strings), dtype="u1"),
+        "items": np.array([(strings[a], strings[v]) for a, v in items], dtype="<i4").reshape(-1),
+        "indptr": np.array(indptr, dtype="<i4"),
+        "indices": np.array(indices, dtype="<i4"),
+        "consequent": np.array(consequent, dtype="<i4"),
+        "support": np.array([rule.support for rule in rules], dtype="<f8"),
+        "confidence": np.array([rule.confidence for rule in rules], dtype="<f8"),
+        "support_count": np.array([rule.support_count for rule in rules], dtype="<i8"),
+        "antecedent_count": np.array([rule.antecedent_count for rule in rules], dtype="<i8"),
+        "rulelen": np.array([rule.rulelen for rule in rules], dtype="<i4"),
+        "rid": np.array([rule.rid for rule in rules], dtype="<i8"),
+    }
+
+    meta = {
+        "model": {field: _scalar(getattr(model, field, None)) for field in MODEL_FIELDS},
+        "classifier": None,
+        "strings": len(encoded_strings),
+        "string_bytes": len(arrays["string_data"]),
+        "items": len(items),
+        "rules": len(rules),
+        "nnz": len(indices),
+    }
+
+    if clf is not None:
+        default_rule = clf.default_rule
+        meta["classifier"] = {field: _scalar(getattr(clf, field)) for field in DEFAULT_CLASS_FIELDS}
+        meta["classifier"]["default_rule_rid"] = default_rule.rid if default_rule is not None else None
+
+    meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(meta_bytes)), meta_bytes]
+    parts.extend(arrays[name].astype(dtype, copy=False).tobytes() for name, dtype, _ in ARRAYS)
+
+    return b"".join(parts)
+
+
+def decode_model(data, model):
+    """Decodes rules and parameters from the columnar
+    binary format into an empty CBA model.
+
+    Parameters
+    ----------
+    data: bytes-like
+        output of encode_model
+
+    model: CBA
+        model whose attributes are overwritten
+
+    Returns
+    -------
+    model
+    """
+    view = memoryview(data)
+
+    if len(view) < HEADER.size:
+        raise Exception("data is too short to be an encoded CBA model")
+
+    magic, version, _, meta_length = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise Exception("data is not an encoded CBA model")
+    if version != FORMAT_VERSION:
+        raise Exception("unsupported model format version: {}".format(version))
+
+    offset = HEADER.size
+    meta = json.loads(bytes(view[offset:offset + meta_length]).decode("utf-8"))
+    offset += meta_length
+
+    arrays = {}
+    for name, dtype, length in ARRAYS:
+        count = length(meta)
+        arrays[name] = np.frombuffer(view, dtype=dtype, count=count, offset=offset)
+        offset += count * arrays[name].itemsize
+
+    string_offsets = arrays["string_offsets"].tolist()
+    string_data = arrays["string_data"].tobytes()
+    strings = [
+        string_data[start:end].decode("utf-8")
+        for start, end in zip(string_offsets, string_offsets[1:])
+    ]
+    item_ids = arrays["items"].tolist()
+    items = [(strings[item_ids[i]], strings[item_ids[i + 1]]) for i in range(0, len(item_ids), 2)]
+
+    for field, value in meta["model"].items():
+        setattr(model, field, value)
+
+    if meta["classifier"] is None:
+        model.clf = None
+        return model
+
+    indptr = arrays["indptr"].tolist()
+    indices = arrays["indices"].tolist()
+
+    columns = zip(
+        arrays["consequent"].tolist(),
+        arrays["support"].tolist(),
+        arrays["confidence"].tolist(),
+        arrays["support_count"].tolist(),
+        arrays["antecedent_count"].tolist(),
+        arrays["rulelen"].tolist(),
+        arrays["rid"].tolist()
+    )
+
+    rules = []
+    for i, (cons, support, confidence, support_count, antecedent_count, rulelen, rid) in enumerate(columns):
+        antecedent = _antecedent([items[j] for j in indices[indptr[i]:indptr[i + 1]]])
+        rule = _rule(antecedent, Consequent(*items[cons]), support, confidence, rulelen, rid)
+        rule.support_count = support_count
+        rule.antecedent_count = antecedent_count
+        rules.append(rule)
+
+    clf = Classifier()
+    clf.rules = rules
+
+    classifier = meta["classifier"]
+    default_rule_rid = classifier.pop("default_rule_rid")
+    for field, value in classifier.items():
+        setattr(clf, field, value)
+
+    if default_rule_rid is not None:
+        clf.default_rule = _rule(
+            _antecedent([]),
+            Consequent(clf.default_class_attribute, clf.default_class),
+            clf.default_class_support,
+            clf.default_class_confidence,
+            1,
+            default_rule_rid
+        )
+
+    model.clf = clf
+
+    return model
+
+
+def _scalar(value):
+    """Converts numpy scalars so that they can be
+    stored in the JSON metadata block.
+    """
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _antecedent(items):
+    """Builds an Antecedent from (attribute, value) pairs,
+    keeping their order.
+    """
+    antecedent = Antecedent.__new__(Antecedent)
+    antecedent.itemset = dict(items)
+    antecedent.frozenset = frozenset(antecedent.itemset.items())
+
+    return antecedent
+
+
+def _rule(antecedent, consequent, support, confidence, rulelen, rid):
+    """Builds a CAR with a given rid without advancing
+    the global rule id counter.
+    """
+    rule = ClassAssocationRule.__new__(ClassAssocationRule)
+    rule.antecedent = antecedent
+    rule.consequent = consequent
+    rule.support = support
+    rule.confidence = confidence
+    rule.rulelen = rulelen
+    rule.rid = rid
+    rule.support_count = 0
+    rule.antecedent_count = 0
+    rule.marked = False
+    rule.class_cases_covered = collections.Counter()
+    rule.replace = set()
+
+    return rule
+
+
+def compress_payload(data, codec="zlib", level=None):
+    """Compresses an encoded model (or any payload)
+    for sending it to another hop.
+
+    Parameters
+    ----------
+    data: bytes-like
+
+    codec: str
+        one of COMPRESSION_CODECS
+
+    level: int
+        compression level, default level of the codec
+        is used if None
+
+    Returns
+    -------
+    (compressed data, statistics) tuple, statistics is
+    a dict with codec, level, raw_size, compressed_size
+    and time in seconds
+    """
+    if codec not in COMPRESSION_CODECS:
+        raise Exception("unsupported compression codec: {}".format(codec))
+
+    compress, _, default_level = COMPRESSION_CODECS[codec]
+    level = default_level if level is None else level
+
+    start = time.perf_counter()
+    compressed = compress(data, level)
+    elapsed = time.perf_counter() - start
+
+    return compressed, _compression_stats(codec, level, len(data), len(compressed), elapsed)
+
+
+def decompress_payload(data, codec="zlib"):
+    """Reverses compress_payload.
+
+    Returns
+    -------
+    (data, statistics) tuple, see compress_payload
+    """
+    if codec not in COMPRESSION_CODECS:
+        raise Exception("unsupported compression codec: {}".format(codec))
+
+    _, decompress, _ = COMPRESSION_CODECS[codec]
+
+    start = time.perf_counter()
+    raw = decompress(data)
+    elapsed = time.perf_counter() - start
+
+    return raw, _compression_stats(codec, None, len(raw), len(data), elapsed)
+
+
+def negotiate_codec(accepted):
+    """Picks the first codec from a comma separated list
+    of preferred codecs (such as "zstd, zlib") which is
+    available here. Returns None if there is none.
+    """
+    for codec in (accepted or "").split(","):
+        codec = codec.strip().lower()
+        if codec in COMPRESSION_CODECS:
+            return codec
+
+    return None
+
+
+def iter_chunks(data, chunk_size=CHUNK_SIZE):
+    """Yields consecutive slices of data as memoryviews
+    so that a payload can be streamed without copying it.
+    """
+    view = memoryview(data)
+
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def _compression_stats(codec, level, raw_size, compressed_size, elapsed):
+    return {
+        "codec": codec,
+        "level": level,
+        "raw_size": raw_size,
+        "compressed_size": compressed_size,
+        "ratio": raw_size / compressed_size if compressed_size else None,
+        "time": elapsed
+    }
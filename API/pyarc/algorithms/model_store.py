@@ -0,0 +1,299 @@
+import os
+import copy
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import numpy as np
+
+from .model_codec import encode_model, decode_model
+
+
+# version, base version, length of the encoded rules,
+# number of entries of the rule order, crc32 of the payload
+RECORD = struct.Struct("<IIIII")
+
+SNAPSHOT_INTERVAL = 10
+INDEX_FILE = "index.json"
+LOG_FILE = "deltas.log"
+OBJECTS_DIR = "objects"
+
+
+def rule_fields(rule):
+    """Returns all stored fields of a rule. A rule is
+    logged as unchanged only if all of them are equal
+    to those of a rule in the previous version.
+    """
+    return (
+        tuple(rule.antecedent.itemset.items()),
+        rule.consequent.attribute,
+        rule.consequent.value,
+        rule.support,
+        rule.confidence,
+        rule.support_count,
+        rule.antecedent_count,
+        rule.rulelen,
+        rule.rid
+    )
+
+
+class ModelStore:
+    """Versioned on-disk store of CBA models.
+
+    Every version is appended to a delta log as a record
+    referencing the rules which did not change since the
+    previously saved version by their position; only new
+    and changed rules are encoded (in the columnar format
+    of model_codec). Every snapshot_interval versions the
+    full model is written as a content-addressed snapshot
+    (objects/<sha256>) instead.
+
+    Snapshots are written to a temporary file and renamed,
+    the snapshot index is replaced the same way. Records
+    carry a checksum, a torn record at the end of the log
+    is cut off when the store is opened. Snapshots are
+    decoded through a read-only memory map.
+
+    Parameters
+    ----------
+    path: str
+        directory of the store, created if missing
+
+    model_class: type
+        class of the stored models (CBA)
+
+    snapshot_interval: int
+        number of versions between two snapshots
+
+    fsync: bool
+        if True, writes are flushed to disk before save returns
+    """
+
+    def __init__(self, path, model_class, snapshot_interval=SNAPSHOT_INTERVAL, fsync=True):
+        self.path = path
+        self.model_class = model_class
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+
+        os.makedirs(os.path.join(path, OBJECTS_DIR), exist_ok=True)
+
+        self.index_path = os.path.join(path, INDEX_FILE)
+        self.log_path = os.path.join(path, LOG_FILE)
+
+        self.snapshots = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as file:
+                self.snapshots = json.load(file)["snapshots"]
+
+        self.version = self.snapshots[-1]["version"] if self.snapshots else 0
+        self.log_size = 0
+        self._recover_log()
+
+        # fields of the rules of the last saved version
+        # and their positions, deltas are computed against them
+        self.previous = None
+
+    def save(self, model, version):
+        """Saves a new version of the model.
+
+        Parameters
+        ----------
+        model: CBA
+
+        version: int
+            must be greater than the last saved version
+
+        Returns
+        -------
+        dict with version, kind (snapshot or delta),
+        bytes written and time in seconds
+        """
+        if version <= self.version:
+            raise Exception("version {} is not newer than the stored version {}".format(version, self.version))
+
+        start = time.perf_counter()
+
+        rules = model.clf.rules if model.clf is not None else []
+        fields = [rule_fields(rule) for rule in rules]
+
+        last_snapshot = self.snapshots[-1]["version"] if self.snapshots else 0
+
+        if self.previous is None or version - last_snapshot >= self.snapshot_interval:
+            kind, written = "snapshot", self._write_snapshot(model, version)
+        else:
+            kind, written = "delta", self._append_delta(model, version, rules, fields)
+
+        self.version = version
+        self.previous = {field: position for position, field in enumerate(fields)}
+
+        return {
+            "version": version,
+            "kind": kind,
+            "bytes": written,
+            "time": time.perf_counter() - start
+        }
+
+    def load(self, version=None):
+        """Loads a stored version of the model (the last one
+        by default) from the closest snapshot and the records
+        following it. Returns None if the version is not stored.
+        """
+        version = self.version if version is None else version
+
+        snapshot = None
+        for candidate in self.snapshots:
+            if candidate["version"] <= version:
+                snapshot = candidate
+
+        if snapshot is None:
+            return None
+
+        model = self._read_snapshot(snapshot["hash"])
+        model_version = snapshot["version"]
+
+        if model_version < version:
+            with open(self.log_path, "rb") as file:
+                file.seek(snapshot["offset"])
+                for record_version, base_version, encoded, order in self._records(file, self.log_size):
+                    if base_version != model_version:
+                        continue
+                    model = self._apply_record(model, encoded, order)
+                    model_version = record_version
+                    if model_version == version:
+                        break
+
+        if model_version != version:
+            return None
+
+        if version == self.version:
+            rules = model.clf.rules if model.clf is not None else []
+            self.previous = {rule_fields(rule): position for position, rule in enumerate(rules)}
+
+        return model
+
+    def disk_usage(self):
+        """Returns the number of bytes used by the store."""
+        total = 0
+        for directory, _, files in os.walk(self.path):
+            total += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+        return total
+
+    def _write_snapshot(self, model, version):
+        data = encode_model(model)
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = os.path.join(self.path, OBJECTS_DIR, digest)
+
+        written = 0
+        if not os.path.exists(object_path):
+            self._atomic_write(object_path, data)
+            written += len(data)
+
+        self.snapshots.append({"version": version, "hash": digest, "offset": self.log_size})
+        index = json.dumps({"snapshots": self.snapshots}).encode("utf-8")
+        self._atomic_write(self.index_path, index)
+
+        return written + len(index)
+
+    def _append_delta(self, model, version, rules, fields):
+        order = []
+        changed = []
+
+        for rule, field in zip(rules, fields):
+            position = self.previous.get(field)
+            if position is None:
+                order.append(-len(changed) - 1)
+                changed.append(rule)
+            else:
+                order.append(position)
+
+        shell = copy.copy(model)
+        if model.clf is not None:
+            shell.clf = copy.copy(model.clf)
+            shell.clf.rules = changed
+
+        encoded = encode_model(shell)
+        payload = encoded + np.array(order, dtype="<i4").tobytes()
+        header = RECORD.pack(version, self.version, len(encoded), len(order), zlib.crc32(payload))
+
+        with open(self.log_path, "ab") as file:
+            file.write(header)
+            file.write(payload)
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+
+        self.log_size += len(header) + len(payload)
+
+        return len(header) + len(payload)
+
+    def _apply_record(self, model, encoded, order):
+        record = decode_model(encoded, self.model_class())
+        if record.clf is None:
+            return record
+
+        base_rules = model.clf.rules if model.clf is not None else []
+        changed = record.clf.rules
+        record.clf.rules = [
+            base_rules[position] if position >= 0 else changed[-position - 1]
+            for position in order.tolist()
+        ]
+
+        return record
+
+    def _read_snapshot(self, digest):
+        object_path = os.path.join(self.path, OBJECTS_DIR, digest)
+
+        with open(object_path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return decode_model(data, self.model_class())
+
+    def _records(self, file, end):
+        """Yields (version, base version, encoded rules, order)
+        of valid records between the current position of file
+        and end.
+        """
+        position = file.tell()
+
+        while position + RECORD.size <= end:
+            header = file.read(RECORD.size)
+            version, base_version, length, count, crc = RECORD.unpack(header)
+            payload = file.read(length + 4 * count)
+
+            if len(payload) != length + 4 * count or zlib.crc32(payload) != crc:
+                return
+
+            position += RECORD.size + len(payload)
+            yield version, base_version, payload[:length], np.frombuffer(payload, dtype="<i4", offset=length)
+
+    def _recover_log(self):
+        """Finds the end of the last valid record and the last
+        stored version, a torn record at the end is cut off.
+        """
+        if not os.path.exists(self.log_path):
+            return
+
+        size = os.path.getsize(self.log_path)
+        offset = self.snapshots[-1]["offset"] if self.snapshots else 0
+        valid = offset
+
+        with open(self.log_path, "r+b") as file:
+            file.seek(offset)
+            for version, _, _, _ in self._records(file, size):
+                self.version = max(self.version, version)
+                valid = file.tell()
+
+            if valid < size:
+                file.truncate(valid)
+
+        self.log_size = valid
+
+    def _atomic_write(self, path, data):
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        os.replace(temporary, path)
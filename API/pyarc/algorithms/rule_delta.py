@@ -0,0 +1,143 @@
+import copy
+import struct
+import numpy as np
+
+from .model_codec import encode_model, decode_model
+
+
+# sha256 of the base model, sha256 of the model, length of
+# the encoded new rules, number of entries of the rule order
+DELTA_HEADER = struct.Struct("<32s32sII")
+
+
+def rule_key(rule):
+    """Returns a key identifying a rule by its antecedent
+    and consequent, independent of item order.
+    """
+    antecedent = tuple(sorted(rule.antecedent.itemset.items()))
+    consequent = (rule.consequent.attribute, rule.consequent.value)
+
+    return antecedent, consequent
+
+
+def delta_fields(rule):
+    """Returns the fields a rule must share with a rule
+    of the base model to be sent as unchanged. The rule
+    id is left out, it changes every time a model is trained.
+    """
+    return (
+        tuple(rule.antecedent.itemset.items()),
+        rule.consequent.attribute,
+        rule.consequent.value,
+        rule.support,
+        rule.confidence,
+        rule.support_count,
+        rule.antecedent_count,
+        rule.rulelen
+    )
+
+
+def model_delta(model, base_model, base_digest, digest):
+    """Encodes a freshly trained model as a delta against
+    the model the client uploaded before (base_model).
+
+    Rules equal to a base rule are referenced by their
+    position in base_model, only the other rules are
+    encoded (in the columnar format of model_codec),
+    together with the parameters and the default class.
+
+    Parameters
+    ----------
+    model: CBA
+        freshly trained model
+
+    base_model: CBA
+        model uploaded before
+
+    base_digest: str
+        hex sha256 identifying base_model
+
+    digest: str
+        hex sha256 identifying model, later deltas
+        use it as their base_digest
+
+    Returns
+    -------
+    bytes
+    """
+    positions = {}
+    for position, rule in enumerate(base_model.clf.rules):
+        positions.setdefault(delta_fields(rule), position)
+
+    order = []
+    changed = []
+
+    for rule in model.clf.rules:
+        position = positions.get(delta_fields(rule))
+        if position is None:
+            order.append(-len(changed) - 1)
+            changed.append(rule)
+        else:
+            order.append(position)
+
+    shell = copy.copy(model)
+    shell.clf = copy.copy(model.clf)
+    shell.clf.rules = changed
+
+    encoded = encode_model(shell)
+    header = DELTA_HEADER.pack(bytes.fromhex(base_digest), bytes.fromhex(digest), len(encoded), len(order))
+
+    return header + encoded + np.array(order, dtype="<i4").tobytes()
+
+
+def delta_digests(data):
+    """Returns (base_digest, digest) of an encoded delta
+    as hex strings.
+    """
+    if len(data) < DELTA_HEADER.size:
+        raise Exception("data is too short to be a model delta")
+
+    base_digest, digest, _, _ = DELTA_HEADER.unpack_from(data)
+
+    return base_digest.hex(), digest.hex()
+
+
+def apply_model_delta(base_model, data, model):
+    """Rebuilds the full model from the model the delta
+    was computed against.
+
+    Rules of base_model are copied, so base_model
+    is left intact.
+
+    Parameters
+    ----------
+    base_model: CBA
+
+    data: bytes-like
+        output of model_delta
+
+    model: CBA
+        empty model whose attributes are overwritten
+
+    Returns
+    -------
+    model
+    """
+    view = memoryview(data)
+    _, _, length, count = DELTA_HEADER.unpack_from(view)
+    offset = DELTA_HEADER.size
+
+    if len(view) != offset + length + 4 * count:
+        raise Exception("model delta is truncated")
+
+    model = decode_model(view[offset:offset + length], model)
+    order = np.frombuffer(view, dtype="<i4", count=count, offset=offset + length)
+
+    base_rules = base_model.clf.rules
+    changed = model.clf.rules
+    model.clf.rules = [
+        copy.copy(base_rules[position]) if position >= 0 else changed[-position - 1]
+        for position in order.tolist()
+    ]
+
+    return model
@@ -44,7 +44,14 @@ class ClassAssocationRule():
         rule id
 
     support_count: int
-        absolute support count
+        absolute support count, number of transactions
+        that satisfy both antecedent and consequent
+
+    antecedent_count: int
+        number of transactions that satisfy antecedent.
+        Together with support_count it forms sufficient
+        statistics of the rule, so rules mined on different
+        datasets can be merged exactly by adding counts
 
     marked: bool
 
@@ -72,6 +79,7 @@ class ClassAssocationRule():
         ClassAssocationRule.id += 1
 
         self.support_count = 0
+        self.antecedent_count = 0
         
         self.marked = False
         
@@ -0,0 +1,523 @@
+import unittest
+import os
+import sys
+import pickle
+import asyncio
+import hashlib
+import importlib
+import tempfile
+import pandas as pd
+from pyarc import CBA
+from pyarc.algorithms import (RuleCountAggregate, ModelStore, model_delta, scale_rule_counts, compress_payload,
+                              decompress_payload)
+from pyarc.data_structures import TransactionDB
+from utils import HiddenPrints
+
+dataset_file = os.path.dirname(os.path.realpath(__file__)) + "/data/titanic.csv"
+api_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+# api.py ayarları, her testten sonra eski değerlerine döndürülür
+SETTINGS = (
+    "models_count", "round_deadline", "quorum_clients", "quorum_fraction", "late_policy", "staleness_decay",
+    "selection_policy", "clients_per_round", "federation_mode", "aggregation_mode", "compression",
+    "compression_level", "send_attempts", "upload_ttl", "upload_chunk_size", "long_poll_max", "client_model_ttl"
+)
+
+
+class StubChannel:
+    """Sunucu kanalının yerine geçer, gönderilen mesajları saklar."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(message)
+
+    async def request(self, message):
+        self.sent.append(message)
+        return {'status': 'queued', 'id': 'job', 'state': 'queued'}
+
+    def rounds(self):
+        """Gönderilen "models" mesajlarının verisi (passthrough modunda parçalarıyla birlikte)."""
+        rounds = []
+        parts = []
+        for message in self.sent:
+            if message['type'] == 'model_part':
+                parts.append(message)
+            elif message.get('format') == 'parts':
+                rounds.append({**message, 'parts': parts})
+                parts = []
+            else:
+                raw, _ = decompress_payload(message['payload'], message['compression'])
+                rounds.append(pickle.loads(raw))
+        return rounds
+
+
+def fit(df):
+    return CBA(support=0.05, confidence=0.5).fit(TransactionDB.from_DataFrame(df))
+
+
+def message_models(data):
+    """
+    Sunucuya gönderilen tur mesajındaki modeller, {'model': CBA, ...} olarak.
+    Parçaların sayımları sunucudaki gibi info'daki weight ile küçültülür.
+    """
+    if data.get('format') == 'parts':
+        models = []
+        for part in data['parts']:
+            raw, _ = decompress_payload(part['payload'], part['compression'])
+            model = CBA.from_bytes(raw)
+            if part['info'].get('weight') is not None:
+                scale_rule_counts(model.clf.rules, part['info']['weight'])
+            models.append({**part['info'], 'model': model})
+        return models
+    return [{**m, 'model': CBA.from_bytes(m['model'])} for m in data['models']]
+
+
+def count_merge(models):
+    """Sunucunun "counts" birleştirmesi: sayımların toplamından kurallar."""
+    aggregate = RuleCountAggregate()
+    for m in models:
+        aggregate.update(RuleCountAggregate.from_model(m['model'], m['size']))
+    return aggregate
+
+
+loaded = {}
+
+
+def load_api():
+    """api.py modülünü bir kere yükler, (modül, ayarların ilk değerleri) döndürür."""
+    if not loaded:
+        # api.py modülü yüklenirken çalışma dizininde model deposu oluşturur
+        loaded['directory'] = tempfile.TemporaryDirectory()
+        cwd = os.getcwd()
+        sys.path.insert(0, api_dir)
+        os.chdir(loaded['directory'].name)
+        try:
+            with HiddenPrints():
+                loaded['api'] = importlib.import_module("api")
+        finally:
+            os.chdir(cwd)
+            sys.path.remove(api_dir)
+        loaded['settings'] = {name: getattr(loaded['api'], name) for name in SETTINGS}
+    return loaded['api'], loaded['settings']
+
+
+class ApiTestCase(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.api, cls.settings = load_api()
+
+        df = pd.read_csv(dataset_file).sample(frac=1, random_state=1)
+        cls.models = [fit(df.iloc[:900]), fit(df.iloc[900:])]
+
+    def setUp(self):
+        api = self.api
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.TemporaryDirectory()
+        # close_round tur kayıtlarını çalışma dizinine yazar
+        os.chdir(self.workdir.name)
+
+        for name, value in self.settings.items():
+            setattr(api, name, value)
+        api.current_round = api.RoundState()
+        api.version = 0
+        api.global_model = None
+        for state in (api.client_stats, api.client_models, api.uploads, api.model_cache):
+            state.clear()
+        api.tours.clear()
+        api.model_event = asyncio.Event()
+        api.store_lock = asyncio.Lock()
+        api.model_store = ModelStore(os.path.join(self.workdir.name, "model_store"), CBA)
+        api.server_channel = self.channel = StubChannel()
+        self.client = api.app.test_client()
+        self.hidden = HiddenPrints()
+        self.hidden.__enter__()
+
+    def tearDown(self):
+        self.hidden.__exit__(None, None, None)
+        os.chdir(self.cwd)
+        self.workdir.cleanup()
+
+    def model_headers(self, client_id, model_version=0, size=100, digest=None, **extra):
+        """İstemcinin octet-stream header'ları; digest verilirse istemci delta yüklemelerini açmıştır."""
+        headers = {
+            'Content-Type': 'application/octet-stream',
+            'X-Client-Id': str(client_id),
+            'X-Model-Version': str(model_version),
+            'X-Data-Size': str(size),
+            'X-Train-Time': "1.0",
+            'X-Model-Payload': 'model',
+            'X-Model-Compression': "zlib"
+        }
+        if digest is not None:
+            headers['X-Model-Digest'] = digest
+        headers.update(extra)
+        return headers
+
+    async def post_model(self, raw, client_id, model_version=0, size=100, delta=False, **extra):
+        payload, _ = compress_payload(raw, "zlib")
+        digest = hashlib.sha256(raw).hexdigest() if delta else None
+        response = await self.client.post(
+            "/send_model", data=payload, headers=self.model_headers(client_id, model_version, size, digest, **extra))
+        return response.status_code, await response.get_data(as_text=True)
+
+    async def send_model(self, client_id, model, model_version=0, size=100, delta=False):
+        return await self.post_model(model.to_bytes(), client_id, model_version, size, delta)
+
+    async def sent_rounds(self, count=1):
+        """close_round'un başlattığı gönderimler bitene kadar bekler."""
+        for _ in range(500):
+            rounds = self.channel.rounds()
+            if len(rounds) >= count:
+                return rounds
+            await asyncio.sleep(0.01)
+        self.fail(f"{count} tur sunucuya gönderilmedi")
+
+
+class TestLateModels(ApiTestCase):
+
+    async def test_fold_scales_counts_in_buffer_mode(self):
+        api = self.api
+        api.version = 1
+        api.current_round = api.RoundState(1, 1)
+        model = self.models[0]
+
+        self.assertEqual((await self.send_model(1, model, model_version=1, size=900))[0], 200)
+        self.assertEqual((await self.send_model(2, model, model_version=0, size=900))[0], 200)
+
+        models = message_models((await self.sent_rounds())[0])
+        self.assertEqual([m['size'] for m in models], [900, 450])
+        fresh, late = (m['model'].clf.rules for m in models)
+        for fresh_rule, late_rule in zip(fresh, late):
+            self.assertEqual(late_rule.support_count, round(fresh_rule.support_count * 0.5))
+
+        # sayım tabanlı birleştirmede geç model de aynı supportları verir, 1'i geçmez
+        merged = {r.antecedent.string(): r.support for r in count_merge(models).rules()}
+        for rule in model.clf.rules:
+            self.assertAlmostEqual(merged[rule.antecedent.string()], rule.support, places=2)
+
+    async def test_fold_sends_weight_in_passthrough_mode(self):
+        api = self.api
+        api.aggregation_mode = "passthrough"
+        api.version = 1
+        api.current_round = api.RoundState(1, 1)
+
+        await self.send_model(1, self.models[0], model_version=1, size=900)
+        await self.send_model(2, self.models[0], model_version=0, size=900)
+
+        # gövde çözülmeden iletilir, sayımları sunucu info'daki weight ile küçültür
+        infos = [part['info'] for part in (await self.sent_rounds())[0]['parts']]
+        self.assertEqual([info['size'] for info in infos], [900, 450])
+        self.assertNotIn('weight', infos[0])
+        self.assertEqual(infos[1]['weight'], 0.5)
+
+
+def digest(model):
+    return hashlib.sha256(model.to_bytes()).hexdigest()
+
+
+class TestDeltaUploads(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api.models_count = 1
+
+    async def send_delta(self, client_id, model, base, model_version=0):
+        data = model_delta(model, base, digest(base), digest(model))
+        return await self.post_model(data, client_id, model_version, delta=True, **{'X-Model-Payload': 'delta'})
+
+    async def test_model_kept_only_with_delta_enabled(self):
+        await self.send_model(1, self.models[0])
+        self.assertNotIn(1, self.api.client_models)
+
+        await self.send_model(2, self.models[0], delta=True)
+        # tam model çözülmüş kopya olarak değil, gelen sıkıştırılmış gövdesiyle saklanır
+        self.assertEqual(set(self.api.client_models[2]), {'digest', 'payload', 'compression', 'updated'})
+        self.assertEqual(self.api.client_models[2]['digest'], digest(self.models[0]))
+
+    async def test_delta_applied_to_previous_upload(self):
+        base, model = self.models
+        await self.send_model(1, base, delta=True)
+        self.assertEqual((await self.send_delta(1, model, base, model_version=1))[0], 200)
+
+        rounds = await self.sent_rounds(2)
+        rebuilt = message_models(rounds[1])[0]['model']
+        self.assertEqual(rebuilt.to_bytes(), model.to_bytes())
+        self.assertEqual(self.api.client_models[1]['digest'], digest(model))
+
+    async def test_unknown_base_rejected(self):
+        base, model = self.models
+        await self.send_model(1, model, delta=True)
+
+        status, _ = await self.send_delta(1, model, base, model_version=1)
+        self.assertEqual(status, 409)
+
+    async def test_leave_and_expiry_evict(self):
+        await self.send_model(1, self.models[0], delta=True)
+        await self.send_model(2, self.models[0], delta=True)
+
+        response = await self.client.post("/leave?id=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(self.api.client_models), {2})
+
+        self.api.client_model_ttl = 0
+        await self.send_model(3, self.models[0], delta=True)
+        self.assertEqual(set(self.api.client_models), {3})
+
+
+class TestChunkedUploads(ApiTestCase):
+    # sıkıştırılmış model birkaç parçaya bölünsün
+    chunk_size = 100
+
+    def setUp(self):
+        super().setUp()
+        self.api.models_count = 1
+        self.payload, _ = compress_payload(self.models[0].to_bytes(), "zlib")
+        self.chunks = [self.payload[i:i + self.chunk_size] for i in range(0, len(self.payload), self.chunk_size)]
+
+    async def initiate(self, sha256=None):
+        headers = self.model_headers(1, **{
+            'X-Upload-Length': str(len(self.payload)),
+            'X-Upload-Sha256': sha256 or hashlib.sha256(self.payload).hexdigest()
+        })
+        response = await self.client.post("/uploads", headers=headers)
+        self.assertEqual(response.status_code, 201)
+        return (await response.get_json())['upload_id']
+
+    async def put(self, upload_id, index, chunk=None):
+        chunk = self.chunks[index] if chunk is None else chunk
+        response = await self.client.put(
+            f"/uploads/{upload_id}?offset={index * self.chunk_size}", data=chunk,
+            headers={'X-Chunk-Sha256': hashlib.sha256(self.chunks[index]).hexdigest()})
+        return response.status_code, (await response.get_json() if response.is_json else None)
+
+    async def offset(self, upload_id):
+        response = await self.client.get(f"/uploads/{upload_id}")
+        return response.status_code, (await response.get_json() if response.is_json else None)
+
+    async def commit(self, upload_id):
+        response = await self.client.post(f"/uploads/{upload_id}/commit")
+        return response.status_code, await response.get_data(as_text=True)
+
+    async def test_out_of_order_and_duplicate_chunks(self):
+        upload_id = await self.initiate()
+
+        # ileri atlayan parça kabul edilmez, API'deki offset döner
+        self.assertEqual(await self.put(upload_id, 1), (409, {'offset': 0}))
+        self.assertEqual(await self.put(upload_id, 0), (200, {'offset': self.chunk_size}))
+        # aynı parça tekrar gelirse eklenmez
+        self.assertEqual(await self.put(upload_id, 0), (409, {'offset': self.chunk_size}))
+        # bozuk parça eklenmez
+        self.assertEqual(await self.put(upload_id, 1, b"x" * self.chunk_size), (422, {'offset': self.chunk_size}))
+
+        for index in range(1, len(self.chunks)):
+            self.assertEqual((await self.put(upload_id, index))[0], 200)
+
+        self.assertEqual((await self.commit(upload_id))[0], 200)
+        rebuilt = message_models((await self.sent_rounds())[0])[0]['model']
+        self.assertEqual(rebuilt.to_bytes(), self.models[0].to_bytes())
+
+    async def test_resume_after_partial_upload(self):
+        upload_id = await self.initiate()
+        await self.put(upload_id, 0)
+
+        # eksik yükleme commit edilemez, istemci offset'ten devam eder
+        self.assertEqual((await self.commit(upload_id))[0], 400)
+        status, body = await self.offset(upload_id)
+        self.assertEqual((status, body), (200, {'offset': self.chunk_size, 'length': len(self.payload)}))
+
+        for index in range(body['offset'] // self.chunk_size, len(self.chunks)):
+            await self.put(upload_id, index)
+
+        result = await self.commit(upload_id)
+        self.assertEqual(result[0], 200)
+        # commit cevabı kaybolup tekrar istenirse model ikinci kez eklenmez
+        self.assertEqual(await self.commit(upload_id), result)
+        await self.sent_rounds()
+        await asyncio.sleep(0.05)
+        self.assertEqual(len(self.channel.rounds()), 1)
+
+    async def test_digest_mismatch_on_commit(self):
+        upload_id = await self.initiate(sha256=hashlib.sha256(b"other").hexdigest())
+        for index in range(len(self.chunks)):
+            await self.put(upload_id, index)
+
+        self.assertEqual(await self.commit(upload_id), (422, "Upload hash mismatch"))
+        # yükleme baştan yapılmalı
+        self.assertEqual((await self.offset(upload_id))[0], 404)
+        self.assertEqual(self.channel.sent, [])
+
+    async def test_expired_upload_removed(self):
+        upload_id = await self.initiate()
+        await self.put(upload_id, 0)
+
+        # süresi dolan yüklemeler yeni bir yükleme başlatılırken silinir
+        self.api.upload_ttl = 0
+        await asyncio.sleep(0.01)
+        other_id = await self.initiate()
+
+        self.assertEqual((await self.offset(upload_id))[0], 404)
+        self.assertEqual((await self.put(upload_id, 1))[0], 404)
+        self.assertEqual(await self.offset(other_id), (200, {'offset': 0, 'length': len(self.payload)}))
+
+
+class TestRoundLifecycle(ApiTestCase):
+
+    async def test_round_closes_at_models_count(self):
+        self.api.models_count = 2
+
+        await self.send_model(1, self.models[0])
+        self.assertEqual(self.channel.sent, [])
+        await self.send_model(2, self.models[1])
+
+        data = (await self.sent_rounds())[0]
+        self.assertEqual([m['id'] for m in data['models']], [1, 2])
+        self.assertEqual(self.api.current_round.number, 2)
+
+    async def test_deadline_closes_round_once_quorum_met(self):
+        api = self.api
+        api.models_count = 3
+        api.round_deadline = 0.05
+        api.quorum_clients = 2
+
+        await self.send_model(1, self.models[0])
+        await asyncio.sleep(0.1)
+        # süre doldu ama yeter sayı yok, tur açık kalır
+        self.assertTrue(api.current_round.expired)
+        self.assertEqual(self.channel.sent, [])
+
+        # yeter sayıya ulaşan ilk modelde models_count beklenmeden kapanır
+        await self.send_model(2, self.models[1])
+        data = (await self.sent_rounds())[0]
+        self.assertEqual([m['id'] for m in data['models']], [1, 2])
+
+    async def test_deadline_closes_round_with_arrived_models(self):
+        self.api.models_count = 3
+        self.api.round_deadline = 0.05
+
+        await self.send_model(1, self.models[0])
+
+        data = (await self.sent_rounds())[0]
+        self.assertEqual([m['id'] for m in data['models']], [1])
+
+    async def test_late_model_dropped(self):
+        api = self.api
+        api.late_policy = "drop"
+        api.version = 1
+        api.current_round = api.RoundState(1, 1)
+
+        self.assertEqual(await self.send_model(1, self.models[0], model_version=0),
+                         (200, "Model dropped (late by 1 round)"))
+        self.assertEqual(len(api.current_round), 0)
+
+    async def test_selected_clients_only(self):
+        api = self.api
+        api.models_count = 1
+        api.selection_policy = "fastest"
+        api.clients_per_round = 1
+        api.client_stats[2] = {'size': 100, 'time': 0.5}
+
+        # tur kapanınca sonraki turun katılımcısı eğitimi en hızlı istemci olur
+        await self.send_model(1, self.models[0])
+        await self.sent_rounds()
+
+        selected = {}
+        for client_id in (1, 2):
+            response = await self.client.get(f"/round?id={client_id}")
+            selected[client_id] = (await response.get_json())['selected']
+        self.assertEqual(selected, {1: False, 2: True})
+
+        self.assertEqual(await self.send_model(1, self.models[0]), (200, "Model not selected for this round"))
+        self.assertEqual((await self.send_model(2, self.models[1]))[0], 200)
+        # seçilen istemcilerin hepsi gönderince tur models_count'tan bağımsız kapanır
+        rounds = await self.sent_rounds(2)
+        self.assertEqual([m['id'] for m in rounds[1]['models']], [2])
+
+    async def test_async_mode_sends_staleness_decay(self):
+        api = self.api
+        api.federation_mode = "async"
+        api.staleness_decay = 0.25
+        api.version = 3
+
+        await self.send_model(1, self.models[0], model_version=1)
+
+        # her model tek başına gönderilir, boyutunu birleştirme anındaki versiyona göre sunucu küçültür
+        data = (await self.sent_rounds())[0]
+        self.assertEqual(data['staleness_decay'], 0.25)
+        model, = data['models']
+        self.assertEqual((model['size'], model['staleness']), (100, 2))
+
+
+class TestAggregationModes(ApiTestCase):
+
+    async def merged_rules(self, aggregation_mode):
+        """İki modelli (biri bir tur geç) turu verilen modda kapatır, sunucunun sayım tabanlı birleştirmesinin kurallarını döndürür."""
+        api = self.api
+        api.aggregation_mode = aggregation_mode
+        api.version = 1
+        api.current_round = api.RoundState(1, 1)
+        api.server_channel = self.channel = StubChannel()
+
+        await self.send_model(1, self.models[0], model_version=1, size=900)
+        await self.send_model(2, self.models[1], model_version=0, size=1301)
+
+        data = (await self.sent_rounds())[0]
+        # stream modunda kurallar turun kısmi istatistiğinde gelir
+        aggregate = data['aggregate'] if aggregation_mode == "stream" else count_merge(message_models(data))
+        return aggregate.size, [(r.antecedent.string(), r.consequent.string(), r.support_count, r.antecedent_count,
+                                 r.support, r.confidence) for r in aggregate.rules()]
+
+    async def test_modes_merge_to_same_model(self):
+        merged = {}
+        for aggregation_mode in ("buffer", "stream", "passthrough"):
+            merged[aggregation_mode] = await self.merged_rules(aggregation_mode)
+
+        self.assertTrue(merged["buffer"][1])
+        self.assertEqual(merged["stream"], merged["buffer"])
+        self.assertEqual(merged["passthrough"], merged["buffer"])
+
+
+class TestGetModel(ApiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.api.global_model = self.models[0]
+        self.api.version = 2
+
+    async def get_model(self, model_version, etag=None):
+        headers = {'Accept': 'application/octet-stream', 'X-Accept-Model-Compression': "zlib"}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        return await self.client.get(f"/get_model?version={model_version}", headers=headers)
+
+    async def test_same_content_not_sent_again(self):
+        response = await self.get_model(0)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        # birleştirme kuralları değiştirmedi: yeni versiyonun gövdesi gönderilmez, sadece versiyonu bildirilir
+        self.api.global_model = CBA.from_bytes(self.models[0].to_bytes())
+        self.api.version = 3
+        response = await self.get_model(2, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers['X-Model-Version'], "3")
+        self.assertEqual(await response.get_data(), b"")
+
+        self.api.global_model = self.models[1]
+        self.api.version = 4
+        response = await self.get_model(3, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    async def test_etag_depends_on_codec(self):
+        etag = (await self.get_model(0)).headers['ETag']
+
+        response = await self.client.get("/get_model?version=0", headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    async def test_current_version_gets_no_content(self):
+        response = await self.get_model(2)
+        self.assertEqual(response.status_code, 204)
@@ -1,35 +1,54 @@
 import pandas as pd
 from pyarc import CBA, TransactionDB
+from pyarc.algorithms import model_delta, compress_payload, decompress_payload, negotiate_codec, iter_chunks, CHUNK_SIZE
 import pickle
-import random
+import hashlib
 import requests
+import random
 import base64
 import time
+from Transport_class import Transport
+
+
+def print_transfer(name, stats):
+    """Bir model transferinin ham/sıkıştırılmış boyutunu ve codec süresini yazdırır."""
+    print(f"{name}: {stats['raw_size']} -> {stats['compressed_size']} bayt "
+          f"({stats['codec']}, {stats['time']:.4f} sn)")
+
 
 class Client:
     """
     Federated Learning istemcisi.
     Model eğitir, gönderir, alır ve test eder.
     """
-    def __init__(self, algorithm):
+    def __init__(self, algorithm, delta=False, compression="zlib", compression_level=None, transport=None,
+                 long_poll=30, resumable=True):
         self.df = None            # Eğitim verisi DataFrame
         self.algorithm = algorithm
+        self.delta = delta        # True ise sadece bir önceki gönderilen modele göre değişen kurallar gönderilir
+        self.compression = compression              # Model transferlerinde kullanılan codec (zlib, lzma, zstd, none)
+        self.compression_level = compression_level  # Sıkıştırma seviyesi (None: codec'in varsayılanı)
         self.target_col = ""      # Hedef sütun (etiket)
         self.model = None         # Eğitimli model
         self.size = 0             # Veri setinin boyutu
         self.version = 0          # Model versiyonu
+        self.etag = None          # En son indirilen model gövdesinin (içeriğe göre) ETag'i, If-None-Match ile gönderilir
         self.time = 0             # Model eğitme süresi
         self.dataset = ""         # Dataset dosya adı/id
+        self.transport = transport or Transport()  # API ile HTTP iletişimi (bağlantı havuzu, tekrar deneme, gecikme ölçümü)
+        self.long_poll = long_poll  # get_model'de yeni versiyon için API'de beklenecek süre (sn), 0: beklemeden dön
+        self.resumable = resumable  # True ise model parça parça, kopan yerden devam ettirilebilir şekilde yüklenir
+        self.upload = None          # Yarım kalan yükleme (gövde, header'lar, upload_id), tekrar denemede devam edilir
+        self.uploaded = None        # API'ye son gönderilen model ve hash'i, delta buna göre hesaplanır
 
     def first(self):
         """
         API'den eğitim parametrelerini ve dataset adını alır,
         veri setini yükler ve özellik seçimi uygular.
+        Başarılı olursa True döner.
         """
-        url = 'http://localhost:5000/'  # API url'si
-
         # HTTP GET isteği ile parametreleri çek
-        response = requests.get(url)
+        response = self.transport.request("first", "GET", "/")
 
         if response.status_code == 200:
             data = response.json()
@@ -43,6 +62,22 @@ class Client:
             df = pd.read_csv(self.dataset)           # veri setini yükle
             # Özellik seçimi (gereksiz özellikleri drop et)
             self.df = df.drop(columns=data["feature_selection"])
+            return True
+        return False
+
+    def selected(self):
+        """
+        API'ye bu turda seçilip seçilmediğini sorar. Seçilmediyse eğitim ve gönderim atlanır.
+        Soru cevaplanamazsa (ör. eski API) tura katılınır.
+        """
+        try:
+            response = self.transport.request("round", "GET", f"/round?id={self.id}")
+        except requests.RequestException as e:
+            print(f"Tur bilgisi alınamadı, tura katılınıyor: {e}")
+            return True
+        if response.status_code != 200:
+            return True
+        return response.json()["selected"]
 
     def train_model(self):
         """
@@ -67,57 +102,221 @@ class Client:
 
         self.model = model
         self.time = end_time - start_time
+        self.upload = None
         print(f"Model eğitildi ({self.time:.2f} sn)")
 
     def send_model(self):
         """
         Eğitilen modeli API'ye gönderir.
+        Model application/octet-stream gövdesi olarak parça parça gönderilir,
+        üst bilgiler (id, veri boyutu, eğitim süresi, versiyon, codec) header'larda taşınır.
+        resumable ise yükleme parçalar halinde yapılır; bağlantı koparsa tekrar denemede model yeniden
+        kodlanmaz, API'nin onayladığı son offset'ten devam edilir.
         """
-        url = 'http://localhost:5000/send_model'
-        # Modeli pickle ile binary yap
-        model_data = pickle.dumps(self.model)
+        if self.upload is not None:
+            # Önceki denemede yarım kalan yüklemeye devam et
+            digest = self.upload['headers'].get('X-Model-Digest')
+            response = self._upload()
+        else:
+            # Modeli sütunlu ikili formata çevir (pickle+hex'e göre çok daha küçük)
+            model_data = self.model.to_bytes()
+            digest = hashlib.sha256(model_data).hexdigest()
+            field = 'model'
+            compressed, stats = compress_payload(model_data, self.compression, self.compression_level)
 
-        payload = {
-            'size': self.size,
-            'model': model_data.hex(),    # binary'i hex'e çevir
-            'version': self.version,
-            'time': self.time,
-            'id': self.id
-        }
+            if self.delta and self.uploaded is not None:
+                # Sadece bir önceki gönderilen modelden farklı kurallar gönderilir (aynı kurallar sıra numarasıyla)
+                delta = model_delta(self.model, self.uploaded['model'], self.uploaded['digest'], digest)
+                delta_compressed, delta_stats = compress_payload(delta, self.compression, self.compression_level)
+                if len(delta_compressed) < len(compressed):
+                    print(f"Delta gönderiliyor: {len(delta_compressed)} bayt (tam model {len(compressed)} bayt)")
+                    field, compressed, stats = 'delta', delta_compressed, delta_stats
+                else:
+                    print("Delta tam modelden büyük, tam model gönderiliyor.")
 
-        # POST isteğiyle modeli gönder
-        response = requests.post(url, json=payload)
+            headers = {
+                'Content-Type': 'application/octet-stream',
+                'X-Client-Id': str(self.id),
+                'X-Model-Version': str(self.version),
+                'X-Data-Size': str(self.size),
+                'X-Train-Time': str(self.time),
+                'X-Model-Payload': field,
+                'X-Model-Compression': self.compression
+            }
+            if stats['level'] is not None:
+                # "none" codec'inin seviyesi yoktur
+                headers['X-Model-Compression-Level'] = str(stats['level'])
+            if self.delta:
+                # Hash, API'nin modeli sonraki delta'nın temeli olarak saklaması için (delta'ya katılım)
+                headers['X-Model-Digest'] = digest
+            print_transfer("Gönderilen model", stats)
+
+            if self.resumable:
+                self.upload = {'payload': compressed, 'headers': headers, 'id': None}
+                response = self._upload()
+            else:
+                # POST isteğiyle modeli parça parça gönder (chunked transfer)
+                response = self.transport.request("send_model", "POST", "/send_model",
+                                                  data=iter_chunks(compressed), headers=headers)
+
+        if response is None:
+            print("Model yüklemesi tamamlanamadı, tekrar denemede devam edilecek.")
+            return False
+        if response.status_code == 415:
+            # API bu codec'i desteklemiyor, desteklediği codec'lerden birine geç
+            codec = negotiate_codec(response.headers.get('X-Accept-Model-Compression'))
+            if codec is None or codec == self.compression:
+                print("Ortak sıkıştırma codec'i bulunamadı.")
+                return False
+            print(f"{self.compression} desteklenmiyor, {codec} ile tekrar gönderiliyor.")
+            self.compression, self.compression_level = codec, None
+            return self.send_model()
+        if response.status_code == 409:
+            # API delta'nın dayandığı modele sahip değil, tam modeli gönder
+            print("Delta uygulanamadı, tam model gönderiliyor.")
+            self.uploaded = None
+            return self.send_model()
         if response.status_code == 200:
             print("Model gönderildi. Sunucu cevabı:", response.text)
+            if self.delta:
+                self.uploaded = {'digest': digest, 'model': self.model}
             return True
         else:
             print("Model daha önce gönderildi veya hata oluştu.")
             return False
 
+    def leave(self):
+        """
+        Eğitim bittiğinde API'ye ayrıldığını bildirir; API delta temeli olarak sakladığı modeli siler.
+        Bildirim yapılamazsa API modeli bir süre sonra kendisi siler.
+        """
+        try:
+            response = self.transport.request("leave", "POST", f"/leave?id={self.id}")
+        except requests.RequestException as e:
+            print(f"Ayrılma bildirilemedi: {e}")
+            return
+        if response.status_code == 200:
+            print("API'ye ayrıldığı bildirildi.")
+
+    def _upload(self):
+        """
+        self.upload'daki gövdeyi API'ye parça parça yükler ve commit eder.
+        Yükleme daha önce başlatıldıysa API'ye ulaşan son offset sorulup oradan devam edilir.
+        Commit (veya başlatma) cevabını döndürür; parça gönderilemezse None döner ve yükleme saklanır.
+        Bağlantı hataları fırlatılır, yükleme saklandığı için tekrar denemede devam edilir.
+        """
+        upload = self.upload
+        payload = upload['payload']
+
+        offset = 0
+        if upload['id'] is not None:
+            response = self.transport.request("upload_status", "GET", f"/uploads/{upload['id']}")
+            if response.status_code == 200:
+                offset = response.json()['offset']
+                print(f"Yükleme {offset}/{len(payload)} bayttan devam ediyor.")
+            else:
+                # API yüklemeyi silmiş (süresi dolmuş veya API yeniden başlatılmış), baştan başlanır
+                upload['id'] = None
+
+        if upload['id'] is None:
+            headers = dict(upload['headers'],
+                           **{'X-Upload-Length': str(len(payload)),
+                              'X-Upload-Sha256': hashlib.sha256(payload).hexdigest()})
+            response = self.transport.request("upload_initiate", "POST", "/uploads", headers=headers)
+            if response.status_code != 201:
+                self.upload = None
+                return response
+            reply = response.json()
+            upload['id'], upload['chunk_size'] = reply['upload_id'], reply['chunk_size']
+
+        view = memoryview(payload)
+        while offset < len(payload):
+            chunk = view[offset:offset + upload['chunk_size']]
+            response = self.transport.request(
+                "upload_chunk", "PUT", f"/uploads/{upload['id']}?offset={offset}", data=bytes(chunk),
+                headers={'Content-Type': 'application/octet-stream',
+                         'X-Chunk-Sha256': hashlib.sha256(chunk).hexdigest()})
+            if response.status_code not in (200, 409):
+                # Parça bozuk geldi (422) veya hata oluştu, tekrar denemede API'nin offset'inden devam edilir
+                return None
+            # 409: API'deki offset farklı, API'nin onayladığı yerden devam edilir
+            offset = response.json()['offset']
+
+        response = self.transport.request("upload_commit", "POST", f"/uploads/{upload['id']}/commit")
+        if response.status_code == 404:
+            upload['id'] = None
+            return None
+        self.upload = None
+        return response
+
     def get_model(self):
         """
         API'den en güncel global modeli ister.
         Versiyonu güncelse model güncellenir.
         """
-        url = f'http://localhost:5000/get_model?version={self.version}'
+        # Tercih edilen codec önce, API hangisini destekliyorsa onu kullanır
+        accepted = list(dict.fromkeys([self.compression, "zlib", "none"]))
+        headers = {
+            'Accept': 'application/octet-stream',
+            'X-Accept-Model-Compression': ", ".join(accepted)
+        }
+        if self.compression_level is not None:
+            headers['X-Model-Compression-Level'] = str(self.compression_level)
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+
+        path = f"/get_model?version={self.version}"
+        timeout = self.transport.timeout
+        if self.long_poll:
+            # Long-poll: API yeni versiyon gelene kadar cevabı bekletir, tekrar tekrar sormaya gerek kalmaz
+            path += f"&wait={self.long_poll}"
+            timeout = self.transport.timeout_for(self.long_poll)
+
+        response = self.transport.request("get_model", "GET", path, headers=headers, stream=True, timeout=timeout)
 
-        response = requests.get(url)
+        with response:
+            return self._read_model(response)
 
+    def _read_model(self, response):
+        """
+        get_model cevabını işler. Bağlantının havuza geri dönmesi için cevap get_model'de kapatılır.
+        """
         if response.status_code == 200:
-            data = response.json()
+            if response.headers.get('Content-Type') == 'application/octet-stream':
+                # Model ham gövde olarak parça parça okunur, versiyon header'da
+                data = {"version": int(response.headers['X-Model-Version']),
+                        "format": response.headers.get('X-Model-Format')}
+                model_data = bytearray()
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    model_data += chunk
+            else:
+                # Eski API'ler modeli base64 ile JSON içinde gönderir
+                data = response.json()
+                model_data = base64.b64decode(data["model"])
             version = data["version"]
-            model_base64 = data["model"]
             print(f"Yeni modelin versiyonu: {version}")
 
             self.version = version
+            self.etag = response.headers.get('ETag')
 
-            # Modeli base64'ten ve pickle'dan geri çevir
-            model_data = base64.b64decode(model_base64)
-            self.model = pickle.loads(model_data)
+            # Modeli ikili formattan (eski API'lerde pickle'dan) geri çevir
+            codec = response.headers.get('X-Model-Compression')
+            if codec is not None:
+                model_data, stats = decompress_payload(model_data, codec)
+                print_transfer("İndirilen model", stats)
+            if data.get("format") == "binary":
+                self.model = CBA.from_bytes(model_data)
+            else:
+                self.model = pickle.loads(model_data)
 
             print("Model başarıyla indirildi.")
             return True
-        elif response.status_code == 204:
+        elif response.status_code == 304 and 'X-Model-Version' in response.headers:
+            # Yeni versiyonun modeli elimizdekiyle aynı, sadece versiyon ilerler
+            self.version = int(response.headers['X-Model-Version'])
+            print(f"Yeni versiyon {self.version} elimizdeki modelle aynı, indirilmedi.")
+            return True
+        elif response.status_code in (204, 304):
             print("Zaten güncel model kullanılıyor.")
             return False
         else:
@@ -0,0 +1,117 @@
+import time
+import random
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class Transport:
+    """
+    İstemcinin API ile HTTP iletişimi.
+    Tek bir requests.Session (keep-alive, bağlantı havuzu) kullanır, her isteğe zaman aşımı uygular,
+    başarısız/204 cevaplarda üstel artan ve rastgele (jitter) beklemeyle tekrar dener
+    ve her çağrının gecikmesini ölçer.
+    """
+    def __init__(self, base_url="http://localhost:5000", timeout=(3.05, 60), pool_size=4,
+                 backoff=0.5, max_backoff=30, max_attempts=None):
+        """
+        base_url: API adresi.
+        timeout: (bağlanma, okuma) zaman aşımı, saniye.
+        pool_size: Havuzda tutulacak en fazla bağlantı sayısı.
+        backoff: İlk tekrar denemedeki en uzun bekleme, her denemede iki katına çıkar.
+        max_backoff: Bir bekleme için üst sınır.
+        max_attempts: retry'daki en fazla deneme sayısı (None: başarılı olana kadar).
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # Çağrı adı -> istek sayısı, hata sayısı, tekrar deneme sayısı ve gecikmeler (sn)
+        self.metrics = {}
+
+    def request(self, name, method, path, **kwargs):
+        """
+        Session üzerinden istek yapar. Gecikme (cevap header'larının gelmesine kadar geçen süre)
+        name altında kaydedilir. Bağlantı/zaman aşımı hataları sayılıp tekrar fırlatılır.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        metric = self._metric(name)
+        metric["calls"] += 1
+
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException:
+            metric["errors"] += 1
+            raise
+        metric["latencies"].append(time.perf_counter() - start)
+
+        return response
+
+    def timeout_for(self, wait):
+        """Sunucuda wait saniye bekleyebilecek (long-poll) istekler için okuma zaman aşımını uzatır."""
+        connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+        return connect, read + wait
+
+    def retry(self, name, call):
+        """
+        call() doğru (truthy) bir değer dönene kadar tekrarlar. 204 gibi başarısız cevaplarda ve
+        bağlantı hatalarında "full jitter" ile bekler: [0, min(max_backoff, backoff * 2^deneme)].
+        max_attempts aşılırsa False döner.
+        """
+        attempt = 0
+        while True:
+            try:
+                result = call()
+                if result:
+                    return result
+            except requests.RequestException as e:
+                print(f"{name} isteği başarısız: {e}")
+
+            attempt += 1
+            if self.max_attempts is not None and attempt >= self.max_attempts:
+                print(f"{name}: {attempt} denemede başarılı olunamadı.")
+                return False
+
+            self._metric(name)["retries"] += 1
+            time.sleep(self.delay(attempt))
+
+    def delay(self, attempt):
+        """attempt. tekrar denemeden önceki bekleme süresi."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    def report(self):
+        """Çağrı bazlı istek, hata, tekrar sayıları ve gecikme istatistikleri (ortalama, p50, p95, en fazla)."""
+        report = {}
+        for name, metric in self.metrics.items():
+            latencies = sorted(metric["latencies"])
+            summary = {key: metric[key] for key in ("calls", "errors", "retries")}
+            if latencies:
+                summary.update({
+                    "mean": sum(latencies) / len(latencies),
+                    "p50": latencies[len(latencies) // 2],
+                    "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                    "max": latencies[-1]
+                })
+            report[name] = summary
+        return report
+
+    def print_report(self):
+        for name, summary in self.report().items():
+            line = f"{name}: {summary['calls']} istek, {summary['errors']} hata, {summary['retries']} tekrar"
+            if "mean" in summary:
+                line += (f", gecikme ort {summary['mean'] * 1000:.1f} ms, p50 {summary['p50'] * 1000:.1f} ms, "
+                         f"p95 {summary['p95'] * 1000:.1f} ms, en fazla {summary['max'] * 1000:.1f} ms")
+            print(line)
+
+    def close(self):
+        self.session.close()
+
+    def _metric(self, name):
+        return self.metrics.setdefault(name, {"calls": 0, "errors": 0, "retries": 0, "latencies": []})
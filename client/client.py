@@ -1,12 +1,21 @@
 from Client_class import Client
+from Transport_class import Transport
 import time
 
 # ---- İstemci Nesnesini Oluştur ----
 # Algoritma tipi (ör: "m1") ile Client nesnesi başlatılıyor
-client = Client(algorithm="m1")
+# delta=True: İkinci turdan itibaren sadece bir önceki gönderilen modele göre değişen kurallar gönderilir
+# (delta tam modelden büyükse tam model gönderilir)
+# compression: Model transferlerinde kullanılacak codec ("zlib", "lzma", "zstd" (zstandard kuruluysa) veya "none")
+# transport: API ile HTTP iletişimi; timeout (bağlanma, okuma) ve tekrar denemelerdeki üstel bekleme ayarları
+# resumable: Model parça parça yüklenir, bağlantı koparsa API'nin onayladığı son offset'ten devam edilir
+# long_poll: get_model isteği, yeni global model gelene kadar en fazla bu kadar saniye API'de bekler (0: kapalı)
+transport = Transport("http://localhost:5000", timeout=(3.05, 60), backoff=0.5, max_backoff=30)
+client = Client(algorithm="m1", delta=False, compression="zlib", transport=transport, long_poll=30,
+                resumable=True)
 
 # ---- Sunucudan Eğitim Parametrelerini ve Veriyi Al ----
-client.first()
+transport.retry("first", client.first)
 print("Kullanılan veri seti:", client.dataset)
 tour = 0  # Eğitim turu (epoch)
 print("İstemci ID:", client.id)
@@ -14,18 +23,15 @@ print("İstemci ID:", client.id)
 # ---- Eğitim Döngüsü (Tur Sayısı Kadar) ----
 while tour != client.tour:
 
-    # 1. Modeli eğit
-    client.train_model()
+    # 1-2. Bu turda seçildiyse modeli eğit ve gönder (başarılı olana kadar, artan aralıklarla dener)
+    if client.selected():
+        client.train_model()
+        transport.retry("send_model", client.send_model)
+    else:
+        print("Bu turda seçilmedi, yeni global model bekleniyor.")
 
-    # 2. Model gönderimi (başarılı olana kadar dener)
-    send_model_b = False
-    while not send_model_b:
-        send_model_b = client.send_model()
-
-    # 3. Güncel modeli sunucudan al (başarılı olana kadar dener)
-    get_model_b = False
-    while not get_model_b:
-        get_model_b = client.get_model()
+    # 3. Güncel modeli sunucudan al (long-poll ile yeni versiyonu bekler, gelmezse artan aralıklarla tekrar dener)
+    transport.retry("get_model", client.get_model)
 
     # 4. Sonraki tura geç ve bir süre bekle
     tour += 1
@@ -33,3 +39,10 @@ while tour != client.tour:
 
 # ---- Eğitim Sonrası Test ----
 client.test_model()
+
+# ---- API'ye Ayrıldığını Bildir (sakladığı delta temeli silinir) ----
+client.leave()
+
+# ---- İstek İstatistikleri ----
+transport.print_report()
+transport.close()
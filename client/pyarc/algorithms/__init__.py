@@ -1,4 +1,6 @@
 from .m1algorithm import *
 from .m2algorithm import *
 from .rule_algorithm import *
-from .rule_generation import *
\ No newline at end of file
+from .rule_generation import *
+from .rule_delta import *
+from .model_codec import *
@@ -19,7 +19,7 @@ def createCARs(rules):
     """
     CARs = []
     for rule in rules:
-        con_tmp, ant_tmp, support, confidence = rule
+        con_tmp, ant_tmp, support, confidence = rule[:4]
 
         con = Consequent(*con_tmp.split(":=:"))
 
@@ -29,6 +29,10 @@ def createCARs(rules):
         ant = Antecedent(ant_items)
 
         CAR = ClassAssocationRule(ant, con, support=support, confidence=confidence)
+
+        if len(rule) > 4:
+            CAR.support_count, CAR.antecedent_count = rule[4:6]
+
         CARs.append(CAR)
 
     CARs.sort(reverse=True)
@@ -66,8 +70,10 @@ def generateCARs(transactionDB, support=1, confidence=50, maxlen=10, **kwargs):
     appear = transactionDB.appeardict
 
     # pyarc uses appriori by default.
+    # absolute rule (a) and antecedent (b) counts are reported
+    # as well, so that the rules can be merged exactly later
     rules = fim.apriori(transactionDB.string_representation, supp=support, conf=confidence, mode="o", target="r",
-                        report="sc", appear=appear, **kwargs, zmax=maxlen)
+                        report="scab", appear=appear, **kwargs, zmax=maxlen)
     # rules = fim.eclat(transactionDB.string_representation, supp=support, conf=confidence, mode="o", target="r", report="sc", appear=appear, **kwargs, zmax=maxlen)
 
     return createCARs(rules)
@@ -3,7 +3,9 @@ from .algorithms import (
     M2Algorithm,
     generateCARs,
     createCARs,
-    top_rules
+    top_rules,
+    encode_model,
+    decode_model
 )
 from .data_structures import TransactionDB
 
@@ -38,6 +40,7 @@ class CBA():
         self.maxlen = maxlen
         self.clf = None
         self.target_class = None
+        self.size = 0
 
         self.available_algorithms = {
             "m1": M1Algorithm,
@@ -88,6 +91,7 @@ class CBA():
         if not isinstance(transactions, TransactionDB):
             raise Exception("transactions must be of type TransactionDB")
         self.target_class = transactions.header[-1]
+        self.size = len(transactions)
         used_algorithm = self.available_algorithms[self.algorithm]
         cars = None
         if len(top_rules) > 0:
@@ -132,6 +136,18 @@ class CBA():
 
         return self.clf.predict_matched_rule_all(X)
 
+    def to_bytes(self):
+        """Encodes the model into the compact columnar
+        binary format used for sending models between
+        clients, API and server.
+        """
+        return encode_model(self)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Decodes a model encoded with CBA.to_bytes."""
+        return decode_model(data, cls())
+
     def update_cba_model(self, n1, new_transactions, use_top_rules=False):
         """
         This function updates CBA model with new coming training data. If use_top_rules parameter is True, top_rules
@@ -0,0 +1,61 @@
+import unittest
+import copy
+import hashlib
+import pandas as pd
+from pyarc import CBA
+from pyarc.algorithms import model_delta, apply_model_delta, delta_digests, rule_key, compress_payload
+from pyarc.data_structures import TransactionDB
+import os
+
+dataset_file = os.path.dirname(os.path.realpath(__file__)) + "/data/titanic.csv"
+
+
+def digest(model):
+    return hashlib.sha256(model.to_bytes()).hexdigest()
+
+
+class TestRuleDelta(unittest.TestCase):
+
+    def fit(self, df):
+        return CBA(support=0.05, confidence=0.5).fit(TransactionDB.from_DataFrame(df))
+
+    def rule_stats(self, model):
+        return [
+            (rule_key(r), r.support, r.confidence, r.support_count, r.antecedent_count)
+            for r in model.clf.rules
+        ]
+
+    def test_apply_rebuilds_model(self):
+        df = pd.read_csv(dataset_file).sample(frac=1, random_state=1)
+        base = self.fit(df.iloc[:900])
+        model = self.fit(df.iloc[900:])
+
+        data = model_delta(model, base, digest(base), digest(model))
+        self.assertEqual(delta_digests(data), (digest(base), digest(model)))
+
+        base_rules = copy.deepcopy(self.rule_stats(base))
+        rebuilt = apply_model_delta(base, data, CBA())
+
+        self.assertEqual(self.rule_stats(rebuilt), self.rule_stats(model))
+        self.assertEqual(rebuilt.clf.default_class, model.clf.default_class)
+        # base model is left intact
+        self.assertEqual(self.rule_stats(base), base_rules)
+
+    def test_retrained_model_is_smaller_than_full(self):
+        df = pd.read_csv(dataset_file)
+        base = self.fit(df)
+        # retraining on the same data gives new rule ids only
+        model = self.fit(df)
+
+        data = model_delta(model, base, digest(base), digest(model))
+        rebuilt = apply_model_delta(base, data, CBA())
+
+        self.assertEqual(self.rule_stats(rebuilt), self.rule_stats(model))
+        self.assertLess(len(compress_payload(data)[0]), len(compress_payload(model.to_bytes())[0]))
+
+    def test_truncated_delta(self):
+        model = self.fit(pd.read_csv(dataset_file))
+        data = model_delta(model, model, digest(model), digest(model))
+
+        self.assertRaises(Exception, apply_model_delta, model, data[:-1], CBA())
+        self.assertRaises(Exception, delta_digests, data[:10])
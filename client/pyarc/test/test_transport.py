@@ -0,0 +1,81 @@
+import unittest
+from unittest import mock
+import requests
+from utils import HiddenPrints
+from Transport_class import Transport
+
+
+def response(status_code):
+    return mock.Mock(status_code=status_code, ok=status_code < 400)
+
+
+class TestTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = Transport("http://api/", backoff=0.5, max_backoff=4)
+        self.transport.session = mock.Mock(spec=requests.Session)
+        # beklemeler kaydedilir, test beklemez
+        patcher = mock.patch("Transport_class.time.sleep")
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def retry(self, name="model"):
+        """İsteği 2xx cevap gelene kadar tekrarlar (istemcinin çağrıları gibi başarıyı döndürür)."""
+        with HiddenPrints():
+            return self.transport.retry(name, lambda: self.transport.request(name, "GET", "/get_model").ok)
+
+    def test_retries_on_server_error(self):
+        self.transport.session.request.side_effect = [response(503), response(500), response(200)]
+
+        self.assertTrue(self.retry())
+
+        self.assertEqual(self.transport.session.request.call_count, 3)
+        self.transport.session.request.assert_called_with("GET", "http://api/get_model", timeout=(3.05, 60))
+        self.assertEqual(self.sleep.call_count, 2)
+        metric = self.transport.metrics["model"]
+        self.assertEqual((metric["calls"], metric["errors"], metric["retries"], len(metric["latencies"])), (3, 0, 2, 3))
+
+    def test_retries_on_connection_error(self):
+        self.transport.session.request.side_effect = [
+            requests.ConnectionError("refused"), requests.Timeout("read timeout"), response(200)]
+
+        self.assertTrue(self.retry())
+
+        # hatalı isteklerin gecikmesi ölçülmez
+        metric = self.transport.metrics["model"]
+        self.assertEqual((metric["calls"], metric["errors"], metric["retries"], len(metric["latencies"])), (3, 2, 2, 1))
+
+    def test_gives_up_after_max_attempts(self):
+        self.transport.max_attempts = 3
+        self.transport.session.request.return_value = response(502)
+
+        self.assertFalse(self.retry())
+
+        self.assertEqual(self.transport.session.request.call_count, 3)
+        self.assertEqual(self.transport.metrics["model"]["retries"], 2)
+
+    def test_backoff_bounds(self):
+        for attempt in range(1, 10):
+            bound = min(4, 0.5 * 2 ** (attempt - 1))
+            for _ in range(50):
+                self.assertTrue(0 <= self.transport.delay(attempt) <= bound)
+
+        # en uzun beklemeler her denemede iki katına çıkar, max_backoff'ta durur
+        self.transport.max_attempts = 6
+        self.transport.session.request.return_value = response(503)
+        with mock.patch("Transport_class.random.uniform", side_effect=lambda low, high: high):
+            self.retry()
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.5, 1, 2, 4, 4])
+
+    def test_report(self):
+        self.transport.metrics["model"] = {
+            "calls": 101, "errors": 1, "retries": 1, "latencies": [i / 100 for i in range(100, 0, -1)]}
+
+        report = self.transport.report()["model"]
+
+        self.assertEqual((report["calls"], report["errors"], report["retries"]), (101, 1, 1))
+        self.assertAlmostEqual(report["mean"], 0.505)
+        self.assertEqual((report["p50"], report["p95"], report["max"]), (0.51, 0.96, 1.0))
+
+    def test_long_poll_timeout(self):
+        self.assertEqual(self.transport.timeout_for(30), (3.05, 90))
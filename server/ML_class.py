@@ -1,78 +1,240 @@
 import os
+import copy
 import json
+import time
 import pickle
+import logging
 import requests
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from pyarc import CBA, TransactionDB
+from pyarc.algorithms import (M1Algorithm, Classifier, RuleMergeEngine, VectorizedRuleMergeEngine, RuleCountAggregate,
+                              evict_rules, compress_payload, iter_chunks, ModelStore)
 from sklearn.metrics import classification_report, accuracy_score, confusion_matrix
 
 
 MODEL_PATH = "model.pkl"
+STORE_PATH = "model_store"
+SNAPSHOT_INTERVAL = 10
 CONFIG_PATH = "load.json"
 SERVER_URL = "http://localhost:5000/send_federated_model"
+AGGREGATION_MODES = ("sequential", "vectorized", "counts", "tree")
+
+
+def size_from_counts(model):
+    """
+    Sayımları olan bir modelin kaç işlemden (transaction) oluştuğunu kural sayımlarından çıkarır
+    (support = support_count / size). Sayım yoksa 0 döner.
+    """
+    for rule in model.clf.rules:
+        if rule.support_count and rule.support:
+            return round(rule.support_count / rule.support)
+    return 0
+
+
+def aggregate_to_bytes(aggregate):
+    """
+    Sayım istatistiğini (RuleCountAggregate) sütunlu model formatına (model_codec) çevirir.
+    Her (öncül, sonuç) çifti sayımlarıyla bir kural olarak yazılır, böylece sadece en sık sonucu
+    tutan rules()'tan farklı olarak hiçbir sayım kaybolmaz.
+    """
+    rules = []
+    for antecedent_count, consequents in aggregate.antecedents.values():
+        for rule_count, template in consequents.values():
+            rule = copy.copy(template)
+            rule.support_count = rule_count
+            rule.antecedent_count = antecedent_count
+            # Sayımı 0'a yuvarlanmış kurallar support/confidence'tan yeniden sayılır, onlar da 0 olmalı
+            rule.support = rule_count / aggregate.size if aggregate.size else 0
+            rule.confidence = rule_count / antecedent_count if antecedent_count else 0
+            rules.append(rule)
+
+    model = CBA()
+    model.clf = Classifier()
+    model.clf.rules = rules
+    model.size = aggregate.size
+    return model.to_bytes()
+
+
+def aggregate_from_bytes(data):
+    """aggregate_to_bytes ile yazılmış sayım istatistiğini geri okur."""
+    model = CBA.from_bytes(data)
+    return RuleCountAggregate.from_model(model, model.size)
+
+
+def encode_client_aggregate(data, size):
+    """Sütunlu formattaki istemci modelini sayım istatistiğine çevirir (işçi süreçte çalışır)."""
+    return aggregate_to_bytes(RuleCountAggregate.from_model(CBA.from_bytes(data), size))
+
+
+def merge_encoded_aggregates(left, right):
+    """Sütunlu formattaki iki sayım istatistiğini toplar (işçi süreçte çalışır)."""
+    return aggregate_to_bytes(aggregate_from_bytes(left).update(aggregate_from_bytes(right)))
 
 
 class Server:
-    def __init__(self, model_path=MODEL_PATH, config_path=CONFIG_PATH, server_url=SERVER_URL):
+    def __init__(self, model_path=MODEL_PATH, config_path=CONFIG_PATH, server_url=SERVER_URL,
+                 aggregation="sequential", rule_budget=None,
+                 validation_path=None, target_col="HeartDisease", validation_drop=(),
+                 merge_log_level=logging.INFO, compression="zlib", compression_level=None,
+                 store_path=STORE_PATH, snapshot_interval=SNAPSHOT_INTERVAL, max_workers=None):
         """
         Server objesini başlatır.
-        model_path: Modelin kaydedileceği ve yükleneceği dosya yolu.
-        config_path: Versiyon ve yol bilgisinin tutulduğu config dosyası.
+        model_path: Eski sürümlerin modeli pickle ile kaydettiği dosya; model deposu boşsa buradan yüklenir.
+        config_path: Versiyon, model deposu yolu ve istatistiklerin tutulduğu config dosyası.
         server_url: Model gönderilecek sunucu adresi.
+        aggregation: "sequential" (modeller sırayla birleştirilir),
+                     "vectorized" (sırayla, kural istatistikleri NumPy ile toplu hesaplanır) veya
+                     "counts" (modeller sayım tabanlı kural istatistiklerine çevrilip toplanır,
+                     sonuç birleştirme sırasından bağımsızdır) veya
+                     "tree" (counts ile aynı sonuç; istatistikler süreç havuzunda ikili ağaç şeklinde,
+                     seviye seviye toplanır, süreçlere sütunlu model formatında taşınır).
+        rule_budget: Global modeldeki en fazla kural sayısı. Aşılırsa CBA önceliği en düşük
+                     (confidence, support, uzunluk, id) kurallar atılır. None ise sınır yok.
+        validation_path: Verilirse birleştirmeden sonra global model bu doğrulama verisi
+                         üzerinde M1 ile yeniden budanır (ör. test_heart_data.csv).
+        target_col: Doğrulama verisindeki hedef sütun.
+        validation_drop: Doğrulama verisinden atılacak sütunlar (istemcilerin özellik seçimiyle aynı olmalı).
+        merge_log_level: Birleştirme özetinin loglanacağı seviye (kural bazlı ayrıntılar DEBUG seviyesindedir).
+        compression: API'ye gönderilen modelin sıkıştırma codec'i ("zlib", "lzma", "zstd" veya "none").
+        compression_level: Sıkıştırma seviyesi (None: codec'in varsayılanı).
+        store_path: Versiyonların kaydedildiği model deposu (ModelStore) dizini. Her versiyon
+                    değişen kuralların eklendiği bir delta kaydı olarak yazılır.
+        snapshot_interval: Deponun kaç versiyonda bir modelin tamamını (snapshot) yazacağı.
+        max_workers: "tree" modunda süreç havuzunun işçi sayısı (None: işlemci sayısı).
         """
+        if aggregation not in AGGREGATION_MODES:
+            raise Exception(f"aggregation parametresi {AGGREGATION_MODES} değerlerinden biri olmalı")
+
         self.model = None
         self.size = 0
         self.version = 0
         self.model_path = model_path
         self.config_path = config_path
         self.server_url = server_url
+        # Global kuralların hash indeksi, fed_avg çağrıları arasında korunur
+        engine_class = VectorizedRuleMergeEngine if aggregation == "vectorized" else RuleMergeEngine
+        self.merge_engine = engine_class(log_level=merge_log_level)
+        self.aggregation = aggregation
+        # "counts" ve stream modunda global modelin sayım istatistikleri
+        self.aggregate = None
+        # Son "counts" birleştirmesinin adım, "tree" birleştirmesinin seviye bazlı süreleri
+        self.aggregation_stats = []
+        self.max_workers = max_workers
+        # "tree" modunun süreç havuzu, ilk birleştirmede açılır
+        self.executor = None
+        self.rule_budget = rule_budget
+        # Versiyon bazlı kural atma istatistikleri
+        self.eviction_stats = {}
+        self.validation_path = validation_path
+        self.target_col = target_col
+        self.validation_drop = list(validation_drop)
+        self.validation = None
+        # Versiyon bazlı M1 budama istatistikleri
+        self.prune_stats = {}
+        # Versiyon bazlı birleştirme istatistikleri (eşleşen, çakışan, yeni kural sayıları ve süreler)
+        self.merge_stats = {}
+        self.compression = compression
+        self.compression_level = compression_level
+        self.store = ModelStore(store_path, CBA, snapshot_interval=snapshot_interval)
+        # Versiyon bazlı kayıt istatistikleri (snapshot/delta, yazılan bayt, süre)
+        self.store_stats = {}
 
     def check_save_model(self):
         """
         Sistemde kayıtlı model ve versiyon bilgisini kontrol eder.
         Model varsa yükler, yoksa yeni bir config oluşturur.
+        Model deposunda versiyon varsa son snapshot bellek eşlemeli okunur ve sonraki delta kayıtları uygulanır.
         """
         if os.path.exists(self.config_path):
             with open(self.config_path, 'r') as file:
                 config = json.load(file)
             version = config.get("version", 0)
+            self.size = config.get("size", 0)
             path = config.get("path", "")
-            if version > 0 and os.path.exists(path):
+            self.eviction_stats = config.get("evictions", {})
+            self.prune_stats = config.get("prunes", {})
+            self.merge_stats = config.get("merges", {})
+            self.store_stats = config.get("stores", {})
+            if self.store.version > 0:
+                start = time.perf_counter()
+                self.model = self.store.load()
+                self.version = self.store.version
+                self.restore_size()
+                print(f"Mevcut model depodan yüklendi. Versiyon: {self.version} "
+                      f"({time.perf_counter() - start:.4f} sn)")
+            elif version > 0 and os.path.isfile(path):
+                # Eski sürümün pickle dosyası; ilk birleştirmede depoya snapshot olarak yazılır
                 with open(path, 'rb') as model_file:
                     self.model = pickle.load(model_file)
                 self.version = version
+                self.restore_size()
                 print(f"Mevcut model yüklendi. Versiyon: {self.version}")
             else:
                 print("Model versiyonu 0 veya model dosyası yok.")
         else:
             # Config dosyası yoksa, sıfırdan oluştur
-            config = {
-                "version": self.version,
-                "path": ""
-            }
-            with open(self.config_path, 'w') as file:
-                json.dump(config, file, indent=4)
+            self.save_config()
             print("Yeni config dosyası oluşturuldu.")
 
+    def restore_size(self):
+        """
+        Global modelin dayandığı veri boyutu config'de yoksa (eski config dosyaları) kural sayımlarından çıkarılır.
+        Boyut 0 kalırsa sonraki birleştirmede global model ağırlıksız sayılır.
+        """
+        if not self.size and self.model is not None and self.model.clf is not None:
+            self.size = size_from_counts(self.model)
+
+    def save_config(self):
+        """
+        Versiyon, model deposu yolu ve istatistikleri config dosyasına yazar.
+        Yarım yazılmış bir config kalmaması için geçici dosyaya yazılıp yeniden adlandırılır.
+        """
+        config = {
+            "version": self.version,
+            "size": self.size,
+            "path": self.store.path,
+            "evictions": self.eviction_stats,
+            "prunes": self.prune_stats,
+            "merges": self.merge_stats,
+            "stores": self.store_stats
+        }
+        temporary = self.config_path + ".tmp"
+        with open(temporary, 'w') as file:
+            json.dump(config, file, indent=4)
+        os.replace(temporary, self.config_path)
+
+    def encode_model(self):
+        """
+        Global modeli sütunlu ikili formata çevirip sıkıştırır.
+        (sıkıştırılmış veri, sıkıştırma istatistiği) döndürür.
+        """
+        return compress_payload(self.model.to_bytes(), self.compression, self.compression_level)
+
     def send_model(self):
         """
         Modeli belirtilen sunucuya gönderir.
-        Model, pickle ile hex string'e çevrilerek JSON olarak iletilir.
+        Model, sütunlu ikili formata (CBA.to_bytes) çevrilip sıkıştırılır ve application/octet-stream
+        gövdesi olarak parça parça iletilir. Versiyon ve codec header'larda taşınır.
         """
         if self.model is None:
             print("Önce bir model yüklemelisiniz.")
             return
 
         try:
-            # Modeli pickle ile binary formata çevir
-            model_data = pickle.dumps(self.model)
-            payload = {
-                'model': model_data.hex(),   # binary veriyi hex string olarak gönder
-                'version': self.version
+            # Modeli sütunlu ikili formata çevir ve sıkıştır, codec header'da belirtilir
+            model_data, stats = self.encode_model()
+            headers = {
+                'Content-Type': 'application/octet-stream',
+                'X-Model-Version': str(self.version),
+                'X-Model-Compression': self.compression
             }
 
             print(f"Model gönderiliyor... Versiyon: {self.version}")
+            print(f"Gönderilen model: {stats['raw_size']} -> {stats['compressed_size']} bayt "
+                  f"({stats['codec']}, {stats['time']:.4f} sn)")
 
-            response = requests.post(self.server_url, json=payload)
+            response = requests.post(self.server_url, data=iter_chunks(model_data), headers=headers)
 
             if response.status_code == 200:
                 print("Başarıyla gönderildi! Sunucu cevabı:", response.text)
@@ -82,41 +244,204 @@ class Server:
         except Exception as e:
             print("Model gönderiminde hata oluştu:", str(e))
 
-    def fed_avg(self, models):
+    def fed_avg(self, models, aggregate=None, template=None):
         """
         Federated öğrenme için modelleri birleştirir (FedAvg).
         Model yoksa ilk modeli yükler, varsa mevcut modelle diğerlerini birleştirir.
+        aggregate: API'nin modeller geldikçe biriktirdiği kısmi istatistik (stream modu).
+                   Verilirse models sadece istemci bilgilerini içerir.
+        template: aggregate ile birlikte gelen, kuralları boşaltılmış CBA modeli.
         """
         if not models:
             print("Birleştirilecek model listesi boş.")
             return
 
         try:
-            if self.model is None:
+            stats = None
+            if aggregate is not None:
+                self.merge_aggregate(aggregate, template)
+            elif self.aggregation == "counts":
+                self.count_merge(models)
+            elif self.aggregation == "tree":
+                self.tree_merge(models)
+            elif self.model is None:
                 # Eğer model daha önce yüklenmediyse, ilk model ile başla
                 self.model = models[0]["model"]
                 self.size = models[0]["size"]
                 # update_cba_model2: Model birleştirme fonksiyonunuz
-                self.model, self.size = self.model.update_cba_model2(models[1:], self.model, self.size)
+                self.model, self.size, stats = self.model.update_cba_model2(
+                    models[1:], self.model, self.size, self.merge_engine, return_stats=True)
             else:
-                self.model, self.size = self.model.update_cba_model2(models, self.model, self.size)
+                self.model, self.size, stats = self.model.update_cba_model2(
+                    models, self.model, self.size, self.merge_engine, return_stats=True)
 
             self.version += 1
 
-            # Modeli kaydet
-            with open(self.model_path, 'wb') as file:
-                pickle.dump(self.model, file)
+            if stats is not None:
+                self.merge_stats[str(self.version)] = stats.as_dict()
+
+            if self.validation_path is not None:
+                self.prune_model()
+
+            if self.rule_budget is not None:
+                self.apply_rule_budget()
+
+            # Modeli depoya kaydet (değişen kurallar delta kaydı olarak, belirli aralıklarla snapshot)
+            stats = self.store.save(self.model, self.version)
+            self.store_stats[str(self.version)] = stats
 
             # Config dosyasını güncelle
-            config = {
-                "version": self.version,
-                "path": self.model_path
-            }
-            with open(self.config_path, 'w') as file:
-                json.dump(config, file, indent=4)
+            self.save_config()
 
-            print(f"Model birleştirildi ve kaydedildi. Yeni versiyon: {self.version}")
+            print(f"Model birleştirildi ve kaydedildi. Yeni versiyon: {self.version} "
+                  f"({stats['kind']}, {stats['bytes']} bayt, {stats['time']:.4f} sn)")
 
         except Exception as e:
             print("Model birleştirme sırasında hata oluştu:", str(e))
 
+    def count_merge(self, models):
+        """
+        İstemci modellerini sayım tabanlı kural istatistiklerine çevirip global istatistiğe ekler.
+        Sayımlar sadece toplandığından sonuç modellerin sırasına bağlı değildir.
+        Her şey bu süreçte yapılır: modelleri ve istatistikleri süreçler arasında taşımak
+        (pickle) birleştirmenin kendisinden çok daha pahalıdır. Adım süreleri aggregation_stats'a yazılır.
+        """
+        stats = []
+
+        start = time.perf_counter()
+        aggregate = RuleCountAggregate()
+        for m in models:
+            aggregate.update(RuleCountAggregate.from_model(m["model"], m["size"]))
+        stats.append({"step": "count", "models": len(models), "time": time.perf_counter() - start})
+
+        start = time.perf_counter()
+        self.merge_aggregate(aggregate, models[0]["model"])
+        stats.append({"step": "global", "models": 1, "time": time.perf_counter() - start})
+
+        self.aggregation_stats = stats
+        for item in stats:
+            print(f"Birleştirme adımı {item['step']}: {item['models']} model, {item['time']:.4f} sn")
+
+    def tree_merge(self, models):
+        """
+        İstemci modellerinin sayım istatistiklerini süreç havuzunda ikili ağaç şeklinde toplar:
+        her seviyede istatistikler ikişer ikişer paralel birleştirilir, ağacın derinliği log2(N)'dir.
+        Modeller ve istatistikler süreçlere pickle yerine sütunlu model formatında (bayt) taşınır.
+        Sonuç count_merge ile aynıdır; seviye süreleri aggregation_stats'a yazılır.
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        stats = []
+
+        start = time.perf_counter()
+        aggregates = list(self.executor.map(
+            encode_client_aggregate, [m["model"].to_bytes() for m in models], [m["size"] for m in models]))
+        stats.append({"level": 0, "nodes": len(aggregates), "time": time.perf_counter() - start})
+
+        level = 0
+        while len(aggregates) > 1:
+            level += 1
+            start = time.perf_counter()
+            merged = list(self.executor.map(merge_encoded_aggregates, aggregates[0::2], aggregates[1::2]))
+            # Tek kalan istatistik bir üst seviyeye olduğu gibi geçer
+            if len(aggregates) % 2 == 1:
+                merged.append(aggregates[-1])
+            aggregates = merged
+            stats.append({"level": level, "nodes": len(aggregates), "time": time.perf_counter() - start})
+
+        start = time.perf_counter()
+        self.merge_aggregate(aggregate_from_bytes(aggregates[0]), models[0]["model"])
+        stats.append({"level": "global", "nodes": 1, "time": time.perf_counter() - start})
+
+        self.aggregation_stats = stats
+        for item in stats:
+            print(f"Birleştirme seviyesi {item['level']}: {item['nodes']} düğüm, {item['time']:.4f} sn")
+
+    def close(self):
+        """"tree" modunun süreç havuzunu kapatır."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def prune_model(self):
+        """
+        Birleştirilmiş global modeli sunucudaki doğrulama verisi üzerinde M1 ile yeniden budar.
+        Kurallar öncelik sırasıyla doğrulama verisini kapsar, toplam hatanın en az olduğu yerde
+        liste kesilir ve varsayılan sınıf yeniden hesaplanır. Süre ve kural sayıları prune_stats'a yazılır.
+        """
+        if self.validation is None:
+            df = pd.read_csv(self.validation_path).drop(columns=self.validation_drop)
+            self.validation = TransactionDB.from_DataFrame(df, target=self.target_col)
+
+        start = time.perf_counter()
+        rules = self.model.clf.rules
+        before = len(rules)
+
+        # İstemci eğitiminden kalan işaretler M1'i yanıltmasın
+        for rule in rules:
+            rule.marked = False
+
+        self.model.clf = M1Algorithm(list(rules), self.validation).build()
+
+        kept = set(id(r) for r in self.model.clf.rules)
+        removed = [r for r in rules if id(r) not in kept]
+        if removed:
+            self.merge_engine.discard(removed)
+            if self.aggregate is not None:
+                self.aggregate.discard(removed)
+
+        after = len(self.model.clf.rules)
+        elapsed = time.perf_counter() - start
+        self.prune_stats[str(self.version)] = {
+            "before": before,
+            "after": after,
+            "reduction": 1 - after / before if before else 0,
+            "default_class": self.model.clf.default_class,
+            "time": elapsed
+        }
+        print(f"M1 budaması: {before} -> {after} kural ({elapsed:.2f} sn)")
+
+    def apply_rule_budget(self):
+        """
+        Global model rule_budget'ı aşıyorsa önceliği en düşük kuralları atar.
+        Atılan kurallar birleştirme indeksinden ve sayım istatistiklerinden de çıkarılır.
+        İstatistikler mevcut versiyon için eviction_stats'a yazılır.
+        """
+        start = time.perf_counter()
+        before = len(self.model.clf.rules)
+
+        kept, evicted = evict_rules(self.model.clf.rules, self.rule_budget)
+        self.model.clf.rules = kept
+
+        if evicted:
+            self.merge_engine.discard(evicted)
+            if self.aggregate is not None:
+                self.aggregate.discard(evicted)
+
+        self.eviction_stats[str(self.version)] = {
+            "before": before,
+            "after": len(kept),
+            "evicted": len(evicted),
+            "max_evicted_confidence": max((r.confidence for r in evicted), default=None),
+            "min_kept_confidence": kept[-1].confidence if kept else None,
+            "time": time.perf_counter() - start
+        }
+        if evicted:
+            print(f"Kural bütçesi ({self.rule_budget}) aşıldı, {len(evicted)} kural atıldı.")
+
+    def merge_aggregate(self, aggregate, template):
+        """
+        Sayım tabanlı kural istatistiğini (RuleCountAggregate) global modele ekler.
+        template: Global model henüz yoksa kabuk olarak kullanılacak CBA modeli.
+        """
+        if self.model is None:
+            self.model = template
+            self.aggregate = RuleCountAggregate()
+        elif self.aggregate is None:
+            # Sunucu yeniden başlatıldıysa istatistikler kayıtlı modelden çıkarılır
+            self.aggregate = RuleCountAggregate.from_model(self.model, self.size)
+
+        self.aggregate.update(aggregate)
+        self.model.clf.rules = self.aggregate.rules()
+        self.size = self.aggregate.size
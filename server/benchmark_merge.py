@@ -0,0 +1,302 @@
+"""
+Federated kural modeli birleştirme performans testi.
+
+Sentetik kural kümeleri (varsayılan 1k, 10k, 100k, 1M CAR) ve client/ klasöründeki
+gerçek kalp verisi parçaları (2, 4, 8 istemci) üzerinde her birleştirme yöntemi için
+süre, en yüksek bellek kullanımı ve saniyedeki kural sayısını ölçer.
+Bellek tracemalloc ile ana süreçte ölçülür; "tree" yönteminin işçi süreçleri için
+ayrıca işçilerin en yüksek RSS'lerinin toplamı (worker_peak_rss) raporlanır.
+Sonuçlar JSON olarak kaydedilir, böylece farklı çalıştırmalar karşılaştırılabilir.
+
+Örnek:
+    python benchmark_merge.py --sizes 1000 10000 --clients 2 4 8 16 --output sonuc.json
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import resource
+import itertools
+import argparse
+import platform
+import tracemalloc
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from pyarc import CBA, TransactionDB
+from pyarc.algorithms import generateCARs, Classifier, RuleMergeEngine, VectorizedRuleMergeEngine, RuleCountAggregate
+from pyarc.data_structures import Item, Antecedent, Consequent, ClassAssocationRule
+from ML_class import encode_client_aggregate, merge_encoded_aggregates, aggregate_from_bytes
+
+
+CLIENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "client")
+TARGET_COL = "HeartDisease"
+FEATURE_SELECTION = ['BMI', 'AlcoholDrinking', 'MentalHealth', 'Asthma']
+IMPLEMENTATIONS = ("naive", "indexed", "vectorized", "counts", "tree")
+
+
+# ---------------------------- #
+# Birleştirme yöntemleri
+# ---------------------------- #
+def naive_merge(models):
+    """Her gelen kuralı her global kuralla string karşılaştırarak birleştirir (eski yöntem)."""
+    main_model = models[0]["model"]
+    size = models[0]["size"]
+    for cba_model in models[1:]:
+        n2 = cba_model["size"]
+        new_rules = []
+        for rule in cba_model["model"].clf.rules:
+            is_new_lhs_rhs = True
+            for j in range(len(main_model.clf.rules)):
+                global_rule = main_model.clf.rules[j]
+                sup1, sup2 = global_rule.support, rule.support
+                conf1, conf2 = global_rule.confidence, rule.confidence
+                if global_rule.antecedent.string() != rule.antecedent.string():
+                    continue
+                is_new_lhs_rhs = False
+                if global_rule.consequent.string() != rule.consequent.string() and size * sup1 < n2 * sup2:
+                    rule.support = main_model.update_new_rule_support(sup2, size, n2)
+                    rule.confidence = main_model.update_new_rule_confidence(sup1, sup2, conf1, conf2, size, n2)
+                    main_model.clf.rules[j] = rule
+                else:
+                    global_rule.support = main_model.update_support(sup1, sup2, size, n2)
+                    global_rule.confidence = main_model.update_confidence(sup1, sup2, conf1, conf2, size, n2)
+            if is_new_lhs_rhs:
+                rule.support = main_model.update_new_rule_support(rule.support, size, n2)
+                new_rules.append(rule)
+        main_model.clf.rules += new_rules
+        size += n2
+        main_model.clf.rules.sort(reverse=True)
+    return len(main_model.clf.rules)
+
+
+def engine_merge(engine_class):
+    def merge(models):
+        model, _ = engine_class().merge(models[1:], models[0]["model"], models[0]["size"])
+        return len(model.clf.rules)
+    return merge
+
+
+def counts_merge(models):
+    """Sayım tabanlı istatistikleri sırayla toplar."""
+    aggregate = RuleCountAggregate()
+    for m in models:
+        aggregate.update(RuleCountAggregate.from_model(m["model"], m["size"]))
+    return len(aggregate.rules())
+
+
+def worker_task(function, args):
+    """
+    function(*args)'ı işçi süreçte çalıştırır. Sonuçla birlikte süreç id'sini ve sürecin
+    o ana kadarki en yüksek RSS'ini (bayt) döndürür.
+    """
+    return function(*args), os.getpid(), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def tree_merge(workers=None):
+    """
+    Sayım tabanlı istatistikleri süreç havuzunda ikili ağaç şeklinde toplar (Server'ın "tree" modu).
+    Modeller ve istatistikler süreçlere sütunlu model formatında taşınır; taşıma maliyeti yüzünden
+    küçük modellerde counts'tan yavaştır.
+    Her birleştirme yeni bir havuz açar (süreye dahildir), böylece işçilerin en yüksek RSS'i
+    sadece o birleştirmeyi kapsar; toplamları merge.worker_memory'ye yazılır. fork ile
+    başlatılan işçilerin RSS'i ana süreçten paylaşılan sayfaları da içerir.
+    """
+    def merge(models):
+        peaks = {}
+
+        def run(executor, function, *iterables):
+            results = []
+            for result, pid, rss in executor.map(worker_task, itertools.repeat(function), zip(*iterables)):
+                peaks[pid] = max(peaks.get(pid, 0), rss)
+                results.append(result)
+            return results
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            aggregates = run(executor, encode_client_aggregate,
+                             [m["model"].to_bytes() for m in models], [m["size"] for m in models])
+            while len(aggregates) > 1:
+                merged = run(executor, merge_encoded_aggregates, aggregates[0::2], aggregates[1::2])
+                if len(aggregates) % 2 == 1:
+                    merged.append(aggregates[-1])
+                aggregates = merged
+
+        merge.worker_memory = sum(peaks.values())
+        return len(aggregate_from_bytes(aggregates[0]).rules())
+
+    merge.worker_memory = None
+    return merge
+
+
+# ---------------------------- #
+# Veri üretimi
+# ---------------------------- #
+def make_model(rules, size):
+    model = CBA()
+    model.clf = Classifier()
+    model.clf.rules = rules
+    model.size = size
+    return model
+
+
+def synthetic_models(total_rules, clients, overlap, seed, attributes=40, values=10, maxlen=4, size=10000):
+    """
+    Toplam total_rules kurallık, clients istemciye bölünmüş sentetik modeller üretir.
+    overlap: Her istemcideki kuralların ortak havuzdan (diğer istemcilerle aynı öncül) gelen oranı.
+    """
+    rng = random.Random(seed)
+    per_client = max(1, total_rules // clients)
+    shared_count = int(per_client * overlap)
+
+    seen = set()
+
+    def antecedent():
+        while True:
+            length = rng.randint(1, maxlen)
+            attrs = rng.sample(range(attributes), length)
+            key = tuple(sorted((f"A{a}", str(rng.randrange(values))) for a in attrs))
+            if key not in seen:
+                seen.add(key)
+                return Antecedent([Item(a, v) for a, v in key])
+
+    shared = [antecedent() for _ in range(shared_count)]
+
+    models = []
+    for _ in range(clients):
+        antecedents = shared + [antecedent() for _ in range(per_client - shared_count)]
+        rules = []
+        for ant in antecedents:
+            confidence = rng.uniform(0.5, 1.0)
+            support = rng.uniform(0.01, 0.3)
+            rule = ClassAssocationRule(ant, Consequent("class", rng.randrange(2)), support, confidence)
+            rule.support_count = round(support * size)
+            rule.antecedent_count = max(rule.support_count, round(support * size / confidence))
+            rules.append(rule)
+        rules.sort(reverse=True)
+        models.append({"model": make_model(rules, size), "size": size})
+
+    return models
+
+
+def heart_models(clients, support, confidence):
+    """
+    client/{clients}_heart_part_*.csv parçalarından gerçek istemci kural kümeleri çıkarır.
+    M1 budaması bu parçalarda çok az kural bıraktığından, birleştirme yükünü ölçmek için
+    budanmamış CAR listeleri kullanılır. İstemcilerdeki özellik seçimi (mutual) uygulanır.
+    """
+    models = []
+    for i in range(1, clients + 1):
+        df = pd.read_csv(os.path.join(CLIENT_DIR, f"{clients}_heart_part_{i}.csv"))
+        df = df.drop(columns=FEATURE_SELECTION)
+        txns = TransactionDB.from_DataFrame(df, target=TARGET_COL)
+        rules = generateCARs(txns, support=support * 100, confidence=confidence * 100)
+        models.append({"model": make_model(rules, len(df)), "size": len(df)})
+    return models
+
+
+# ---------------------------- #
+# Ölçüm
+# ---------------------------- #
+def measure(merge, make_models):
+    """
+    Birleştirmeyi iki kez çalıştırır: süre ölçümü ve tracemalloc ile bellek ölçümü.
+    tracemalloc sadece ana süreci izler; süreç havuzu kullanan yöntemlerin işçi bellekleri
+    worker_peak_rss'te (diğerlerinde None) raporlanır.
+    """
+    models = make_models()
+    rules_in = sum(len(m["model"].clf.rules) for m in models)
+    with contextlib.redirect_stdout(None):
+        start = time.perf_counter()
+        rules_out = merge(models)
+        elapsed = time.perf_counter() - start
+
+    models = make_models()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(None):
+        merge(models)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "rules_in": rules_in,
+        "rules_out": rules_out,
+        "time": elapsed,
+        "peak_memory": peak,
+        "worker_peak_rss": getattr(merge, "worker_memory", None),
+        "rules_per_second": rules_in / elapsed if elapsed > 0 else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kural modeli birleştirme performans testi")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000, 1000000],
+                        help="Sentetik senaryolardaki toplam kural sayıları")
+    parser.add_argument("--clients", type=int, nargs="+", default=[2, 4, 8, 16, 32])
+    parser.add_argument("--overlap", type=float, nargs="+", default=[0.0, 0.5, 0.9],
+                        help="İstemci kural kümeleri arasındaki ortak öncül oranı")
+    parser.add_argument("--implementations", nargs="+", default=list(IMPLEMENTATIONS), choices=IMPLEMENTATIONS)
+    parser.add_argument("--naive-limit", type=int, default=2000,
+                        help="naive yöntemin çalıştırılacağı en büyük toplam kural sayısı")
+    parser.add_argument("--heart", type=int, nargs="*", default=[2, 4, 8],
+                        help="Gerçek kalp verisi parçalarının istemci sayıları")
+    parser.add_argument("--heart-support", type=float, default=0.02)
+    parser.add_argument("--heart-confidence", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="merge_benchmark.json")
+    args = parser.parse_args(argv)
+
+    merges = {
+        "naive": naive_merge,
+        "indexed": engine_merge(RuleMergeEngine),
+        "vectorized": engine_merge(VectorizedRuleMergeEngine),
+        "counts": counts_merge,
+        "tree": tree_merge()
+    }
+
+    scenarios = []
+    for size in args.sizes:
+        for clients in args.clients:
+            for overlap in args.overlap:
+                scenarios.append((
+                    {"source": "synthetic", "size": size, "clients": clients, "overlap": overlap},
+                    lambda size=size, clients=clients, overlap=overlap:
+                        synthetic_models(size, clients, overlap, args.seed)
+                ))
+    for clients in args.heart:
+        trained = heart_models(clients, args.heart_support, args.heart_confidence)
+        scenarios.append((
+            {"source": "heart", "size": sum(len(m["model"].clf.rules) for m in trained), "clients": clients},
+            lambda trained=trained: copy.deepcopy(trained)
+        ))
+
+    results = []
+    for scenario, make_models in scenarios:
+        for name in args.implementations:
+            if name == "naive" and scenario["size"] > args.naive_limit:
+                continue
+            result = dict(scenario, implementation=name, **measure(merges[name], make_models))
+            results.append(result)
+            workers = result["worker_peak_rss"]
+            print(f"{scenario['source']:9} size={scenario['size']:>8} clients={scenario['clients']:>3} "
+                  f"overlap={scenario.get('overlap', '-')!s:>4} {name:10} "
+                  f"{result['time']:.4f} sn  {result['peak_memory'] / 2**20:.1f} MB"
+                  f"{f' + işçiler {workers / 2**20:.1f} MB RSS' if workers is not None else ''}  "
+                  f"{result['rules_per_second'] or 0:.0f} kural/sn")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "arguments": vars(args),
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as json_file:
+        json.dump(report, json_file, ensure_ascii=False, indent=4)
+    print(f"Sonuçlar kaydedildi: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
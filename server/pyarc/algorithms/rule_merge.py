@@ -0,0 +1,696 @@
+import copy
+import time
+import heapq
+import logging
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class MergeStats:
+    """Statistics of one merge of client models
+    into the global model.
+
+
+    Attributes
+    ----------
+    matched: int
+        client rules with the same antecedent and
+        consequent as a global rule
+
+    conflict_kept: int
+        client rules with a different consequent
+        where the global rule was kept
+
+    conflict_replaced: int
+        client rules with a different consequent
+        that replaced the global rule
+
+    new: int
+        client rules appended to the global model
+
+    clients: list of dict
+        counters, data size and merge time of every
+        client model
+
+    size_before, size_after: int
+        number of transactions behind the global model
+
+    rules_before, rules_after: int
+        number of rules in the global model
+
+    time: float
+        total merge time in seconds
+
+    """
+
+    COUNTERS = ("matched", "conflict_kept", "conflict_replaced", "new")
+
+    def __init__(self, size_before=0, rules_before=0):
+        self.matched = 0
+        self.conflict_kept = 0
+        self.conflict_replaced = 0
+        self.new = 0
+        self.clients = []
+        self.size_before = size_before
+        self.size_after = size_before
+        self.rules_before = rules_before
+        self.rules_after = rules_before
+        self.time = 0
+
+    def add_client(self, client_id, size, elapsed, counts):
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + counts[name])
+
+        self.time += elapsed
+        self.clients.append(dict(counts, id=client_id, size=size, time=elapsed))
+
+    def as_dict(self):
+        return dict(vars(self))
+
+    def __repr__(self):
+        text = "MergeStats clients: {} matched: {} conflict_kept: {} conflict_replaced: {} new: {} " \
+               "size: {} -> {} rules: {} -> {} time: {:.4f}s"
+
+        return text.format(
+            len(self.clients), self.matched, self.conflict_kept, self.conflict_replaced, self.new,
+            self.size_before, self.size_after, self.rules_before, self.rules_after, self.time)
+
+
+class RuleMergeEngine:
+    """Merge engine for combining client CBA models
+    into a global model (duCBA).
+
+    Global rules are kept in a hash index keyed by
+    a canonical antecedent key and, inside it, by
+    a consequent key. Every incoming rule is therefore
+    matched in O(1) instead of being compared with
+    every global rule.
+
+    The engine is meant to live as long as the global
+    model does, so that the index does not have to be
+    rebuilt on every merge.
+
+
+    Attributes
+    ----------
+    index: dict
+        {antecedent_key: {consequent_key: [ClassAssocationRule]}}
+
+    model: CBA
+        global model the index was built for
+
+    stats: MergeStats
+        statistics of the last merge
+
+    log_level: int
+        logging level of the merge summary, updates of
+        single rules are logged at DEBUG level
+
+    """
+
+    def __init__(self, log_level=logging.INFO):
+        self.index = {}
+        self.model = None
+        self.stats = None
+        self.log_level = log_level
+        self._indexed_count = 0
+
+    @staticmethod
+    def antecedent_key(antecedent):
+        """Returns a key that does not depend on the order
+        in which items were inserted into the antecedent.
+        """
+        return tuple(sorted(antecedent.itemset.items()))
+
+    @staticmethod
+    def consequent_key(consequent):
+        return (consequent.attribute, consequent.value)
+
+    def rebuild(self, model):
+        """Rebuilds the index from the rules of given
+        global model.
+        """
+        self.index = {}
+        self.model = model
+
+        for rule in model.clf.rules:
+            self._add(rule)
+
+        self._indexed_count = len(model.clf.rules)
+
+    def is_stale(self, model):
+        """Checks whether the index still describes
+        given global model.
+        """
+        return (
+            model is not self.model or
+            len(model.clf.rules) != self._indexed_count
+        )
+
+    def merge(self, model_list, global_model, global_size):
+        """Merges client models into the global model.
+
+        Parameters
+        ----------
+        model_list: list of dict
+            {"model": CBA, "size": int, ...} for each client
+
+        global_model: CBA
+
+        global_size: int
+            number of transactions the global model
+            was built from
+
+        Returns
+        -------
+        (global_model, size) tuple, statistics of the merge
+        are stored in the stats attribute
+        """
+        if self.is_stale(global_model):
+            self.rebuild(global_model)
+
+        size = global_size
+        stats = MergeStats(global_size, len(global_model.clf.rules))
+
+        for cba_model in model_list:
+            n2 = cba_model["size"]
+
+            start = time.perf_counter()
+            counts = self._merge_rules(global_model, cba_model["model"].clf.rules, size, n2)
+            stats.add_client(cba_model.get("id"), n2, time.perf_counter() - start, counts)
+
+            size = size + n2
+
+        self._indexed_count = len(global_model.clf.rules)
+
+        stats.size_after = size
+        stats.rules_after = len(global_model.clf.rules)
+        self.stats = stats
+        logger.log(self.log_level, "%s", stats)
+
+        return global_model, size
+
+    def _merge_rules(self, main_model, rules, size, n2):
+        counts = dict.fromkeys(MergeStats.COUNTERS, 0)
+        debug = logger.isEnabledFor(logging.DEBUG)
+        new_rules = []
+        # position in the global rule list -> rule that
+        # replaces the rule there
+        replaced = {}
+        # id of a rule -> its positions in the global rule
+        # list, a rule that replaced several conflicting
+        # rules fills several positions
+        slots = None
+
+        for rule in rules:
+            matches = self.index.get(self.antecedent_key(rule.antecedent))
+            sup2 = rule.support
+
+            # if the lhs and rhs are new
+            if not matches:
+                rule.support = main_model.update_new_rule_support(sup2, size, n2)
+                new_rules.append(rule)
+                counts["new"] += 1
+                continue
+
+            candidates = [
+                (consequent_key, global_rule)
+                for consequent_key, global_rules in matches.items()
+                for global_rule in global_rules
+            ]
+
+            if len(candidates) == 1:
+                # the position of a single match is looked
+                # up only if the match is replaced
+                candidates = [(None,) + candidates[0]]
+            else:
+                if slots is None:
+                    slots = self._slots(main_model.clf.rules)
+                # rules with the same antecedent are visited
+                # in the order of the global rule list, a rule
+                # is listed in the index once per position
+                unique = {id(global_rule): (consequent_key, global_rule) for consequent_key, global_rule in candidates}
+                candidates = sorted(
+                    ((j, consequent_key, global_rule)
+                     for consequent_key, global_rule in unique.values()
+                     for j in slots[id(global_rule)]),
+                    key=lambda c: c[0]
+                )
+
+            rule_consequent_key = self.consequent_key(rule.consequent)
+
+            for j, consequent_key, global_rule in candidates:
+                sup1 = global_rule.support
+                sup2 = rule.support
+                conf1 = global_rule.confidence
+                conf2 = rule.confidence
+
+                if consequent_key != rule_consequent_key:
+                    freq1 = size * sup1
+                    freq2 = n2 * sup2
+
+                    # keep rule has greater frequency
+                    if freq1 < freq2:
+                        # if the new rule has the same lhs and different rhs with any older rules.
+                        rule.support = main_model.update_new_rule_support(sup2, size, n2)
+                        rule.confidence = main_model.update_new_rule_confidence(sup1, sup2, conf1, conf2, size, n2)
+
+                        if slots is None:
+                            slots = self._slots(main_model.clf.rules)
+                        if j is None:
+                            j, = slots[id(global_rule)]
+                        replaced[j] = rule
+                        slots[id(global_rule)].remove(j)
+                        slots.setdefault(id(rule), []).append(j)
+
+                        self._remove(matches, consequent_key, global_rule)
+                        matches.setdefault(rule_consequent_key, []).append(rule)
+                        counts["conflict_replaced"] += 1
+                        continue
+
+                    counts["conflict_kept"] += 1
+                else:
+                    counts["matched"] += 1
+
+                global_rule.support = main_model.update_support(sup1, sup2, size, n2)
+                global_rule.confidence = main_model.update_confidence(sup1, sup2, conf1, conf2, size, n2)
+                if debug:
+                    logger.debug("Updated rule: %s with conf:%s and support:%s",
+                                 global_rule, global_rule.confidence, global_rule.support)
+
+        if replaced:
+            main_model.clf.rules = [replaced.get(j, r) for j, r in enumerate(main_model.clf.rules)]
+
+        # new rules become visible only after the whole
+        # client model has been processed
+        for rule in new_rules:
+            self._add(rule)
+
+        main_model.clf.rules += new_rules
+        main_model.clf.rules.sort(reverse=True)
+
+        return counts
+
+    @staticmethod
+    def _slots(global_rules):
+        slots = {}
+        for j, rule in enumerate(global_rules):
+            slots.setdefault(id(rule), []).append(j)
+
+        return slots
+
+    def discard(self, rules):
+        """Removes rules (e.g. evicted from the global model)
+        from the index.
+        """
+        for rule in rules:
+            key = self.antecedent_key(rule.antecedent)
+            matches = self.index.get(key, {})
+            global_rules = matches.get(self.consequent_key(rule.consequent), [])
+
+            if rule in global_rules:
+                self._remove(matches, self.consequent_key(rule.consequent), rule)
+                self._indexed_count -= 1
+            if not matches:
+                self.index.pop(key, None)
+
+    def _add(self, rule):
+        consequents = self.index.setdefault(self.antecedent_key(rule.antecedent), {})
+        consequents.setdefault(self.consequent_key(rule.consequent), []).append(rule)
+
+    @staticmethod
+    def _remove(matches, consequent_key, rule):
+        global_rules = matches[consequent_key]
+        global_rules.remove(rule)
+        if not global_rules:
+            del matches[consequent_key]
+
+
+class VectorizedRuleMergeEngine(RuleMergeEngine):
+    """RuleMergeEngine that resolves every client model
+    to index arrays first and then computes support,
+    confidence and conflict decisions of all rules
+    with NumPy array operations in one pass.
+
+    The arithmetic is the same as in CBA.update_support,
+    update_confidence, update_new_rule_support and
+    update_new_rule_confidence, so the results are
+    identical to the scalar path.
+
+
+    Attributes
+    ----------
+    resolutions: list of dict
+        resolved index arrays of every merged client model:
+        "matched", "conflict_kept", "conflict_replaced"
+        as (client_idx, global_idx) pairs and "new" as
+        client_idx
+
+    """
+
+    def __init__(self, log_level=logging.INFO):
+        super().__init__(log_level)
+        self.resolutions = []
+
+    def resolve(self, global_rules, rules):
+        """Resolves rules of a client model against the index.
+
+        Returns
+        -------
+        (client_idx, global_idx, conflict, new_idx) arrays or None
+        if a rule matches more than one global rule
+        """
+        position = {id(rule): j for j, rule in enumerate(global_rules)}
+
+        client_idx = []
+        global_idx = []
+        conflict = []
+        new_idx = []
+
+        for i, rule in enumerate(rules):
+            matches = self.index.get(self.antecedent_key(rule.antecedent))
+
+            if not matches:
+                new_idx.append(i)
+                continue
+
+            if len(matches) > 1:
+                return None
+
+            (consequent_key, candidates), = matches.items()
+
+            if len(candidates) > 1:
+                return None
+
+            global_rule = candidates[0]
+
+            client_idx.append(i)
+            global_idx.append(position[id(global_rule)])
+            conflict.append(consequent_key != self.consequent_key(rule.consequent))
+
+        # every global rule can be updated only once in one pass
+        if len(set(global_idx)) != len(global_idx):
+            return None
+
+        return (
+            np.array(client_idx, dtype=int),
+            np.array(global_idx, dtype=int),
+            np.array(conflict, dtype=bool),
+            np.array(new_idx, dtype=int)
+        )
+
+    def _merge_rules(self, main_model, rules, size, n2):
+        global_rules = main_model.clf.rules
+        resolved = self.resolve(global_rules, rules)
+
+        # the scalar path handles ambiguous matches in their order
+        if resolved is None:
+            self.resolutions.append(None)
+            return super()._merge_rules(main_model, rules, size, n2)
+
+        client_idx, global_idx, conflict, new_idx = resolved
+
+        n1 = float(size)
+        n2 = float(n2)
+
+        sup1 = np.array([global_rules[j].support for j in global_idx], dtype=float)
+        conf1 = np.array([global_rules[j].confidence for j in global_idx], dtype=float)
+        sup2 = np.array([rules[i].support for i in client_idx], dtype=float)
+        conf2 = np.array([rules[i].confidence for i in client_idx], dtype=float)
+
+        # keep rule has greater frequency
+        replace = conflict & (n1 * sup1 < n2 * sup2)
+        keep = ~replace
+
+        denominator = sup1 * n1 * conf2 + sup2 * n2 * conf1
+        merged_support = (sup1 * n1 + sup2 * n2) / (n1 + n2)
+        merged_confidence = ((sup1 * n1 + sup2 * n2) * conf1 * conf2) / denominator
+        replaced_support = sup2 * n1 / (n1 + n2)
+        replaced_confidence = (sup2 * n2 * conf1 * conf2) / denominator
+
+        new_support = np.array([rules[i].support for i in new_idx], dtype=float) * n1 / (n1 + n2)
+
+        for j, support, confidence in zip(global_idx[keep].tolist(),
+                                          merged_support[keep].tolist(),
+                                          merged_confidence[keep].tolist()):
+            global_rules[j].support = support
+            global_rules[j].confidence = confidence
+
+        for i, j, support, confidence in zip(client_idx[replace].tolist(),
+                                             global_idx[replace].tolist(),
+                                             replaced_support[replace].tolist(),
+                                             replaced_confidence[replace].tolist()):
+            rule = rules[i]
+            rule.support = support
+            rule.confidence = confidence
+
+            matches = self.index[self.antecedent_key(rule.antecedent)]
+            matches.clear()
+            matches[self.consequent_key(rule.consequent)] = [rule]
+            global_rules[j] = rule
+
+        new_rules = []
+        for i, support in zip(new_idx.tolist(), new_support.tolist()):
+            rules[i].support = support
+            new_rules.append(rules[i])
+
+        for rule in new_rules:
+            self._add(rule)
+
+        resolution = {
+            "matched": (client_idx[~conflict], global_idx[~conflict]),
+            "conflict_kept": (client_idx[conflict & keep], global_idx[conflict & keep]),
+            "conflict_replaced": (client_idx[replace], global_idx[replace]),
+            "new": new_idx
+        }
+        self.resolutions.append(resolution)
+
+        main_model.clf.rules += new_rules
+        main_model.clf.rules.sort(reverse=True)
+
+        return {
+            name: len(indices if name == "new" else indices[0])
+            for name, indices in resolution.items()
+        }
+
+class RuleCountAggregate:
+    """Count based sufficient statistics of a set of
+    rule models.
+
+    For every antecedent the aggregate holds the number
+    of transactions satisfying it and, for every consequent
+    reported with it, the number of transactions satisfying
+    the whole rule. Merging two aggregates only adds counts,
+    so the merge is associative and commutative and client
+    models can be merged in any order or shape (sharded,
+    tree-like) with the same result.
+
+    Support and confidence are derived from the counts
+    only when rules are materialized.
+
+
+    Parameters
+    ----------
+    size: int
+        number of transactions the statistics come from
+
+
+    Attributes
+    ----------
+    antecedents: dict
+        {antecedent_key: [antecedent_count, {consequent_key: [rule_count, rule]}]}
+
+    """
+
+    def __init__(self, size=0):
+        self.size = size
+        self.antecedents = {}
+
+    @staticmethod
+    def rule_counts(rule, size):
+        """Returns (rule_count, antecedent_count) of a rule.
+        Counts of rules mined without absolute counts are
+        derived from their support and confidence.
+        """
+        if rule.support_count and rule.antecedent_count:
+            return rule.support_count, rule.antecedent_count
+
+        rule_count = round(rule.support * size)
+        antecedent_count = round(rule.support * size / rule.confidence) if rule.confidence else rule_count
+
+        return rule_count, antecedent_count
+
+    @classmethod
+    def from_model(clazz, model, size=None):
+        """Creates an aggregate from rules of a CBA model.
+
+        Parameters
+        ----------
+        model: CBA
+
+        size: int
+            number of training transactions, model.size
+            is used by default
+        """
+        size = model.size if size is None else size
+        aggregate = clazz(size)
+
+        for rule in model.clf.rules:
+            rule_count, antecedent_count = clazz.rule_counts(rule, size)
+
+            entry = aggregate.antecedents.setdefault(
+                RuleMergeEngine.antecedent_key(rule.antecedent), [0, {}])
+
+            # one dataset can contribute only once to antecedent count
+            entry[0] = max(entry[0], antecedent_count)
+            aggregate._add_consequent(entry[1], RuleMergeEngine.consequent_key(rule.consequent), rule_count, rule)
+
+        return aggregate
+
+    def update(self, other):
+        """Adds counts of other aggregate to this one
+        and returns self.
+        """
+        self.size += other.size
+
+        for key, (antecedent_count, consequents) in other.antecedents.items():
+            entry = self.antecedents.setdefault(key, [0, {}])
+            entry[0] += antecedent_count
+
+            for consequent_key, (rule_count, rule) in consequents.items():
+                self._add_consequent(entry[1], consequent_key, rule_count, rule)
+
+        return self
+
+    def merge(self, other):
+        """Returns a new aggregate holding counts
+        of both aggregates.
+        """
+        merged = RuleCountAggregate()
+        merged.update(self)
+        merged.update(other)
+
+        return merged
+
+    def scale(self, weight):
+        """Multiplies the size and all counts by weight
+        (e.g. to let a stale model count less) and
+        returns self. Counts are rounded, a non-empty
+        aggregate keeps a size of at least 1.
+        """
+        self.size = max(1, round(self.size * weight)) if self.size else 0
+
+        for entry in self.antecedents.values():
+            entry[0] = round(entry[0] * weight)
+
+            for consequent in entry[1].values():
+                consequent[0] = round(consequent[0] * weight)
+
+        return self
+
+    def rules(self):
+        """Materializes the aggregate into a sorted list of CARs.
+
+        For every antecedent only the consequent with the highest
+        count is kept (duCBA conflict resolution). Its support
+        and confidence are computed from the counts.
+        """
+        rules = []
+
+        for antecedent_count, consequents in self.antecedents.values():
+            # ties are broken by consequent key so that
+            # the result does not depend on merge order
+            consequent_key = max(consequents, key=lambda k: (consequents[k][0], k))
+            rule_count, template = consequents[consequent_key]
+
+            rule = copy.copy(template)
+            rule.support_count = rule_count
+            rule.antecedent_count = antecedent_count
+            rule.support = rule_count / self.size if self.size else 0
+            rule.confidence = rule_count / antecedent_count if antecedent_count else 0
+
+            rules.append(rule)
+
+        rules.sort(reverse=True)
+
+        return rules
+
+    def discard(self, rules):
+        """Removes statistics of antecedents of given rules
+        (e.g. evicted from the global model).
+        """
+        for rule in rules:
+            self.antecedents.pop(RuleMergeEngine.antecedent_key(rule.antecedent), None)
+
+    def __len__(self):
+        return len(self.antecedents)
+
+    def _add_consequent(self, consequents, key, rule_count, rule):
+        entry = consequents.get(key)
+
+        if entry is None:
+            consequents[key] = [rule_count, rule]
+        else:
+            entry[0] += rule_count
+            # keep the same representative regardless of merge order
+            if rule.rid < entry[1].rid:
+                entry[1] = rule
+
+
+def scale_rule_counts(rules, weight):
+    """Multiplies support_count and antecedent_count
+    of rules by weight (e.g. to let a stale model
+    count less), supports and confidences stay the
+    same. Rules without counts are left as they are.
+
+    Parameters
+    ----------
+    rules: list of ClassAssocationRule
+
+    weight: float
+    """
+    for rule in rules:
+        if rule.support_count and rule.antecedent_count:
+            rule.support_count = round(rule.support_count * weight)
+            rule.antecedent_count = round(rule.antecedent_count * weight)
+
+
+def evict_rules(rules, budget):
+    """Keeps at most budget rules with the highest
+    CBA precedence (confidence, support, length, id).
+
+    Rules are pushed through a min-heap of size budget
+    whose root is the weakest kept rule, so only
+    O(n log budget) comparisons are needed.
+
+    Parameters
+    ----------
+    rules: list of ClassAssocationRule
+
+    budget: int
+        maximum number of rules to keep
+
+    Returns
+    -------
+    (kept, evicted) tuple of lists, kept is sorted
+    by precedence
+    """
+    if budget < 0:
+        raise Exception("budget cannot be negative")
+
+    heap = []
+    evicted = []
+
+    for rule in rules:
+        if len(heap) < budget:
+            heapq.heappush(heap, rule)
+        elif heap and rule > heap[0]:
+            evicted.append(heapq.heapreplace(heap, rule))
+        else:
+            evicted.append(rule)
+
+    heap.sort(reverse=True)
+
+    return heap, evicted
@@ -3,7 +3,11 @@ from .algorithms import (
     M2Algorithm,
     generateCARs,
     createCARs,
-    top_rules
+    top_rules,
+    RuleMergeEngine,
+    RuleCountAggregate,
+    encode_model,
+    decode_model
 )
 from .data_structures import TransactionDB
 
@@ -89,6 +93,7 @@ class CBA():
         if not isinstance(transactions, TransactionDB):
             raise Exception("transactions must be of type TransactionDB")
         self.target_class = transactions.header[-1]
+        self.size = len(transactions)
         used_algorithm = self.available_algorithms[self.algorithm]
         cars = None
         if len(top_rules) > 0:
@@ -133,7 +138,19 @@ class CBA():
 
         return self.clf.predict_matched_rule_all(X)
 
-    def update_cba_model(self, n1, new_transactions, use_top_rules=False):
+    def to_bytes(self):
+        """Encodes the model into the compact columnar
+        binary format used for sending models between
+        clients, API and server.
+        """
+        return encode_model(self)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Decodes a model encoded with CBA.to_bytes."""
+        return decode_model(data, cls())
+
+    def update_cba_model(self, n1, new_transactions, use_top_rules=False, merge_engine=None):
         """
         This function updates CBA model with new coming training data. If use_top_rules parameter is True, top_rules
         function uses to generate rules.
@@ -143,9 +160,9 @@ class CBA():
         n1 : integer
         new_transactions : TransactionDB
         use_top_rules : boolean
-        :return:
+        merge_engine : RuleMergeEngine
+        :return: MergeStats
         """
-        print(self.support, self.confidence)
         cba = CBA(support=float(self.support / 100), confidence=float(self.confidence / 100), algorithm="m1")
 
         # number of new coming rules
@@ -156,94 +173,53 @@ class CBA():
         else:
             cba.fit(new_transactions)
         # update rule metric if rules are same, otherwise add new rule.
-        new_rules = list()
-        for i in range(len(cba.clf.rules)):
-            is_new_lhs_rhs = True
-            for j in range(0, len(self.clf.rules)):
-                sup1 = self.clf.rules[j].support
-                sup2 = cba.clf.rules[i].support
-                conf1 = self.clf.rules[j].confidence
-                conf2 = cba.clf.rules[i].confidence
-                if self.clf.rules[j].antecedent.string() == cba.clf.rules[i].antecedent.string() and self.clf.rules[
-                    j].consequent.string() == cba.clf.rules[i].consequent.string():
-                    is_new_lhs_rhs = False
-                    self.clf.rules[j].support = self.update_support(sup1, sup2, n1, n2)
-                    self.clf.rules[j].confidence = self.update_confidence(sup1, sup2, conf1, conf2, n1, n2)
-                    print("Updated rule: {} with conf:{} and support:{}".
-                          format(self.clf.rules[j], self.clf.rules[j].support, self.clf.rules[j].confidence))
-                elif self.clf.rules[j].antecedent.string() == cba.clf.rules[i].antecedent.string() and self.clf.rules[
-                    j].consequent.string() != cba.clf.rules[i].consequent.string():
-                    is_new_lhs_rhs = False
-                    freq1 = n1 * sup1
-                    freq2 = n2 * sup2
-                    # keep rule has greater frequency
-                    if (freq1 >= freq2):
-                        self.clf.rules[j].support = self.update_support(sup1, sup2, n1, n2)
-                        self.clf.rules[j].confidence = self.update_confidence(sup1, sup2, conf1, conf2, n1, n2)
-                        print("Updated rule: {} with conf:{} and support:{}".
-                              format(self.clf.rules[j], self.clf.rules[j].support, self.clf.rules[j].confidence))
-                    else:
-                        # if the new rule has the same lhs and different rhs with any older rules.
-                        cba.clf.rules[i].support = self.update_new_rule_support(sup2, n1, n2)
-                        cba.clf.rules[i].confidence = self.update_new_rule_confidence(sup1, sup2, conf1, conf2, n1, n2)
-                        self.clf.rules[j] = cba.clf.rules[i]
-            # if the lhs and rhs are new
-            if is_new_lhs_rhs:
-                cba.clf.rules[i].support = self.update_new_rule_support(sup2, n1, n2)
-                new_rules.append(cba.clf.rules[i])
-        self.clf.rules += new_rules
-        new_rules.clear()
-        self.clf.rules.sort(reverse=True)
-
-    def update_cba_model2(self,  model_list, global_model, global_size):
-        main_model = global_model
-        print("size:", global_size)
-        size = global_size
-        print("size:", size)
+        if merge_engine is None:
+            merge_engine = RuleMergeEngine()
+        merge_engine.merge([{"model": cba, "size": n2}], self, n1)
+
+        return merge_engine.stats
+
+    def update_cba_model2(self,  model_list, global_model, global_size, merge_engine=None, return_stats=False):
+        """
+        This function merges client models into the global model (duCBA). Rules
+        are matched through the hash index of a RuleMergeEngine. The engine can be
+        kept by the caller between merges so that the index is not rebuilt every time.
+
+        Parameters
+        ----------
+        model_list : list of dict - {"model": CBA, "size": int}
+        global_model : CBA
+        global_size : integer
+        merge_engine : RuleMergeEngine
+        return_stats : boolean - MergeStats of the merge is returned as well
+        :return: (CBA, integer) or (CBA, integer, MergeStats)
+        """
+        if merge_engine is None:
+            merge_engine = RuleMergeEngine()
+        global_model, size = merge_engine.merge(model_list, global_model, global_size)
+        if return_stats:
+            return global_model, size, merge_engine.stats
+        return global_model, size
+
+    def update_cba_model_counts(self, model_list, global_model, global_size):
+        """
+        This function merges client models into the global model by adding absolute
+        rule and antecedent counts. Unlike update_cba_model2 the result does not
+        depend on the order of the models in model_list.
+
+        Parameters
+        ----------
+        model_list : list of dict - {"model": CBA, "size": int}
+        global_model : CBA
+        global_size : integer
+        :return: (CBA, integer)
+        """
+        aggregate = RuleCountAggregate.from_model(global_model, global_size)
         for cba_model in model_list:
-            print(cba_model["size"])
-            n2 = cba_model["size"]
-            new_rules = list()
-            for i in range(len(cba_model["model"].clf.rules)):
-                is_new_lhs_rhs = True
-                for j in range(0, len(main_model.clf.rules)):
-                    sup1 = main_model.clf.rules[j].support
-                    sup2 = cba_model["model"].clf.rules[i].support
-                    conf1 = main_model.clf.rules[j].confidence
-                    conf2 = cba_model["model"].clf.rules[i].confidence
-                    if main_model.clf.rules[j].antecedent.string() == cba_model["model"].clf.rules[i].antecedent.string() and main_model.clf.rules[
-                        j].consequent.string() == cba_model["model"].clf.rules[i].consequent.string():
-                        is_new_lhs_rhs = False
-                        main_model.clf.rules[j].support = self.update_support(sup1, sup2, size, n2)
-                        main_model.clf.rules[j].confidence = self.update_confidence(sup1, sup2, conf1, conf2, size, n2)
-                        print("Updated rule: {} with conf:{} and support:{}".
-                            format(main_model.clf.rules[j], main_model.clf.rules[j].support, main_model.clf.rules[j].confidence))
-                    elif main_model.clf.rules[j].antecedent.string() == cba_model["model"].clf.rules[i].antecedent.string() and main_model.clf.rules[
-                        j].consequent.string() != cba_model["model"].clf.rules[i].consequent.string():
-                        is_new_lhs_rhs = False
-                        freq1 = size * sup1
-                        freq2 = n2 * sup2
-                        # keep rule has greater frequency
-                        if (freq1 >= freq2):
-                            main_model.clf.rules[j].support = self.update_support(sup1, sup2, size, n2)
-                            main_model.clf.rules[j].confidence = self.update_confidence(sup1, sup2, conf1, conf2, size, n2)
-                            print("Updated rule: {} with conf:{} and support:{}".
-                                format(main_model.clf.rules[j], main_model.clf.rules[j].support, main_model.clf.rules[j].confidence))
-                        else:
-                            # if the new rule has the same lhs and different rhs with any older rules.
-                            cba_model["model"].clf.rules[i].support = self.update_new_rule_support(sup2, size, n2)
-                            cba_model["model"].clf.rules[i].confidence = self.update_new_rule_confidence(sup1, sup2, conf1, conf2, size, n2)
-                            main_model.clf.rules[j] = cba_model["model"].clf.rules[i]
-                # if the lhs and rhs are new
-                if is_new_lhs_rhs:
-                    cba_model["model"].clf.rules[i].support = self.update_new_rule_support(sup2, size, n2)
-                    new_rules.append(cba_model["model"].clf.rules[i])
-            main_model.clf.rules += new_rules
-            size = size + n2
-            print("size:", size)
-            new_rules.clear()
-            main_model.clf.rules.sort(reverse=True)
-        return main_model,size
+            aggregate.update(RuleCountAggregate.from_model(cba_model["model"], cba_model["size"]))
+
+        global_model.clf.rules = aggregate.rules()
+        return global_model, aggregate.size
 
     def update_support(self, sup1, sup2, n1, n2):
         """
@@ -0,0 +1,117 @@
+import unittest
+import pickle
+import pandas as pd
+from pyarc import CBA
+from pyarc.algorithms import (
+    generateCARs,
+    Classifier,
+    compress_payload,
+    decompress_payload,
+    negotiate_codec,
+    COMPRESSION_CODECS
+)
+from pyarc.data_structures import (
+    ClassAssocationRule,
+    TransactionDB
+)
+import os
+
+dataset_file = os.path.dirname(os.path.realpath(__file__)) + "/data/titanic.csv"
+
+
+def rule_fields(rule):
+    return (
+        list(rule.antecedent.itemset.items()), rule.antecedent.frozenset,
+        rule.consequent.attribute, rule.consequent.value,
+        rule.support, rule.confidence, rule.support_count, rule.antecedent_count,
+        rule.rulelen, rule.rid
+    )
+
+
+class TestModelCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.txns = TransactionDB.from_DataFrame(pd.read_csv(dataset_file))
+
+    def test_roundtrip(self):
+        cba = CBA(support=0.05, confidence=0.5).fit(self.txns)
+
+        decoded = CBA.from_bytes(cba.to_bytes())
+
+        self.assertEqual(
+            [rule_fields(rule) for rule in decoded.clf.rules],
+            [rule_fields(rule) for rule in cba.clf.rules])
+
+        for field in ("support", "confidence", "maxlen", "algorithm", "size", "target_class"):
+            self.assertEqual(getattr(decoded, field), getattr(cba, field))
+
+        for field in ("default_class", "default_class_attribute",
+                      "default_class_confidence", "default_class_support"):
+            self.assertEqual(getattr(decoded.clf, field), getattr(cba.clf, field))
+
+        self.assertEqual(decoded.clf.default_rule.rid, cba.clf.default_rule.rid)
+        self.assertEqual(decoded.predict(self.txns), cba.predict(self.txns))
+
+    def test_smaller_than_hex_pickle(self):
+        cba = CBA()
+        cba.clf = Classifier()
+        cba.clf.rules = generateCARs(self.txns, support=1, confidence=1)
+
+        self.assertLess(len(cba.to_bytes()) * 4, len(pickle.dumps(cba).hex()))
+
+    def test_rule_ids_not_advanced(self):
+        cba = CBA(support=0.05, confidence=0.5).fit(self.txns)
+        data = cba.to_bytes()
+
+        rule_id = ClassAssocationRule.id
+        CBA.from_bytes(data)
+
+        self.assertEqual(ClassAssocationRule.id, rule_id)
+
+    def test_untrained_model(self):
+        decoded = CBA.from_bytes(CBA(support=0.2, algorithm="m2").to_bytes())
+
+        self.assertIsNone(decoded.clf)
+        self.assertEqual(decoded.algorithm, "m2")
+        self.assertAlmostEqual(decoded.support, 20)
+
+    def test_invalid_data(self):
+        self.assertRaises(Exception, CBA.from_bytes, b"")
+        self.assertRaises(Exception, CBA.from_bytes, pickle.dumps(CBA()))
+
+
+class TestPayloadCompression(unittest.TestCase):
+
+    def setUp(self):
+        cba = CBA()
+        cba.clf = Classifier()
+        cba.clf.rules = generateCARs(TransactionDB.from_DataFrame(pd.read_csv(dataset_file)), support=1, confidence=1)
+        self.data = cba.to_bytes()
+
+    def test_roundtrip(self):
+        for codec in COMPRESSION_CODECS:
+            compressed, stats = compress_payload(self.data, codec)
+            raw, _ = decompress_payload(compressed, codec)
+
+            self.assertEqual(raw, self.data)
+            self.assertEqual(stats["raw_size"], len(self.data))
+            self.assertEqual(stats["compressed_size"], len(compressed))
+
+            if codec != "none":
+                self.assertLess(len(compressed), len(self.data))
+
+    def test_level(self):
+        _, default = compress_payload(self.data, "zlib")
+        _, fastest = compress_payload(self.data, "zlib", 1)
+
+        self.assertEqual(default["level"], 6)
+        self.assertEqual(fastest["level"], 1)
+
+    def test_unsupported_codec(self):
+        self.assertRaises(Exception, compress_payload, self.data, "brotli")
+        self.assertRaises(Exception, decompress_payload, self.data, "brotli")
+
+    def test_negotiate_codec(self):
+        self.assertEqual(negotiate_codec("brotli, LZMA, zlib"), "lzma")
+        self.assertIsNone(negotiate_codec("brotli"))
+        self.assertIsNone(negotiate_codec(None))
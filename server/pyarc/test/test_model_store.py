@@ -0,0 +1,96 @@
+import unittest
+import copy
+import os
+import tempfile
+import pandas as pd
+from pyarc import CBA
+from pyarc.algorithms import ModelStore, Classifier, generateCARs, rule_fields, LOG_FILE, OBJECTS_DIR
+from pyarc.data_structures import TransactionDB
+
+dataset_file = os.path.dirname(os.path.realpath(__file__)) + "/data/titanic.csv"
+
+
+def model_fields(model):
+    return [rule_fields(rule) for rule in model.clf.rules], model.clf.default_class
+
+
+class TestModelStore(unittest.TestCase):
+
+    def setUp(self):
+        txns = TransactionDB.from_DataFrame(pd.read_csv(dataset_file))
+        self.model = CBA()
+        self.model.clf = Classifier()
+        self.model.clf.rules = generateCARs(txns, support=1, confidence=1)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def versions(self, count):
+        """yields successive versions of the model, each
+        with a changed, a removed and a new rule
+        """
+        model = copy.deepcopy(self.model)
+        for version in range(1, count + 1):
+            if version > 1:
+                model.clf.rules[0].support_count += 1
+                removed = model.clf.rules.pop()
+                removed.rid += 1000
+                model.clf.rules.insert(1, removed)
+            yield version, model
+
+    def test_versions_roundtrip(self):
+        store = ModelStore(self.path, CBA, snapshot_interval=3)
+        saved = {}
+        for version, model in self.versions(7):
+            store.save(model, version)
+            saved[version] = model_fields(model)
+
+        reopened = ModelStore(self.path, CBA, snapshot_interval=3)
+        self.assertEqual(reopened.version, 7)
+
+        for version, fields in saved.items():
+            self.assertEqual(model_fields(reopened.load(version)), fields)
+
+        self.assertIsNone(reopened.load(8))
+
+    def test_delta_smaller_than_snapshot(self):
+        store = ModelStore(self.path, CBA)
+        stats = [store.save(model, version) for version, model in self.versions(2)]
+
+        self.assertEqual([s["kind"] for s in stats], ["snapshot", "delta"])
+        self.assertLess(stats[1]["bytes"] * 4, stats[0]["bytes"])
+
+    def test_content_addressed_snapshots(self):
+        store = ModelStore(self.path, CBA, snapshot_interval=1)
+        store.save(self.model, 1)
+        store.save(self.model, 2)
+
+        self.assertEqual(len(os.listdir(os.path.join(self.path, OBJECTS_DIR))), 1)
+        self.assertEqual(model_fields(store.load(1)), model_fields(store.load(2)))
+
+    def test_torn_record(self):
+        store = ModelStore(self.path, CBA)
+        for version, model in self.versions(3):
+            store.save(model, version)
+        expected = model_fields(model)
+
+        with open(os.path.join(self.path, LOG_FILE), "ab") as file:
+            file.write(b"\x04\x00\x00\x00torn")
+
+        reopened = ModelStore(self.path, CBA)
+        self.assertEqual(reopened.version, 3)
+        self.assertEqual(model_fields(reopened.load()), expected)
+
+        for version, model in self.versions(4):
+            pass
+        reopened.save(model, 4)
+        self.assertEqual(model_fields(ModelStore(self.path, CBA).load(4)), model_fields(model))
+
+    def test_older_version(self):
+        store = ModelStore(self.path, CBA)
+        store.save(self.model, 2)
+
+        self.assertRaises(Exception, store.save, self.model, 2)
+        self.assertIsNone(store.load(1))
@@ -0,0 +1,369 @@
+import unittest
+import copy
+import pandas as pd
+from pyarc import CBA
+from pyarc.algorithms import (
+    RuleMergeEngine,
+    VectorizedRuleMergeEngine,
+    RuleCountAggregate,
+    Classifier,
+    generateCARs,
+    evict_rules
+)
+from pyarc.data_structures import (
+    Item,
+    Antecedent,
+    Consequent,
+    ClassAssocationRule,
+    TransactionDB
+)
+from utils import HiddenPrints
+import os
+
+dataset_file = os.path.dirname(os.path.realpath(__file__)) + "/data/titanic.csv"
+
+
+def reference_merge(model_list, main_model, size):
+    """pairwise merge that compares every incoming rule
+    with every global rule
+    """
+    for cba_model in model_list:
+        n2 = cba_model["size"]
+        new_rules = []
+        for rule in cba_model["model"].clf.rules:
+            is_new_lhs_rhs = True
+            for j in range(len(main_model.clf.rules)):
+                global_rule = main_model.clf.rules[j]
+                sup1, sup2 = global_rule.support, rule.support
+                conf1, conf2 = global_rule.confidence, rule.confidence
+                if global_rule.antecedent.string() != rule.antecedent.string():
+                    continue
+                is_new_lhs_rhs = False
+                if global_rule.consequent.string() != rule.consequent.string() and size * sup1 < n2 * sup2:
+                    rule.support = main_model.update_new_rule_support(sup2, size, n2)
+                    rule.confidence = main_model.update_new_rule_confidence(sup1, sup2, conf1, conf2, size, n2)
+                    main_model.clf.rules[j] = rule
+                else:
+                    global_rule.support = main_model.update_support(sup1, sup2, size, n2)
+                    global_rule.confidence = main_model.update_confidence(sup1, sup2, conf1, conf2, size, n2)
+            if is_new_lhs_rhs:
+                rule.support = main_model.update_new_rule_support(sup2, size, n2)
+                new_rules.append(rule)
+        main_model.clf.rules += new_rules
+        size += n2
+        main_model.clf.rules.sort(reverse=True)
+
+    return main_model, size
+
+
+def model_with_rules(rules):
+    model = CBA()
+    model.clf = Classifier()
+    model.clf.rules = rules
+
+    return model
+
+
+def rule_tuples(model):
+    return [
+        (r.antecedent.string(), r.consequent.string(), r.support, r.confidence)
+        for r in model.clf.rules
+    ]
+
+
+class TestRuleMergeEngine(unittest.TestCase):
+
+    def fit_partitions(self, count):
+        df = pd.read_csv(dataset_file).sample(frac=1, random_state=3)
+        partition_len = len(df) // count
+
+        models = []
+        for i in range(count):
+            part = df.iloc[i * partition_len:(i + 1) * partition_len]
+            txns = TransactionDB.from_DataFrame(part)
+            cba = CBA(support=0.05, confidence=0.5).fit(txns)
+            models.append({"model": cba, "size": len(part)})
+
+        return models
+
+    def test_merge_matches_reference(self):
+        models = self.fit_partitions(4)
+        reference_models = copy.deepcopy(models)
+
+        with HiddenPrints():
+            engine = RuleMergeEngine()
+            merged, size = models[0]["model"].update_cba_model2(
+                models[1:], models[0]["model"], models[0]["size"], engine)
+
+        expected, expected_size = reference_merge(
+            reference_models[1:], reference_models[0]["model"], reference_models[0]["size"])
+
+        self.assertEqual(size, expected_size)
+        self.assertEqual(rule_tuples(merged), rule_tuples(expected))
+
+    def test_unpruned_rules_match_reference(self):
+        # mined CARs contain several consequents for one antecedent
+        df = pd.read_csv(dataset_file).sample(frac=1, random_state=5)
+        models = []
+        for part in (df.iloc[:600], df.iloc[600:1200], df.iloc[1200:]):
+            rules = generateCARs(TransactionDB.from_DataFrame(part), support=1, confidence=1)
+            models.append({"model": model_with_rules(rules), "size": len(part)})
+        reference_models = copy.deepcopy(models)
+
+        with HiddenPrints():
+            for engine_class in (RuleMergeEngine, VectorizedRuleMergeEngine):
+                candidate_models = copy.deepcopy(models)
+                merged, size = engine_class().merge(
+                    candidate_models[1:], candidate_models[0]["model"], candidate_models[0]["size"])
+
+                expected, expected_size = reference_merge(
+                    copy.deepcopy(reference_models[1:]), copy.deepcopy(reference_models[0]["model"]),
+                    reference_models[0]["size"])
+
+                self.assertEqual(size, expected_size)
+                self.assertEqual(rule_tuples(merged), rule_tuples(expected))
+
+    def test_rule_filling_two_positions(self):
+        # the second client rule replaces both global rules, the
+        # fourth one replaces only one of the two positions
+        def models():
+            ant = Antecedent([Item("a", 1)])
+            global_model = model_with_rules([
+                ClassAssocationRule(ant, Consequent("y", 0), 0.16, 0.8),
+                ClassAssocationRule(ant, Consequent("y", 1), 0.38, 0.71)
+            ])
+            clients = [
+                {"model": model_with_rules([ClassAssocationRule(ant, Consequent("y", value), support, confidence)]),
+                 "size": 100}
+                for value, support, confidence in ((1, 0.35, 0.05), (0, 0.63, 0.71), (1, 0.98, 0.08), (1, 0.7, 0.52))
+            ]
+            return global_model, clients
+
+        global_model, clients = models()
+        expected, expected_size = reference_merge(clients, global_model, 100)
+
+        with HiddenPrints():
+            for engine_class in (RuleMergeEngine, VectorizedRuleMergeEngine):
+                global_model, clients = models()
+                merged, size = global_model.update_cba_model2(clients, global_model, 100, engine_class())
+
+                self.assertEqual(size, expected_size)
+                self.assertEqual(rule_tuples(merged), rule_tuples(expected))
+
+    def test_index_persists_between_merges(self):
+        models = self.fit_partitions(3)
+        engine = RuleMergeEngine()
+
+        with HiddenPrints():
+            global_model, size = engine.merge(models[1:2], models[0]["model"], models[0]["size"])
+            index = engine.index
+            self.assertFalse(engine.is_stale(global_model))
+
+            global_model, size = engine.merge(models[2:], global_model, size)
+
+        self.assertIs(engine.index, index)
+        self.assertEqual(
+            sum(len(rules) for c in engine.index.values() for rules in c.values()),
+            len(global_model.clf.rules))
+
+    def test_conflicting_rule_replaced(self):
+        ant = Antecedent([Item("a", 1), Item("b", 2)])
+        # same antecedent with items inserted in different order
+        ant_reordered = Antecedent([Item("b", 2), Item("a", 1)])
+
+        global_rule = ClassAssocationRule(ant, Consequent("y", 0), 0.1, 0.6)
+        client_rule = ClassAssocationRule(ant_reordered, Consequent("y", 1), 0.5, 0.9)
+
+        global_model = model_with_rules([global_rule])
+        client_model = model_with_rules([client_rule])
+
+        with HiddenPrints():
+            merged, size = RuleMergeEngine().merge(
+                [{"model": client_model, "size": 100}], global_model, 100)
+
+        self.assertEqual(size, 200)
+        self.assertEqual(len(merged.clf.rules), 1)
+        self.assertIs(merged.clf.rules[0], client_rule)
+        self.assertAlmostEqual(client_rule.confidence, (0.5 * 100 * 0.6 * 0.9) / (0.1 * 100 * 0.9 + 0.5 * 100 * 0.6))
+
+
+    def test_merge_stats(self):
+        ant_a = Antecedent([Item("a", 1)])
+        ant_b = Antecedent([Item("b", 1)])
+
+        client_rules = lambda: [
+            ClassAssocationRule(ant_a, Consequent("y", 0), 0.2, 0.6),
+            ClassAssocationRule(ant_b, Consequent("y", 1), 0.4, 0.9),
+            ClassAssocationRule(Antecedent([Item("c", 1)]), Consequent("y", 1), 0.2, 0.7),
+            ClassAssocationRule(Antecedent([Item("d", 1)]), Consequent("y", 1), 0.01, 0.7),
+        ]
+        global_rules = lambda: [
+            ClassAssocationRule(ant_a, Consequent("y", 0), 0.3, 0.9),
+            ClassAssocationRule(ant_b, Consequent("y", 0), 0.1, 0.8),
+        ]
+
+        for engine_class in (RuleMergeEngine, VectorizedRuleMergeEngine):
+            engine = engine_class()
+            engine.merge(
+                [{"model": model_with_rules(client_rules()), "size": 100, "id": "c1"}],
+                model_with_rules(global_rules()), 100)
+
+            stats = engine.stats
+            self.assertEqual(
+                (stats.matched, stats.conflict_kept, stats.conflict_replaced, stats.new), (1, 0, 1, 2))
+            self.assertEqual((stats.size_before, stats.size_after), (100, 200))
+            self.assertEqual((stats.rules_before, stats.rules_after), (2, 4))
+            self.assertEqual(stats.clients[0]["id"], "c1")
+            self.assertEqual(stats.as_dict()["new"], 2)
+
+
+class TestRuleCountAggregate(unittest.TestCase):
+
+    def fit_partitions(self, count):
+        return TestRuleMergeEngine.fit_partitions(self, count)
+
+    def rule_stats(self, rules):
+        return sorted(
+            (RuleMergeEngine.antecedent_key(r.antecedent), r.consequent.string(),
+             r.support_count, r.antecedent_count, round(r.support, 12), round(r.confidence, 12))
+            for r in rules
+        )
+
+    def test_generated_rules_have_counts(self):
+        models = self.fit_partitions(1)
+        model, size = models[0]["model"], models[0]["size"]
+
+        self.assertEqual(model.size, size)
+        for rule in model.clf.rules:
+            self.assertAlmostEqual(rule.support, rule.support_count / size)
+            self.assertAlmostEqual(rule.confidence, rule.support_count / rule.antecedent_count)
+
+    def test_merge_is_order_independent(self):
+        models = self.fit_partitions(4)
+        aggregates = [RuleCountAggregate.from_model(m["model"], m["size"]) for m in models]
+
+        sequential = RuleCountAggregate()
+        for aggregate in aggregates:
+            sequential.update(aggregate)
+
+        reversed_order = RuleCountAggregate()
+        for aggregate in reversed(aggregates):
+            reversed_order.update(aggregate)
+
+        tree = aggregates[0].merge(aggregates[1]).merge(aggregates[2].merge(aggregates[3]))
+
+        self.assertEqual(sequential.size, sum(m["size"] for m in models))
+        self.assertEqual(self.rule_stats(sequential.rules()), self.rule_stats(reversed_order.rules()))
+        self.assertEqual(self.rule_stats(sequential.rules()), self.rule_stats(tree.rules()))
+
+    def test_conflict_keeps_higher_count(self):
+        ant = Antecedent([Item("a", 1)])
+
+        first = model_with_rules([ClassAssocationRule(ant, Consequent("y", 0), 0.3, 0.75)])
+        second = model_with_rules([ClassAssocationRule(ant, Consequent("y", 1), 0.2, 0.5)])
+
+        merged, size = CBA().update_cba_model_counts([{"model": second, "size": 100}], first, 100)
+
+        self.assertEqual(size, 200)
+        self.assertEqual(len(merged.clf.rules), 1)
+
+        rule = merged.clf.rules[0]
+        self.assertEqual(rule.consequent.value, "0")
+        self.assertEqual((rule.support_count, rule.antecedent_count), (30, 80))
+        self.assertAlmostEqual(rule.support, 30 / 200)
+        self.assertAlmostEqual(rule.confidence, 30 / 80)
+
+    def test_scaled_model_pulls_support_less(self):
+        ant = Antecedent([Item("a", 1)])
+
+        fresh = model_with_rules([ClassAssocationRule(ant, Consequent("y", 0), 0.2, 0.5)])
+        stale = model_with_rules([ClassAssocationRule(ant, Consequent("y", 0), 0.6, 0.75)])
+
+        unweighted = RuleCountAggregate.from_model(fresh, 100).merge(RuleCountAggregate.from_model(stale, 100))
+        weighted = RuleCountAggregate.from_model(fresh, 100).merge(
+            RuleCountAggregate.from_model(stale, 100).scale(0.5))
+
+        self.assertEqual(weighted.size, 150)
+
+        rule = weighted.rules()[0]
+        self.assertEqual((rule.support_count, rule.antecedent_count), (50, 80))
+        self.assertAlmostEqual(rule.support, 50 / 150)
+        self.assertLess(rule.support, unweighted.rules()[0].support)
+
+
+class TestVectorizedRuleMergeEngine(unittest.TestCase):
+
+    def fit_partitions(self, count):
+        return TestRuleMergeEngine.fit_partitions(self, count)
+
+    def test_same_numbers_as_scalar_path(self):
+        models = self.fit_partitions(4)
+        scalar_models = copy.deepcopy(models)
+
+        with HiddenPrints():
+            engine = VectorizedRuleMergeEngine()
+            merged, size = engine.merge(models[1:], models[0]["model"], models[0]["size"])
+
+            expected, expected_size = RuleMergeEngine().merge(
+                scalar_models[1:], scalar_models[0]["model"], scalar_models[0]["size"])
+
+        self.assertEqual(size, expected_size)
+        self.assertEqual(rule_tuples(merged), rule_tuples(expected))
+
+    def test_resolution_arrays(self):
+        ant_a = Antecedent([Item("a", 1)])
+        ant_b = Antecedent([Item("b", 1)])
+        ant_c = Antecedent([Item("c", 1)])
+
+        global_model = model_with_rules([
+            ClassAssocationRule(ant_a, Consequent("y", 0), 0.3, 0.9),
+            ClassAssocationRule(ant_b, Consequent("y", 0), 0.1, 0.8),
+        ])
+        client_model = model_with_rules([
+            ClassAssocationRule(ant_c, Consequent("y", 1), 0.2, 0.7),
+            ClassAssocationRule(ant_b, Consequent("y", 1), 0.4, 0.9),
+            ClassAssocationRule(ant_a, Consequent("y", 0), 0.2, 0.6),
+        ])
+
+        engine = VectorizedRuleMergeEngine()
+        with HiddenPrints():
+            engine.merge([{"model": client_model, "size": 100}], global_model, 100)
+
+        resolution = engine.resolutions[-1]
+
+        self.assertEqual(resolution["matched"][0].tolist(), [2])
+        self.assertEqual(resolution["matched"][1].tolist(), [0])
+        self.assertEqual(resolution["conflict_replaced"][0].tolist(), [1])
+        self.assertEqual(resolution["conflict_replaced"][1].tolist(), [1])
+        self.assertEqual(len(resolution["conflict_kept"][0]), 0)
+        self.assertEqual(resolution["new"].tolist(), [0])
+        self.assertEqual(len(global_model.clf.rules), 3)
+
+
+class TestEvictRules(unittest.TestCase):
+
+    def test_keeps_highest_precedence(self):
+        rules = [
+            ClassAssocationRule(Antecedent([Item("a", i)]), Consequent("y", 0), support, confidence)
+            for i, (support, confidence) in enumerate([(0.1, 0.9), (0.3, 0.6), (0.2, 0.9), (0.5, 0.5), (0.1, 0.7)])
+        ]
+
+        kept, evicted = evict_rules(rules, 3)
+
+        self.assertEqual(kept, sorted(rules, reverse=True)[:3])
+        self.assertEqual(len(evicted), 2)
+        self.assertTrue(all(kept[-1] > rule for rule in evicted))
+
+    def test_engine_index_follows_eviction(self):
+        models = TestRuleMergeEngine.fit_partitions(self, 3)
+        engine = RuleMergeEngine()
+
+        with HiddenPrints():
+            global_model, size = engine.merge(models[1:], models[0]["model"], models[0]["size"])
+
+        global_model.clf.rules, evicted = evict_rules(global_model.clf.rules, 2)
+        engine.discard(evicted)
+
+        self.assertFalse(engine.is_stale(global_model))
+        self.assertEqual(
+            sum(len(rules) for c in engine.index.values() for rules in c.values()), 2)
@@ -0,0 +1,232 @@
+import unittest
+import os
+import sys
+import copy
+import pickle
+import importlib
+import tempfile
+import pandas as pd
+from pyarc import CBA
+from pyarc.algorithms import RuleCountAggregate, Classifier, generateCARs, compress_payload
+from pyarc.data_structures import TransactionDB
+from utils import HiddenPrints
+from ML_class import Server
+
+dataset_file = os.path.dirname(os.path.realpath(__file__)) + "/data/titanic.csv"
+server_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+
+class TestServerRestart(unittest.TestCase):
+
+    def setUp(self):
+        txns = TransactionDB.from_DataFrame(pd.read_csv(dataset_file))
+        self.models = [
+            {"model": CBA(support=support, confidence=0.5).fit(txns), "size": len(txns), "id": i}
+            for i, support in enumerate((0.05, 0.1, 0.15))
+        ]
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def server(self, name):
+        path = os.path.join(self.directory.name, name)
+        server = Server(config_path=path + ".json", store_path=path, aggregation="counts")
+        with HiddenPrints():
+            server.check_save_model()
+        return server
+
+    def merge(self, server, models):
+        with HiddenPrints():
+            server.fed_avg(copy.deepcopy(models))
+
+    def test_size_restored(self):
+        server = self.server("restarted")
+        self.merge(server, self.models[:2])
+
+        restarted = self.server("restarted")
+        self.assertEqual(restarted.size, server.size)
+
+        self.merge(restarted, self.models[2:])
+
+        uninterrupted = self.server("uninterrupted")
+        self.merge(uninterrupted, self.models[:2])
+        self.merge(uninterrupted, self.models[2:])
+
+        self.assertEqual(restarted.size, uninterrupted.size)
+        self.assertLessEqual(max(rule.support for rule in restarted.model.clf.rules), 1)
+        self.assertEqual(
+            sorted((r.support_count, r.antecedent_count) for r in restarted.model.clf.rules),
+            sorted((r.support_count, r.antecedent_count) for r in uninterrupted.model.clf.rules))
+
+    def test_size_from_counts(self):
+        server = self.server("legacy")
+        self.merge(server, self.models[:2])
+
+        # config dosyalarının eski sürümlerinde boyut yoktu
+        restarted = Server(config_path=os.path.join(self.directory.name, "missing.json"),
+                           store_path=os.path.join(self.directory.name, "legacy"), aggregation="counts")
+        restarted.model = restarted.store.load()
+        restarted.restore_size()
+
+        self.assertEqual(restarted.size, server.size)
+
+
+class TestTreeAggregation(unittest.TestCase):
+
+    def setUp(self):
+        # sınıf dağılımları farklı istemciler: aynı öncülün en sık sonucu istemciden istemciye değişir
+        df = pd.read_csv(dataset_file).sample(frac=1, random_state=1).sort_values("Died", kind="stable")
+        self.models = []
+        for i in range(5):
+            txns = TransactionDB.from_DataFrame(df.iloc[i * 400:i * 400 + 600])
+            # budanmamış kurallarda aynı öncülün farklı sonuçları da var, ağacın ara seviyelerinde kaybolmamalılar
+            model = CBA()
+            model.clf = Classifier()
+            model.clf.rules = generateCARs(txns, support=5, confidence=10)
+            model.size = len(txns)
+            self.models.append({"model": model, "size": len(txns), "id": i})
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def merged(self, aggregation):
+        path = os.path.join(self.directory.name, aggregation)
+        server = Server(config_path=path + ".json", store_path=path, aggregation=aggregation, max_workers=2)
+        try:
+            with HiddenPrints():
+                server.check_save_model()
+                server.fed_avg(copy.deepcopy(self.models))
+        finally:
+            server.close()
+        return server
+
+    def test_tree_matches_sequential_counts(self):
+        sequential = self.merged("counts")
+        tree = self.merged("tree")
+
+        self.assertEqual(tree.size, sequential.size)
+        self.assertEqual(
+            [(r.antecedent.string(), r.consequent.string(), r.support_count, r.antecedent_count, r.support, r.confidence)
+             for r in tree.model.clf.rules],
+            [(r.antecedent.string(), r.consequent.string(), r.support_count, r.antecedent_count, r.support, r.confidence)
+             for r in sequential.model.clf.rules])
+
+        # 5 istatistik 3 seviyede teke iner: 5 -> 3 -> 2 -> 1
+        self.assertEqual([(s["level"], s["nodes"]) for s in tree.aggregation_stats],
+                         [(0, 5), (1, 3), (2, 2), (3, 1), ("global", 1)])
+
+
+class TestMergeMessages(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # server.py modülü yüklenirken çalışma dizininde config ve depo oluşturur
+        cls.directory = tempfile.TemporaryDirectory()
+        cwd = os.getcwd()
+        sys.path.insert(0, server_dir)
+        os.chdir(cls.directory.name)
+        try:
+            with HiddenPrints():
+                cls.server = importlib.import_module("server")
+        finally:
+            os.chdir(cwd)
+            sys.path.remove(server_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        txns = TransactionDB.from_DataFrame(pd.read_csv(dataset_file))
+        self.models = [
+            {"model": CBA(support=support, confidence=0.5).fit(txns), "size": len(txns), "id": i}
+            for i, support in enumerate((0.05, 0.1))
+        ]
+
+    def fresh_server(self, name):
+        path = os.path.join(self.directory.name, name)
+        server = Server(config_path=path + ".json", store_path=path, aggregation="counts")
+        with HiddenPrints():
+            server.check_save_model()
+        return server
+
+    def stream_message(self, models):
+        """API'nin stream modunda kapanan tur için gönderdiği mesaj (send_models_via_websocket)."""
+        aggregate = template = None
+        entries = []
+        for i, m in enumerate(models):
+            model_aggregate = RuleCountAggregate.from_model(m["model"], m["size"])
+            if aggregate is None:
+                aggregate = model_aggregate
+                template = copy.copy(m["model"])
+                template.clf = copy.copy(m["model"].clf)
+                template.clf.rules = []
+            else:
+                aggregate.update(model_aggregate)
+            entries.append({"version": 0, "size": m["size"], "time": 1.0, "id": m["id"],
+                            "staleness": 0, "seq": i + 1})
+
+        data = {"models": entries, "format": "binary", "aggregate": aggregate, "template": template}
+        payload, _ = compress_payload(pickle.dumps(data), "zlib")
+        return {"type": "models", "round_id": "stream", "compression": "zlib", "payload": payload}
+
+    def test_stream_message_is_merged(self):
+        self.server.federated_model = self.fresh_server("stream")
+        with HiddenPrints():
+            version = self.server.merge_models(self.stream_message(self.models))
+
+        expected = self.fresh_server("counts")
+        with HiddenPrints():
+            expected.fed_avg(copy.deepcopy(self.models))
+
+        merged = self.server.federated_model
+        self.assertEqual(version, 1)
+        self.assertEqual(merged.size, expected.size)
+        self.assertEqual(
+            sorted((r.support_count, r.antecedent_count) for r in merged.model.clf.rules),
+            sorted((r.support_count, r.antecedent_count) for r in expected.model.clf.rules))
+
+    def async_message(self, models):
+        """API'nin asenkron modda gönderdiği tek modellik tur mesajı."""
+        entries = [{"version": m["version"], "size": m["size"], "time": 1.0, "id": m["id"],
+                    "staleness": 0, "seq": 1, "model": m["model"].to_bytes()} for m in models]
+        data = {"models": entries, "format": "binary", "staleness_decay": 0.5}
+        payload, _ = compress_payload(pickle.dumps(data), "zlib")
+        return {"type": "models", "round_id": "async", "compression": "zlib", "payload": payload}
+
+    def merged_supports(self, name, model_version):
+        df = pd.read_csv(dataset_file).sample(frac=1, random_state=1)
+        first = CBA(support=0.05, confidence=0.5).fit(TransactionDB.from_DataFrame(df.iloc[:900]))
+        second = CBA(support=0.05, confidence=0.5).fit(TransactionDB.from_DataFrame(df.iloc[900:]))
+
+        self.server.federated_model = self.fresh_server(name)
+        with HiddenPrints():
+            self.server.merge_models(self.async_message([{"model": first, "size": 900, "id": 0, "version": 0}]))
+            self.server.merge_models(self.async_message(
+                [{"model": second, "size": len(df) - 900, "id": 1, "version": model_version}]))
+
+        return ({r.antecedent.string(): r.support for r in first.clf.rules},
+                {r.antecedent.string(): r.support for r in self.server.federated_model.model.clf.rules})
+
+    def test_stale_model_pulls_support_less(self):
+        # global model versiyon 1 iken ikinci model versiyon 1 (güncel) veya 0 (bir versiyon eski) ile eğitilmiş
+        first, fresh = self.merged_supports("fresh", 1)
+        _, stale = self.merged_supports("stale", 0)
+
+        pulled = [key for key in first if key in fresh and fresh[key] != first[key]]
+        self.assertTrue(pulled)
+        for key in pulled:
+            self.assertLess(abs(stale[key] - first[key]), abs(fresh[key] - first[key]))
+
+    def test_weighted_part_counts_scaled(self):
+        model = self.models[0]["model"]
+        payload, _ = compress_payload(model.to_bytes(), "zlib")
+        info = {"version": 0, "size": 445, "time": 1.0, "id": 0, "weight": 0.5}
+
+        decoded, = self.server.decode_model_parts([{"info": info, "compression": "zlib", "payload": payload}])
+
+        for rule, scaled in zip(model.clf.rules, decoded["model"].clf.rules):
+            self.assertEqual(scaled.support_count, round(rule.support_count * 0.5))
+            self.assertEqual(scaled.antecedent_count, round(rule.antecedent_count * 0.5))
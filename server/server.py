@@ -1,10 +1,36 @@
+import time
+import uuid
 import asyncio
+import logging
+import itertools
 import websockets
 import pickle
+from concurrent.futures import ThreadPoolExecutor
+from pyarc import CBA
+from pyarc.algorithms import decompress_payload, scale_rule_counts
 from ML_class import Server
 
 # Sabit port numarası
 PORT = 7896
+# Model birleştirme modu: "sequential", "vectorized" (NumPy), "counts" (sayım tabanlı, sıradan bağımsız)
+# veya "tree" (counts ile aynı sonuç, süreç havuzunda ikili ağaç şeklinde toplanır)
+AGGREGATION = "sequential"
+# "tree" modunda süreç havuzunun işçi sayısı (None: işlemci sayısı)
+MAX_WORKERS = None
+# Global modeldeki en fazla kural sayısı (None: sınırsız)
+RULE_BUDGET = None
+# Birleştirme sonrası M1 budaması için doğrulama verisi (None: budama yapılmaz)
+VALIDATION_PATH = None  # ör. "test_heart_data.csv"
+TARGET_COL = "HeartDisease"
+# İstemcilerin özellik seçimiyle aynı olmalı (API'deki feature_selection)
+VALIDATION_DROP = ['BMI', 'AlcoholDrinking', 'MentalHealth', 'Asthma']
+# Birleştirme özetlerinin log seviyesi; kural bazlı ayrıntılar için logging.DEBUG
+MERGE_LOG_LEVEL = logging.INFO
+# API'ye gönderilen global modelin sıkıştırılması ("zlib", "lzma", "zstd" veya "none") ve seviyesi
+COMPRESSION = "zlib"
+COMPRESSION_LEVEL = None
+
+logging.basicConfig(level=MERGE_LOG_LEVEL, format="[SERVER] %(asctime)s %(name)s: %(message)s")
 
 def log(message):
     """Konsola bilgilendirici mesaj basar."""
@@ -13,56 +39,334 @@ def log(message):
 log(f"Sunucu {PORT} portunda dinliyor...")
 
 # Federated model nesnesi oluşturuluyor
-federated_model = Server()
+federated_model = Server(aggregation=AGGREGATION, rule_budget=RULE_BUDGET,
+                         validation_path=VALIDATION_PATH, target_col=TARGET_COL,
+                         validation_drop=VALIDATION_DROP, merge_log_level=MERGE_LOG_LEVEL,
+                         compression=COMPRESSION, compression_level=COMPRESSION_LEVEL,
+                         max_workers=MAX_WORKERS)
 federated_model.check_save_model()
 
+# API ile açık kalıcı WebSocket oturumları; birleştirilen model bunların hepsine gönderilir
+sessions = set()
+message_ids = itertools.count(1)
+# Birleştirme işleri kuyruğa alınır ve tek işçili thread havuzunda geliş sırasına göre çalıştırılır;
+# event loop birleştirme, kayıt ve HTTP gönderimi sırasında diğer mesajlara cevap vermeye devam eder
+job_queue = asyncio.Queue()
+merge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="merge")
+# İş id'si -> iş durumu (queued, running, done, failed), zamanları ve sonucu
+jobs = {}
+MAX_JOBS = 100
+# İşlenmiş (veya kuyruktaki) turların round_id -> iş id'si eşlemesi;
+# bağlantı kopunca tekrar gönderilen tur yeniden birleştirilmez
+processed_rounds = {}
+MAX_PROCESSED_ROUNDS = 100
+# Son birleştirilen modelin API'ye gönderilen mesajı (versiyon, codec, sıkıştırılmış gövde);
+# API'ler birleştirme sürerken de beklemeden bu mesajı alır
+latest_model = None
+# API'nin passthrough modunda tek tek gönderdiği modeller: round_id -> {sıra: parça}
+round_parts = {}
+
 async def handle_websocket(websocket):
     """
-    Her istemci bağlantısında tetiklenen ana fonksiyon.
-    Gelen mesajları alır, modele göre cevap döner veya modeli günceller.
+    Her API bağlantısında tetiklenen ana fonksiyon.
+    Bağlantı kalıcıdır: kapanana kadar gelen her mesaj ayrı bir görevde işlenir,
+    cevaplar isteğin id'si ile (reply_to) eşleştirilir.
+    """
+    sessions.add(websocket)
+    log(f"API bağlandı ({len(sessions)} oturum).")
+    try:
+        async for recv in websocket:
+            data = pickle.loads(recv)
+            if data.get('type') == 'model_part':
+                # Parçalar turun "models" mesajından önce saklanmış olmalı, bu yüzden görev açılmaz
+                store_model_part(data)
+                continue
+            asyncio.create_task(handle_message(websocket, data))
+
+    except websockets.exceptions.ConnectionClosed as e:
+        log("Bir istemci bağlantısı kapandı.")
+        log(str(e))
+    finally:
+        sessions.discard(websocket)
+
+async def handle_message(websocket, data):
+    """
+    Tek bir mesajı işler.
+    "hello": API bağlandığında güncel modeli ister.
+    "models": Tur sonunda API'nin gönderdiği modeller birleştirme kuyruğuna alınır, cevap olarak iş id'si döner.
+              Birleştirme bitince yeni model tüm oturumlara gönderilir.
+    "job"/"jobs": Bir birleştirme işinin (veya son işlerin) durumunu ve süresini döndürür.
+    "reply_to" alanı olan mesajlar sunucunun gönderdiği modellerin onaylarıdır.
+    "model_part" mesajları (passthrough modu) handle_websocket'te geliş sırasıyla saklanır.
+    Eski API'lerin tek mesajlık bağlantıları ('first' alanı) da desteklenir.
     """
     try:
-        # İstemciden mesaj bekle
-        recv = await websocket.recv()
-        data = pickle.loads(recv)
-
-        # İlk bağlantı mı, yoksa model birleştirme mi?
-        is_first_request = data.get("first", False)
-
-        if not is_first_request:
-            # Model birleştirme isteği
-            models = data.get('models', [])
-            log("Model birleştirme isteği alındı.")
-
-            federated_model.fed_avg(models)     # Modelleri birleştir
-            federated_model.send_model()        # Yeni modeli gönder
-            log("Model birleştirildi ve gönderildi.")
-
-        else:
-            # Sunucudaki modeli gönderme isteği
-            if federated_model.version > 0:
-                log(f"Model (versiyon {federated_model.version}) gönderiliyor.")
-                send_data = pickle.dumps({
-                    'version': federated_model.version,
-                    'model': federated_model.model
-                })
-                await websocket.send(send_data)
+        if 'reply_to' in data:
+            log(f"Mesaj {data['reply_to']} onaylandı: {data.get('status')}")
+            return
+
+        message_id = data.get('id')
+        message_type = data.get('type') or ('hello' if data.get('first', False) else 'models')
+
+        if message_type == 'models':
+            round_id = data.get('round_id')
+            if round_id in processed_rounds:
+                log(f"Tur {round_id} daha önce alındı, tekrar birleştirilmiyor.")
+                job = jobs.get(processed_rounds[round_id])
             else:
+                job = enqueue_merge(data, legacy=message_id is None)
+                if round_id is not None:
+                    processed_rounds[round_id] = job['id']
+                    if len(processed_rounds) > MAX_PROCESSED_ROUNDS:
+                        processed_rounds.pop(next(iter(processed_rounds)))
+            if message_id is not None:
+                await websocket.send(pickle.dumps({'reply_to': message_id, 'status': 'queued', **job_state(job)}))
+
+        elif message_type == 'job':
+            await websocket.send(pickle.dumps({'reply_to': message_id, **job_state(jobs.get(data.get('job_id')))}))
+
+        elif message_type == 'jobs':
+            await websocket.send(pickle.dumps({'reply_to': message_id, 'jobs': [job_state(job) for job in jobs.values()],
+                                               'queued': job_queue.qsize()}))
+
+        elif message_type == 'hello':
+            # Sunucudaki modeli gönderme isteği; birleştirme sürse de son yayımlanan model beklemeden gönderilir
+            if latest_model is None:
                 log("Henüz bir model yok, versiyon 0 gönderiliyor.")
-                send_data = pickle.dumps({'version': 0})
-                await websocket.send(send_data)
+                reply = {'version': 0}
+            elif message_id is None:
+                # Eski API'ler modeli nesne olarak bekler
+                reply = {'version': latest_model['version'], 'model': await asyncio.to_thread(decode_latest_model)}
+            else:
+                log(f"Model (versiyon {latest_model['version']}) gönderiliyor.")
+                reply = dict(latest_model)
+            if message_id is not None:
+                reply['reply_to'] = message_id
+            await websocket.send(pickle.dumps(reply))
 
     except websockets.exceptions.ConnectionClosed as e:
-        log("Bir istemci bağlantısı kapandı.")
+        log("Cevap gönderilemedi, bağlantı kapandı.")
         log(str(e))
     except Exception as e:
         log(f"Hata oluştu: {e}")
+        if data.get('id') is not None:
+            try:
+                await websocket.send(pickle.dumps({'reply_to': data['id'], 'status': 'error', 'error': str(e)}))
+            except websockets.exceptions.ConnectionClosed:
+                pass
+
+def store_model_part(data):
+    """
+    API'nin çözmeden ilettiği tek bir istemci modelini tur id'si altında saklar.
+    """
+    round_parts.setdefault(data['round_id'], {})[data['index']] = data
+    if len(round_parts) > MAX_PROCESSED_ROUNDS:
+        round_parts.pop(next(iter(round_parts)))
+
+def decode_model_parts(parts):
+    """
+    Parçaların gövdelerini açıp modele çevirir; event loop dışında çalıştırılır.
+    API'nin geç kabul ettiği modellerin (info'da weight) kural sayımları burada küçültülür,
+    veri boyutunu API zaten küçültmüştür.
+    """
+    models = []
+    for part in parts:
+        raw, _ = decompress_payload(part['payload'], part['compression'])
+        model = CBA.from_bytes(raw)
+        if part['info'].get('weight') is not None:
+            scale_rule_counts(model.clf.rules, part['info']['weight'])
+        models.append({**part['info'], 'model': model})
+    return models
+
+def enqueue_merge(data, legacy=False):
+    """
+    Birleştirme işini oluşturup kuyruğa ekler. passthrough parçaları burada (mesaj sırası korunarak) toplanır.
+    legacy: Eski API'ler birleştirilen modeli HTTP ile bekler, iş sonunda send_model çağrılır.
+    """
+    if data.get('format') == 'parts':
+        # passthrough: modeller önceki "model_part" mesajlarında, istemcilerin gönderdiği haliyle geldi
+        parts = round_parts.pop(data['round_id'], {})
+        if len(parts) != data['parts']:
+            raise Exception(f"Turun {data['parts']} modelinden {len(parts)} tanesi geldi")
+        data = {**data, 'parts': [parts[index] for index in range(data['parts'])]}
+
+    job = {
+        'id': uuid.uuid4().hex,
+        'round_id': data.get('round_id'),
+        'state': 'queued',
+        'queued': time.time(),
+        'started': None,
+        'finished': None,
+        'duration': None,
+        'version': None,
+        'error': None,
+        'data': data,
+        'legacy': legacy
+    }
+    jobs[job['id']] = job
+    if len(jobs) > MAX_JOBS:
+        # Bitmiş en eski iş bilgisi silinir
+        for job_id, old in jobs.items():
+            if old['state'] in ('done', 'failed'):
+                del jobs[job_id]
+                break
+    job_queue.put_nowait(job)
+    log(f"Birleştirme işi {job['id']} kuyruğa alındı ({job_queue.qsize()} bekleyen).")
+    return job
+
+def job_state(job):
+    """Bir işin sorgulanabilir durumu (mesaj verisi hariç)."""
+    if job is None:
+        return {'state': 'unknown'}
+    return {key: value for key, value in job.items() if key not in ('data', 'legacy')}
+
+async def merge_worker():
+    """
+    Kuyruktaki birleştirme işlerini sırayla merge_executor'da çalıştırır.
+    İş bitince yeni modelin mesajı latest_model olarak saklanır ve tüm oturumlara gönderilir.
+    """
+    global latest_model
+    loop = asyncio.get_running_loop()
+
+    while True:
+        job = await job_queue.get()
+        job['state'] = 'running'
+        job['started'] = time.time()
+        start = time.perf_counter()
+        try:
+            message = await loop.run_in_executor(merge_executor, run_merge_job, job)
+            job['state'] = 'done'
+            job['version'] = message['version'] if message is not None else 0
+        except Exception as e:
+            message = None
+            job['state'] = 'failed'
+            job['error'] = str(e)
+            log(f"Birleştirme işi {job['id']} başarısız: {e}")
+        finally:
+            job['duration'] = time.perf_counter() - start
+            job['finished'] = time.time()
+            job['data'] = None
+            job_queue.task_done()
+
+        if job['state'] == 'done':
+            log(f"Birleştirme işi {job['id']} {job['duration']:.2f} sn sürdü "
+                f"({job['started'] - job['queued']:.2f} sn kuyrukta bekledi).")
+        if message is not None and (latest_model is None or message['version'] > latest_model['version']):
+            latest_model = message
+            await push_model()
+
+def run_merge_job(job):
+    """
+    Birleştirme işini çalıştırır (merge_executor thread'inde): modelleri çözer, birleştirir, kaydeder
+    ve yeni modelin API mesajını hazırlar. Eski API'lere model burada HTTP ile gönderilir.
+    """
+    version = federated_model.version
+    if merge_models(job['data']) == version:
+        raise Exception("Modeller birleştirilemedi, versiyon değişmedi")
+    if job['legacy']:
+        federated_model.send_model()
+    return model_message()
+
+def merge_models(data):
+    """
+    API'nin gönderdiği modelleri global modelle birleştirir, yeni versiyonu döndürür.
+    Birleştirme işçisinde, event loop dışında çalışır.
+    """
+    if data.get('format') == 'parts':
+        models = decode_model_parts(data['parts'])
+        log(f"{len(models)} model parçası alındı ({sum(len(part['payload']) for part in data['parts'])} bayt).")
+        if data.get('staleness_decay') is not None:
+            weight_stale_models(models, data['staleness_decay'])
+        federated_model.fed_avg(models)
+        return federated_model.version
+
+    if 'payload' in data:
+        # Sıkıştırılmış mesaj, codec mesajın başlığında
+        raw, stats = decompress_payload(data['payload'], data['compression'])
+        log(f"Gelen mesaj: {stats['compressed_size']} -> {stats['raw_size']} bayt "
+            f"({stats['codec']}, {stats['time']:.4f} sn)")
+        data = pickle.loads(raw)
+
+    # Model birleştirme isteği
+    models = data.get('models', [])
+    log("Model birleştirme isteği alındı.")
+
+    if data.get('format') == 'binary' and data.get('aggregate') is None:
+        # API modelleri sütunlu ikili formatta gönderir (stream modunda models sadece istemci bilgisidir)
+        models = [{**m, 'model': CBA.from_bytes(m['model'])} for m in models]
+
+    if data.get('staleness_decay') is not None:
+        # API asenkron modda, modeller turlar beklenmeden tek tek geliyor
+        weight_stale_models(models, data['staleness_decay'])
+
+    # Stream modunda API modelleri önceden birleştirip sadece kısmi istatistiği gönderir
+    federated_model.fed_avg(models, data.get('aggregate'), data.get('template'))     # Modelleri birleştir
+    return federated_model.version
+
+def weight_stale_models(models, decay):
+    """
+    Asenkron modda her modelin veri boyutunu ve kurallarının sayımlarını (support_count,
+    antecedent_count), eğitildiği global versiyonun birleştirme anındaki versiyondan kaç eski olduğuna
+    göre decay ** fark ile küçültür; eski modeller global modeli daha az etkiler, kuralların
+    support'u (sayım / boyut) değişmez. Kuyrukta bekleyen işler de birleştirildikleri andaki versiyona göre tartılır.
+    """
+    for m in models:
+        staleness = max(0, federated_model.version - m['version'])
+        m['staleness'] = staleness
+        if staleness:
+            weight = decay ** staleness
+            weighted = max(1, round(m['size'] * weight))
+            log(f"İstemci {m.get('id')} modeli {staleness} versiyon eski, ağırlığı {weighted}/{m['size']}.")
+            m['size'] = weighted
+            scale_rule_counts(m['model'].clf.rules, weight)
+    return models
+
+def model_message():
+    """
+    Global modeli sütunlu ikili formatta, sıkıştırılmış olarak içeren mesajı hazırlar.
+    Model yoksa None döner. Birleştirme işçisinde (veya sunucu açılmadan önce) çağrılır.
+    """
+    if federated_model.model is None:
+        return None
+    payload, stats = federated_model.encode_model()
+    log(f"Gönderilen model: {stats['raw_size']} -> {stats['compressed_size']} bayt "
+        f"({stats['codec']}, {stats['time']:.4f} sn)")
+    return {
+        'version': federated_model.version,
+        'compression': federated_model.compression,
+        'payload': payload
+    }
+
+def decode_latest_model():
+    """Eski API'ler için son yayımlanan modeli mesajından nesneye çevirir."""
+    raw, _ = decompress_payload(latest_model['payload'], latest_model['compression'])
+    return CBA.from_bytes(raw)
+
+async def push_model():
+    """
+    Son birleştirilen modeli açık olan tüm API oturumlarına gönderir (eski HTTP POST yerine).
+    """
+    if latest_model is None or not sessions:
+        return
+
+    message = latest_model
+    for websocket in list(sessions):
+        try:
+            await websocket.send(pickle.dumps({**message, 'id': next(message_ids), 'type': 'model'}))
+        except websockets.exceptions.ConnectionClosed:
+            sessions.discard(websocket)
+    log(f"Model (versiyon {message['version']}) {len(sessions)} oturuma gönderildi.")
 
 async def main():
     """
-    WebSocket sunucusunu başlatır.
+    WebSocket sunucusunu ve birleştirme işçisini başlatır.
     """
-    async with websockets.serve(handle_websocket, "localhost", PORT):
+    global latest_model
+    # Yüklenen modelin mesajı bir kere hazırlanır, hello istekleri bunu kullanır
+    latest_model = await asyncio.to_thread(model_message)
+    asyncio.create_task(merge_worker())
+
+    async with websockets.serve(handle_websocket, "localhost", PORT, max_size=None):
         log("WebSocket sunucusu başlatıldı.")
         await asyncio.Future()  # Sunucu sürekli çalışsın
 